@@ -0,0 +1,91 @@
+'''
+Benchmark de memoria y de agrupaciones/filtros del DataFrame de estudiantes.
+
+Genera una cohorte sintética con benchmarks.synthetic, la convierte con
+models.student.cohort_to_frame (columnas llave categóricas, int16 y
+float32) y la compara contra la misma tabla con los tipos anteriores
+(object, int64 y float64). Para cada versión mide:
+
+    memory         - memory_usage(deep=True) del DataFrame
+    weighted_avg   - CompPerformancePredictor.get_cohort_weighted_avg
+    groupby        - tamaño de los grupos (student_id, competency)
+    filter_key     - filas de una competencia (df['competency'] == ...)
+    filter_period  - filas del último periodo (df['period'] == ...)
+    sort           - sort_values por student_id, period y competency
+
+Uso:
+    python -m benchmarks.bench_frame --students 10000 --repeat 3
+'''
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_cohort
+from models.student import CATEGORICAL_COLUMNS, Student, cohort_to_frame
+from src.forecasting.comp_predictor import CompPerformancePredictor
+
+
+def legacy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Retorna df con los tipos que generaba Student.to_frame antes de usar
+    columnas categóricas.
+    '''
+    dtypes = {column: object if column in CATEGORICAL_COLUMNS else np.int64 if df[column].dtype.kind == 'i' else np.float64 for column in df.columns}
+    return df.astype(dtypes)
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(df: pd.DataFrame, repeat: int) -> dict:
+    competency = df['competency'].iloc[0]
+    period = df['period'].max()
+    stages = {
+        'weighted_avg': lambda: CompPerformancePredictor.get_cohort_weighted_avg(df),
+        'groupby': lambda: df.groupby(['student_id','competency'], sort=False, observed=True).size(),
+        'filter_key': lambda: df[df['competency'] == competency],
+        'filter_period': lambda: df[df['period'] == period],
+        'sort': lambda: df.sort_values(['student_id','period','competency']),
+    }
+    return {'memory_mb': round(df.memory_usage(deep=True).sum() / 2**20, 1)} | {stage: round(best_of(repeat, fn), 4) for stage, fn in stages.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='student frame dtypes benchmark')
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--periods', type=int, default=15)
+    parser.add_argument('--competencies', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    students = [Student(json=record) for record in generate_cohort(args.students, args.periods, args.competencies, args.seed)]
+
+    start = time.perf_counter()
+    frame = cohort_to_frame(students)
+    build = time.perf_counter() - start
+
+    before = measure(legacy_dtypes(frame), args.repeat)
+    after = measure(frame, args.repeat)
+
+    print(json.dumps({
+        'students': args.students,
+        'rows': len(frame),
+        'cohort_to_frame_s': round(build, 3),
+        'before': before,
+        'after': after,
+        'ratio': {stage: round(before[stage] / after[stage], 2) if after[stage] else None for stage in before},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
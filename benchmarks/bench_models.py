@@ -0,0 +1,164 @@
+'''
+Benchmark de los modelos de dominio.
+
+Compara los modelos con __slots__ y el decodificador de una sola pasada
+(models.decoder.StudentDecoder) contra los modelos originales basados en
+diccionarios, que primero cargan el json completo y luego construyen los
+objetos con un try/except por campo. Mide los estudiantes decodificados por
+segundo y la memoria retenida por estudiante.
+
+Uso:
+    python -m benchmarks.bench_models --students 2000 --repeat 3
+'''
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from models.decoder import StudentDecoder
+from models.student import Student
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs', 'test_data.json')
+
+
+class LegacyCompetence:
+    def __init__(self, json: dict):
+        try:
+            perf = json['performance']
+            pred_perf = json['predicted_performance']
+        except:
+            perf = 100
+            pred_perf = 90
+        try:
+            self.id = json['comp_id']
+            self.weight = json['weight']
+            self.performance = perf
+            self.predicted_performance = pred_perf
+        except Exception as error:
+            raise ValueError(f'could not load the competency data from the json: {error}')
+
+
+class LegacySubject:
+    def __init__(self, json: dict):
+        try:
+            pred_grade = json['predicted_grade']
+        except:
+            pred_grade = 0
+        try:
+            self.id = json['course_id']
+            self.credits = json['credits']
+            self.grade = self.get_numerical_grade(json['grade'])
+            self.predicted_grade = pred_grade
+            self.competencies = []
+            for competency in json['competences']:
+                self.competencies.append(LegacyCompetence(json=competency))
+        except Exception as error:
+            raise ValueError(f'could not load the subject data from the json: {error}')
+
+    def get_numerical_grade(self, grade: str):
+        if grade is None:
+            return 0
+        grade_map = {'A': 4.0, 'B+':3.5,'B': 3.0,'C+': 2.5, 'C': 2.0, 'D+': 1.5, 'D': 1.0, 'F': 0.0, 'R': -1.0}
+        try:
+            return grade_map[grade]
+        except Exception as error:
+            raise ValueError(f'could not get the numerical grade for the subject: {error}')
+
+
+class LegacyPeriod:
+    def __init__(self, json: dict):
+        try:
+            self.period = json['period']
+            self.courses = []
+            for course in json['courses']:
+                self.courses.append(LegacySubject(json=course))
+            self.cant_courses = json['cant_courses']
+            self.total_credits = json['total_credits']
+        except Exception as error:
+            raise ValueError(f'could not load the period data from the json: {error}')
+
+
+class LegacyStudent:
+    def __init__(self, json: dict):
+        try:
+            self.student_id = json['student_id']
+            self.institution_id = json['institution_id']
+            self.periods = []
+            for period in json['periods']:
+                self.periods.append(LegacyPeriod(json=period))
+        except Exception as error:
+            raise ValueError(f'could not load the student data from the json: {error}')
+
+
+def build_export(count: int) -> list[str]:
+    with open(TEST_DATA, 'r') as f:
+        data = json.loads(f.read())
+
+    lines = []
+    for i in range(count):
+        data['student_id'] = i
+        lines.append(json.dumps(data))
+    return lines
+
+
+def legacy_decode(lines: list[str]) -> list:
+    return [LegacyStudent(json=json.loads(line)) for line in lines]
+
+
+def slots_decode(lines: list[str]) -> list:
+    decoder = StudentDecoder()
+    return [decoder.decode(line) for line in lines]
+
+
+def best_of(repeat: int, fn, lines: list[str]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(lines)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def retained_bytes(fn, lines: list[str]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    students = fn(lines)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del students
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='domain models benchmark')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory-students', type=int, default=200)
+    args = parser.parse_args()
+
+    lines = build_export(args.students)
+    assert isinstance(slots_decode(lines[:1])[0], Student)
+
+    legacy = best_of(args.repeat, legacy_decode, lines)
+    slots = best_of(args.repeat, slots_decode, lines)
+
+    sample = lines[:args.memory_students]
+    legacy_bytes = retained_bytes(legacy_decode, sample) / len(sample)
+    slots_bytes = retained_bytes(slots_decode, sample) / len(sample)
+
+    print(json.dumps({
+        'students': len(lines),
+        'legacy_students_per_s': round(len(lines) / legacy),
+        'slots_students_per_s': round(len(lines) / slots),
+        'decode_speedup': round(legacy / slots, 2),
+        'legacy_bytes_per_student': round(legacy_bytes),
+        'slots_bytes_per_student': round(slots_bytes),
+        'memory_reduction': round(1 - slots_bytes / legacy_bytes, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+'''
+Benchmark por etapas del flujo de proyección sobre cohortes sintéticas.
+
+Para cada combinación de estudiantes, periodos y competencias genera una
+cohorte con benchmarks.synthetic y mide por separado:
+
+    decode         - json -> Student (models.decoder)
+    to_frame       - Student.to_frame
+    weighted_avg   - CompPerformancePredictor.get_weighted_avg
+    cascade        - CompPerformancePredictor.forecast_competency_performance
+    course         - CoursePerformancePredictor.forecast_courses_performance
+    write          - DB_API.update_students_data contra un servidor local
+
+El resultado es un documento json (una entrada por combinación) para
+comparar ejecuciones; con --history se agrega además como una línea a un
+archivo ndjson.
+
+Uso:
+    python -m benchmarks.bench_pipeline --students 20 50 --periods 8 15 --competencies 6 --output bench.json
+'''
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import CohortShape, generate_cohort
+from data.db import DB_API
+from models.decoder import StudentDecoder
+from src.forecasting.comp_predictor import CompPerformancePredictor
+from src.forecasting.course_predictor import CoursePerformancePredictor
+from src.time_series import fit_cache
+
+STAGES = ['decode', 'to_frame', 'weighted_avg', 'cascade', 'course', 'write']
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_config(students : int, periods : int, competencies : int, seed : int, shape : CohortShape, url : str | None) -> dict:
+    lines = [json.dumps(record) for record in generate_cohort(students, periods, competencies, seed, shape)]
+    timings = dict.fromkeys(STAGES, 0.0)
+    rows = 0
+    predictions = []
+
+    # cada combinación empieza sin ajustes previos
+    fit_cache.clear()
+    decoder = StudentDecoder()
+
+    for line in lines:
+        start = time.perf_counter()
+        student = decoder.decode(line)
+        timings['decode'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        frame = student.to_frame()
+        timings['to_frame'] += time.perf_counter() - start
+        rows += len(frame)
+
+        start = time.perf_counter()
+        cpp = CompPerformancePredictor(frame)
+        timings['weighted_avg'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        comp = cpp.forecast_competency_performance()
+        timings['cascade'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        period = student.periods[-1].period.replace('-', '')
+        forecast = CoursePerformancePredictor(frame, comp).forecast_courses_performance(period)
+        timings['course'] += time.perf_counter() - start
+
+        predictions.append((student.student_id, student.institution_id, forecast))
+
+    db = DB_API(url=url) if url else DB_API(test=True)
+    start = time.perf_counter()
+    report = db.update_students_data(predictions)
+    timings['write'] = time.perf_counter() - start
+    db.close()
+
+    total = sum(timings.values())
+    return {
+        'students': students,
+        'periods': periods,
+        'competencies': competencies,
+        'rows': rows,
+        'total_s': round(total, 4),
+        'students_per_s': round(students / total, 2) if total > 0 else None,
+        'write_requests': report.requests,
+        'stages': {stage: {
+            's': round(seconds, 4),
+            'ms_per_student': round(1000 * seconds / students, 3),
+            'share': round(seconds / total, 3) if total > 0 else 0.0,
+        } for stage, seconds in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='forecasting pipeline benchmark')
+    parser.add_argument('--students', type=int, nargs='+', default=[20])
+    parser.add_argument('--periods', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--competencies', type=int, nargs='+', default=[6])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default=None, help='api used for the write stage, by default a local stub server')
+    parser.add_argument('--output', default=None, help='write the results to this json file')
+    parser.add_argument('--history', default=None, help='append the results as one line to this ndjson file')
+    args = parser.parse_args()
+
+    shape = CohortShape.from_export()
+    results = []
+
+    def run(url):
+        for students, periods, competencies in itertools.product(args.students, args.periods, args.competencies):
+            results.append(run_config(students, periods, competencies, args.seed, shape, url))
+
+    # los avisos de statsmodels y los mensajes de los predictores van a stderr para que stdout sea solo el json
+    with warnings.catch_warnings(), contextlib.redirect_stdout(sys.stderr):
+        warnings.simplefilter('ignore')
+        if args.url:
+            run(args.url)
+        else:
+            from tests.stub_server import StubServer
+            with StubServer() as server:
+                run(server.url)
+
+    document = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    text = json.dumps(document, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(document) + '\n')
+
+
+if __name__ == '__main__':
+    main()
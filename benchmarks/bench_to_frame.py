@@ -0,0 +1,86 @@
+'''
+Benchmark de Student.to_frame.
+
+Compara el constructor columnar actual contra el constructor original de un
+diccionario por fila, usando docs/test_data.json replicado N veces.
+
+Uso:
+    python -m benchmarks.bench_to_frame --students 5000 --repeat 3
+'''
+import argparse
+import json
+import os
+import time
+
+from pandas import DataFrame, concat
+
+from models.student import Student
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs', 'test_data.json')
+
+
+def legacy_to_frame(student: Student) -> DataFrame:
+    frames = []
+    for period in student.periods:
+        for course in period.courses:
+            for competency in course.competencies:
+                frame = {}
+                frame['period'] = period.period.replace('-','')
+                frame['course_id'] = course.id
+                frame['credits'] = course.credits
+                frame['numerical_grade'] = course.grade
+                frame['predicted_grade'] = course.predicted_grade
+                frame['competency'] = competency.id
+                frame['weight'] = competency.weight
+                frame['performance'] = (course.grade / 4.0) * 100
+                frame['comp_performance'] = competency.predicted_performance
+                frames.append(frame)
+    return DataFrame(frames)
+
+
+def load_students(count: int) -> list[Student]:
+    with open(TEST_DATA, 'r') as f:
+        data = json.loads(f.read())
+
+    students = []
+    for i in range(count):
+        data['student_id'] = i
+        students.append(Student(json=data))
+    return students
+
+
+def best_of(repeat: int, fn, students: list[Student]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for student in students:
+            fn(student)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Student.to_frame benchmark')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    students = load_students(args.students)
+
+    legacy = best_of(args.repeat, legacy_to_frame, students)
+    columnar = best_of(args.repeat, Student.to_frame, students)
+    rows = len(students[0].to_frame()) * len(students)
+
+    print(json.dumps({
+        'students': len(students),
+        'rows': rows,
+        'legacy_s': round(legacy, 4),
+        'columnar_s': round(columnar, 4),
+        'legacy_rows_per_s': round(rows / legacy),
+        'columnar_rows_per_s': round(rows / columnar),
+        'speedup': round(legacy / columnar, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
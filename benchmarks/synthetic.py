@@ -0,0 +1,150 @@
+'''
+Generador de cohortes sintéticas con la forma de docs/test_data.json.
+
+La distribución de asignaturas por periodo, créditos, competencias por
+asignatura y el formato de los periodos se toman del export de prueba. Cada
+estudiante tiene un nivel propio por competencia con una tendencia y ruido
+por periodo, por lo que las series no son constantes y recorren la cascada
+de modelos, y la calificación de cada asignatura se deriva del desempeño
+pesado de sus competencias.
+
+Uso:
+    python -m benchmarks.synthetic --students 1000 --periods 12 --competencies 6 > cohort.ndjson
+'''
+import argparse
+import json
+import os
+
+import numpy as np
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs', 'test_data.json')
+
+# límites inferiores de desempeño (0-100) de cada calificación
+GRADE_CUTS = [(90, 'A'), (85, 'B+'), (80, 'B'), (75, 'C+'), (70, 'C'), (65, 'D+'), (60, 'D'), (0, 'F')]
+
+
+class CohortShape:
+    '''
+    Distribuciones observadas en un export de estudiantes.
+
+    Parámetros:
+
+    courses_per_period - Cantidad de asignaturas de cada periodo.
+
+    credits - Créditos de cada asignatura.
+
+    competencies_per_course - Cantidad de competencias de cada asignatura.
+
+    first_period - Primer periodo con el formato "AAAA-PP".
+
+    terms_per_year - Cantidad de periodos por año.
+    '''
+    def __init__(self, courses_per_period : list[int], credits : list[int], competencies_per_course : list[int], first_period : str = '2021-01', terms_per_year : int = 4):
+        self.courses_per_period = courses_per_period
+        self.credits = credits
+        self.competencies_per_course = competencies_per_course
+        self.first_period = first_period
+        self.terms_per_year = terms_per_year
+
+    @classmethod
+    def from_export(cls, path : str = TEST_DATA) -> 'CohortShape':
+        with open(path, 'r') as f:
+            data = json.loads(f.read())
+
+        records = data if isinstance(data, list) else [data]
+        periods = [period for record in records for period in record['periods']]
+        courses = [course for period in periods for course in period['courses']]
+
+        return cls(
+            courses_per_period=[len(period['courses']) for period in periods],
+            credits=[course['credits'] for course in courses],
+            competencies_per_course=[len(course['competences']) for course in courses],
+            first_period=periods[0]['period'],
+            terms_per_year=max(int(period['period'].split('-')[1]) for period in periods),
+        )
+
+    def period_labels(self, count : int) -> list[str]:
+        year, term = (int(part) for part in self.first_period.split('-'))
+        labels = []
+        for _ in range(count):
+            labels.append(f'{year}-{term:02d}')
+            term += 1
+            if term > self.terms_per_year:
+                year, term = year + 1, 1
+        return labels
+
+    def __str__(self):
+        return f"Cohort Shape: {np.mean(self.courses_per_period):.1f} courses per period, {np.mean(self.competencies_per_course):.1f} competencies per course"
+
+    def __repr__(self):
+        return f'CohortShape(first_period="{self.first_period}", terms_per_year="{self.terms_per_year}")'
+
+
+def letter_grade(performance : float) -> str:
+    for cut, grade in GRADE_CUTS:
+        if performance >= cut:
+            return grade
+    return 'F'
+
+
+def generate_student(rng : np.random.Generator, shape : CohortShape, student_id, periods : int = 15, competencies : int = 6, institution_id : str = 'INTEC') -> dict:
+    '''
+    Genera el registro json de un estudiante.
+
+    Parámetros:
+    rng - Generador de números aleatorios.
+
+    shape - Distribuciones del export de referencia.
+
+    periods - Cantidad de periodos cursados. El último periodo queda en
+    curso (sin calificación), igual que en el export.
+
+    competencies - Cantidad de competencias distintas (C1 a Cn).
+    '''
+    ids = [f'C{i + 1}' for i in range(competencies)]
+    level = rng.uniform(60, 95, competencies)
+    trend = rng.normal(0, 1.0, competencies)
+
+    records = []
+    for t, label in enumerate(shape.period_labels(periods)):
+        current = t == periods - 1
+        courses = []
+        for c in range(int(rng.choice(shape.courses_per_period))):
+            count = min(int(rng.choice(shape.competencies_per_course)), competencies)
+            chosen = rng.choice(competencies, size=count, replace=False)
+            weights = np.maximum(np.round(rng.dirichlet(np.ones(count)) * 100), 1).astype(int)
+            performance = np.clip(level[chosen] + trend[chosen] * t + rng.normal(0, 4, count), 0, 100).round(2)
+
+            courses.append({
+                'course_id': f'SYN{t:02d}{c:02d}',
+                'credits': int(rng.choice(shape.credits)),
+                'grade': None if current else letter_grade(float(np.average(performance, weights=weights))),
+                'competences': [{'comp_id': ids[i], 'weight': int(w), 'performance': float(p), 'predicted_performance': float(p)}
+                                for i, w, p in zip(chosen, weights, performance)],
+            })
+
+        records.append({'period': label, 'courses': courses, 'cant_courses': len(courses), 'total_credits': sum(course['credits'] for course in courses)})
+
+    return {'student_id': student_id, 'institution_id': institution_id, 'periods': records}
+
+
+def generate_cohort(students : int, periods : int = 15, competencies : int = 6, seed : int = 0, shape : CohortShape | None = None) -> list[dict]:
+    shape = shape or CohortShape.from_export()
+    rng = np.random.default_rng(seed)
+    return [generate_student(rng, shape, f'S{i:06d}', periods, competencies) for i in range(students)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='synthetic cohort generator')
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--periods', type=int, default=15)
+    parser.add_argument('--competencies', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for record in generate_cohort(args.students, args.periods, args.competencies, args.seed):
+        print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
 from .db import *
+from .stream import *
+from .writer import *
 
-__all__ = ['db']
\ No newline at end of file
+__all__ = ['db','stream','writer']
\ No newline at end of file
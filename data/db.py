@@ -1,15 +1,44 @@
+import hashlib
 import json
 import os
+import threading
+import time
+from itertools import islice
+from typing import Iterator
 from dotenv import dotenv_values
 from pandas import DataFrame
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from models.student import Student
+from models.student import Student, cohort_to_frame
+from models.decoder import StudentDecoder
+from models.write_report import WriteReport
+from src.profiling import metrics
+from .stream import iter_json_records
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+PREDICTION_COLUMNS = ['period', 'course_id', 'competency', 'predicted_grade', 'comp_performance']
+UPSERT_KEY = ['institution_id', 'student_id', 'period', 'course_id', 'competency']
 
 
 class DB_API:
-    def __init__(self, test : bool = False):
+    def __init__(self, test : bool = False, batch_size : int = 100, data_path : str | None = None,
+                 url : str | None = None, username : str | None = None, key : str | None = None,
+                 pool_size : int = 10, retries : int = 3, backoff_factor : float = 0.5, timeout : float | tuple[float, float] = (3.05, 30)):
         self.test = test
+        self.batch_size = batch_size
+        self.data_path = data_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs', 'test_data.json')
+        self.url = url
+        self.username = username
+        self.key = key
+        self.timeout = timeout
+        self.token : str | None = None
+        self.token_expires_at : float | None = None
+        # (institución, versión del archivo, siguiente offset, iterador) de la última página leída
+        self.cursor : tuple[str, float, int, Iterator[Student]] | None = None
+        self.cursor_lock = threading.Lock()
+        self.session = self.__create_session__(pool_size, retries, backoff_factor)
         if not self.test:
             self.__load_env__()
             res = self.__login__()
@@ -21,36 +50,130 @@ class DB_API:
             config = dotenv_values(dotenv_path)
             self.host = config.get('HOST')
             self.port = config.get('DB_PORT')
-            self.username =  config.get('DB_USER')
-            self.key = config.get('DB_KEY')
-            self.url = f'http://{self.host}:{self.port}/'
+            self.username = self.username or config.get('DB_USER')
+            self.key = self.key or config.get('DB_KEY')
+            self.url = self.url or f'http://{self.host}:{self.port}/'
+
+        if self.url is None:
+            raise ValueError('could not load the database url, set it in the .env file or pass it to DB_API')
+        if not self.url.endswith('/'):
+            self.url += '/'
+
+    def __create_session__(self, pool_size : int, retries : int, backoff_factor : float) -> requests.Session:
+        # reintentos con espera exponencial ante errores de conexión y códigos de estado transitorios,
+        # todos los endpoints de la api son idempotentes por lo que se reintentan todos los métodos
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS,
+                      allowed_methods=None, raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+        return session
 
     def __login__(self):
+        metrics.inc('db_logins')
         try:
-            response = requests.post(f'{self.url}login', json={'username': self.username, 'key': self.key}, headers={'Content-Type': 'application/json'})
+            response = self.session.post(f'{self.url}login', json={'username': self.username, 'key': self.key}, timeout=self.timeout)
         except Exception as error:
             raise ValueError(f'could not login to the database: {error}')
 
         if response.status_code != 200:
             raise ValueError(f'could not login to the database, status code: {response.status_code}')
 
-        return response.json()
-    
-    def get_student_data(self, student_id: str, institution_id: str = "INTEC"):
-        data = Student("test", "INTEC")
+        data = response.json()
+        token = (data.get('token') or data.get('access_token')) if isinstance(data, dict) else None
+        if token:
+            self.token = token
+            self.session.headers['Authorization'] = f'Bearer {token}'
+            expires_in = data.get('expires_in')
+            # el token se renueva un poco antes de que expire
+            self.token_expires_at = time.monotonic() + max(float(expires_in) - 30, 0) if expires_in else None
 
         return data
 
-    def get_students(self, institution_id: str = "INTEC", pagination : int = 0) -> list[Student]: 
-        students : list[Student] = []
+    def request(self, method : str, path : str, **kwargs) -> requests.Response:
+        if self.token_expires_at is not None and time.monotonic() >= self.token_expires_at:
+            self.__login__()
+
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            with metrics.timer('db_request', method=method):
+                response = self.session.request(method, f'{self.url}{path.lstrip("/")}', **kwargs)
+                if response.status_code == 401 and self.token is not None:
+                    self.__login__()
+                    response = self.session.request(method, f'{self.url}{path.lstrip("/")}', **kwargs)
+        except requests.RequestException as error:
+            metrics.inc('db_errors', method=method)
+            raise ValueError(f'could not {method} {path}: {error}')
+
+        metrics.inc('db_responses', method=method, status=response.status_code)
+        return response
+
+    def close(self):
+        self.__close_cursor()
+        self.session.close()
 
-        dir = os.path.dirname(__file__).replace('data','docs')
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+    
+    def get_student_data(self, student_id: str, institution_id: str = "INTEC") -> Student | None:
         if self.test:
-            with open(f'{dir}/test_data.json', 'r') as f:
-                data = f.read()
-                students.append(Student(json=json.loads(data)))
-        
-        return students
+            return next((student for student in self.iter_students(institution_id) if str(student.student_id) == str(student_id)), None)
+
+        response = self.request('GET', f'students/{institution_id}/{student_id}')
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ValueError(f'could not get the student data, status code: {response.status_code}')
+
+        return Student(json=response.json())
+
+    def get_students(self, institution_id: str = "INTEC", pagination : int = 0) -> list[Student]: 
+        offset = pagination * self.batch_size
+        if not self.test:
+            return []
+
+        # las páginas consecutivas continúan el iterador de la anterior en vez de volver a leer el archivo
+        version = os.path.getmtime(self.data_path)
+        with self.cursor_lock:
+            if self.cursor is not None and self.cursor[:3] == (institution_id, version, offset):
+                students = self.cursor[3]
+            else:
+                self.__close_cursor()
+                students = self.iter_students(institution_id, offset)
+
+            page = list(islice(students, self.batch_size))
+            self.cursor = (institution_id, version, offset + len(page), students) if len(page) == self.batch_size else None
+            if self.cursor is None:
+                students.close()
+        return page
+
+    def __close_cursor(self):
+        if self.cursor is not None:
+            self.cursor[3].close()
+            self.cursor = None
+
+    def iter_students(self, institution_id: str = "INTEC", offset : int = 0, limit : int | None = None) -> Iterator[Student]:
+        if not self.test:
+            return
+
+        with open(self.data_path, 'r') as f:
+            for record in islice(iter_json_records(f, decoder=StudentDecoder(), skip=offset), limit):
+                yield record if isinstance(record, Student) else Student(json=record)
+
+    def iter_student_frames(self, institution_id: str = "INTEC", chunksize : int | None = None) -> Iterator[DataFrame]:
+        chunksize = chunksize or self.batch_size
+        students = self.iter_students(institution_id)
+        while True:
+            chunk = list(islice(students, chunksize))
+            if not chunk:
+                return
+            yield cohort_to_frame(chunk)
 
     def get_student_count(self, institution_id: str = "INTEC"): 
         return 2000
@@ -58,6 +181,74 @@ class DB_API:
     def update_student_data(self, student_id: str, institution_id: str, data: DataFrame):
         pass
 
+    def update_students_data(self, predictions: list[tuple[str, str, DataFrame]], max_rows : int = 5000) -> WriteReport:
+        '''
+        Versión masiva de update_student_data: las proyecciones de varios
+        estudiantes se envían como upserts con la llave UPSERT_KEY en
+        solicitudes de a lo sumo max_rows filas (un estudiante nunca se divide
+        entre solicitudes).
+
+        Cada solicitud lleva un Idempotency-Key derivado de su contenido para
+        que un reintento no se aplique dos veces. La api responde 200 cuando
+        se escribieron todas las filas o 207 con {"failed": [{"student_id",
+        "error"}]} ante una falla parcial; cualquier otra respuesta marca como
+        fallidos a todos los estudiantes de la solicitud.
+
+        Este método retorna un WriteReport con los estudiantes escritos y los
+        fallidos.
+        '''
+        report = WriteReport()
+        batch : list[dict] = []
+        start = time.perf_counter()
+        students : list[str] = []
+
+        for student_id, institution_id, data in predictions:
+            rows = self.__prediction_rows(student_id, institution_id, data)
+            if batch and len(batch) + len(rows) > max_rows:
+                report.merge(self.__upsert(batch, students))
+                batch, students = [], []
+            batch.extend(rows)
+            students.append(str(student_id))
+
+        if students:
+            report.merge(self.__upsert(batch, students))
+
+        metrics.observe('db_bulk_write', time.perf_counter() - start)
+        metrics.inc('db_rows_sent', report.rows)
+        metrics.inc('db_write_failures', len(report.failed))
+        return report
+
+    def __prediction_rows(self, student_id: str, institution_id: str, data: DataFrame) -> list[dict]:
+        columns = [column for column in PREDICTION_COLUMNS if column in data.columns]
+        rows = data[columns].to_dict('records')
+        for row in rows:
+            row['institution_id'] = str(institution_id)
+            row['student_id'] = str(student_id)
+        return rows
+
+    def __upsert(self, rows : list[dict], students : list[str]) -> WriteReport:
+        if self.test:
+            return WriteReport(written=students, rows=len(rows))
+
+        payload = json.dumps({'key': UPSERT_KEY, 'rows': rows}, sort_keys=True, default=str)
+        headers = {'Idempotency-Key': hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}
+
+        try:
+            response = self.request('PUT', 'predictions/bulk', data=payload, headers=headers)
+        except ValueError as error:
+            return WriteReport(failed={student: str(error) for student in students}, rows=len(rows), requests=1)
+
+        if response.status_code not in (200, 201, 204, 207):
+            error = f'could not write the predictions, status code: {response.status_code}'
+            return WriteReport(failed={student: error for student in students}, rows=len(rows), requests=1)
+
+        failed = {}
+        if response.status_code == 207:
+            for item in response.json().get('failed', []):
+                failed[str(item.get('student_id'))] = str(item.get('error', 'unknown error'))
+
+        return WriteReport(written=[student for student in students if student not in failed], failed=failed, rows=len(rows), requests=1)
+
     def get_latest_period(self, institution_id: str = "INTEC"):
         return '2024-04'
     
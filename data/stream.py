@@ -0,0 +1,66 @@
+import json
+from typing import IO, Iterator
+
+
+def iter_json_records(f: IO[str], chunk_size: int = 1 << 16, decoder: json.JSONDecoder | None = None, skip: int = 0) -> Iterator:
+    '''
+    Retorna uno a uno los registros de una exportación json sin cargar el
+    archivo completo.
+
+    Acepta un arreglo json de registros, NDJSON (un registro por línea) y un
+    único objeto json. En memoria solo se mantienen el bloque actual y el
+    registro que se está leyendo. Con un decoder que tenga object_hook (p. ej.
+    models.decoder.StudentDecoder) se retornan los modelos en vez de dicts.
+
+    Los primeros skip registros se omiten: se leen con el decoder de json
+    sin object_hook, por lo que no se construyen sus modelos.
+    '''
+    decoder = decoder or json.JSONDecoder()
+    skipper = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    array = None
+
+    while True:
+        # se omiten los espacios (y los separadores de un arreglo) hasta el siguiente valor
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (array and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = buffer[pos:] + f.read(chunk_size), 0
+            eof = pos == len(buffer)
+
+        if pos >= len(buffer):
+            if array:
+                raise ValueError('could not read the json records: unterminated array')
+            return
+
+        if array is None:
+            array = buffer[pos] == '['
+            if array:
+                pos += 1
+                continue
+
+        if array and buffer[pos] == ']':
+            return
+
+        try:
+            record, end = (skipper if skip > 0 else decoder).raw_decode(buffer, pos)
+        except json.JSONDecodeError as error:
+            if eof:
+                raise ValueError(f'could not read the json records: {error}')
+            chunk = f.read(chunk_size)
+            eof = chunk == ''
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        pos = end
+        if skip > 0:
+            skip -= 1
+        else:
+            yield record
+
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
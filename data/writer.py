@@ -0,0 +1,117 @@
+import threading
+import time
+from pandas import DataFrame
+
+from models.write_report import WriteReport
+
+
+class BulkWriter:
+    '''
+    Acumula las proyecciones de varios estudiantes y las escribe con
+    DB_API.update_students_data cuando se alcanzan max_rows filas o cuando la
+    proyección más antigua lleva max_delay segundos en espera.
+
+    Un estudiante agregado dos veces antes de una escritura se escribe una
+    sola vez con sus últimas proyecciones. Los reportes de cada escritura se
+    acumulan en self.report.
+
+    Si una escritura falla las proyecciones se mantienen en el buffer y se
+    reintentan en la siguiente escritura; al cerrar, las que no se pudieron
+    escribir quedan en self.report.failed.
+
+    Parámetros:
+
+    db - DB_API utilizado para las escrituras.
+
+    max_rows - Cantidad de filas que provoca una escritura.
+
+    max_delay - Segundos máximos de espera de una proyección. None para
+    escribir solo por cantidad de filas o al cerrar.
+    '''
+    def __init__(self, db, max_rows : int = 5000, max_delay : float | None = 2.0):
+        if max_rows < 1:
+            raise ValueError(f'max_rows must be at least 1, got {max_rows}')
+
+        self.db = db
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.report = WriteReport()
+        self.buffer : dict[tuple[str, str], DataFrame] = {}
+        self.rows = 0
+        self.oldest : float | None = None
+        self.lock = threading.RLock()
+        self.closed = threading.Event()
+        self.timer = None
+
+        if max_delay is not None:
+            self.timer = threading.Thread(target=self.__flush_on_time, daemon=True, name='bulk-writer')
+            self.timer.start()
+
+    def add(self, student_id : str, institution_id : str, predictions : DataFrame) -> WriteReport | None:
+        with self.lock:
+            if self.closed.is_set():
+                raise ValueError('could not add the predictions: the writer is closed')
+
+            key = (str(institution_id), str(student_id))
+            if key in self.buffer:
+                self.rows -= len(self.buffer[key])
+            self.buffer[key] = predictions
+            self.rows += len(predictions)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+            if self.rows >= self.max_rows:
+                return self.flush()
+        return None
+
+    def flush(self) -> WriteReport:
+        with self.lock:
+            if not self.buffer:
+                return WriteReport()
+
+            batch = [(student_id, institution_id, data) for (institution_id, student_id), data in self.buffer.items()]
+            try:
+                report = self.db.update_students_data(batch, max_rows=self.max_rows)
+            except Exception as error:
+                # las filas se mantienen en el buffer y el siguiente intento espera otro max_delay
+                self.oldest = time.monotonic()
+                raise ValueError(f'could not write the buffered predictions: {error}')
+
+            self.buffer, self.rows, self.oldest = {}, 0, None
+            self.report.merge(report)
+            return report
+
+    def __flush_on_time(self):
+        while not self.closed.wait(min(self.max_delay, 0.5)):
+            with self.lock:
+                if self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay:
+                    try:
+                        self.flush()
+                    except ValueError as error:
+                        # un error no detiene el temporizador, las filas se reintentan en la siguiente vuelta
+                        print(error)
+
+    def close(self) -> WriteReport:
+        with self.lock:
+            try:
+                self.flush()
+            except ValueError as error:
+                failed = WriteReport(failed={student_id: str(error) for _, student_id in self.buffer}, rows=self.rows)
+                self.report.merge(failed)
+                self.buffer, self.rows, self.oldest = {}, 0, None
+            self.closed.set()
+        if self.timer is not None:
+            self.timer.join()
+        return self.report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return f"Bulk Writer: {len(self.buffer)} students buffered ({self.rows} rows), {self.report}"
+
+    def __repr__(self):
+        return f'BulkWriter(max_rows="{self.max_rows}", max_delay="{self.max_delay}", buffered="{len(self.buffer)}")'
@@ -1,107 +1,217 @@
-from data.db import DB_API
-from src.forecasting.course_predictor import CoursePerformancePredictor
-from src.forecasting.comp_predictor import CompPerformancePredictor
-from models.student import Student
-
-from fastapi import FastAPI
-import dotenv
+'''
+Punto de entrada del servicio de proyecciones de SIPEFCA.
+
+Uso:
+    python main.py batch [--workers N] [--pooled-courses] [--store PATH] [--cascade PATH] [--fit-budget] [--model-store PATH]
+    python main.py institution INTEC [--workers N] [--pooled-courses] [--store PATH] [--cascade PATH] [--fit-budget] [--model-store PATH]
+    python main.py serve [--host 0.0.0.0] [--port 8000]
+
+El servicio también se puede ejecutar con `uvicorn main:api`. Importar este
+módulo no crea conexiones ni carga modelos: la base de datos, las librerías
+de modelado y la aplicación se crean la primera vez que se necesitan.
+'''
+import argparse
 import os
+from functools import cache
 
-_db = DB_API(test = True)
-
-def test_get_students() -> list[Student]:
-    students = _db.get_students()
-    assert len(students) >= 1
-    return students
 
-students = test_get_students()
+@cache
+def get_db(test: bool = True):
+    from data.db import DB_API
+    return DB_API(test = test)
 
-def get_predictions(student: Student):
-    current_period = student.periods[-1].period.replace('-','')
 
-    # print(student.periods[-1].period.replace('-',''))
-
-    student_data = student.to_frame().reset_index(drop=True)
-    print("student_data")
-    print(student_data)
+def test_get_students():
+    students = get_db().get_students()
+    assert len(students) >= 1
+    return students
 
-    cpp = CompPerformancePredictor(student_data)
-    # print("cpp")
-    # print(cpp.forecast_competency_performance())
 
-    cspp = CoursePerformancePredictor(student_data, cpp.forecast_competency_performance())
+def get_predictions(student):
+    from src.forecasting.batch import forecast_student
 
-    predictions = cspp.forecast_courses_performance(current_period)
+    predictions = forecast_student(student)
     print("predictions")
     print(predictions)
 
-    _db.update_student_data(student.student_id, student.institution_id, predictions)
-
-
-for student in students:
-    get_predictions(student)
-
-
-# dotenv.load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
-
-
-# try:
-#     env_batch_size = os.getenv('BATCH_SIZE')
-#     batch_size : int = int(str(env_batch_size))
-# except:
-#     batch_size = 100
-
-# db = DB_API()
+    get_db().update_student_data(student.student_id, student.institution_id, predictions)
+
+
+def get_course_model(students, path: str | None = None) -> str:
+    '''
+    Ajusta el modelo de asignaturas de la institución con todos los
+    estudiantes y lo guarda para que cada proceso lo cargue. Retorna la ruta
+    del modelo (por defecto la variable de entorno COURSE_MODEL_PATH).
+    '''
+    from src.forecasting.course_predictor import PooledCourseModel
+
+    path = path or os.getenv('COURSE_MODEL_PATH') or os.path.join('.cache', 'course_model.json')
+    model = PooledCourseModel.fit_students(students)
+    model.save(path)
+    print(model)
+    return path
 
-# api = FastAPI()
 
-# @api.get("/")
-# def read_root():
-#     return {"Hello": "World"}
+def get_fit_budget(enabled: bool = False):
+    '''
+    Retorna DEFAULT_FIT_BUDGET si se pidió limitar los ajustes o None.
+    '''
+    if not enabled:
+        return None
+
+    from src.forecasting.comp_predictor import DEFAULT_FIT_BUDGET
+    return DEFAULT_FIT_BUDGET
+
+
+def get_model_store(path: str | None = None):
+    '''
+    Retorna el ModelStore de la ruta recibida o de la variable de entorno
+    MODEL_STORE_PATH, o None si no hay ninguna.
+    '''
+    path = path or os.getenv('MODEL_STORE_PATH')
+    if not path:
+        return None
 
-# @api.get("/ai/health")
-# def health():
-#     return {"status": "ok"}
-
-# @api.get("/ai/student_forecasts/{institution_id}")
-# def read_student_forecasts(institution_id: str):
-#     current_period = db.get_latest_period(institution_id)
-
-#     current_batch = 0
-#     total_current_students = db.get_student_count(institution_id)
-#     batch_data = []
-
-#     for _ in range(total_current_students // batch_size):
-#         students = db.get_students(institution_id, current_batch)
-
-#         for student in students:
-#             student_data = db.get_student_data(student.student_id, institution_id).to_frame()
-#             _cpp = cpp(student_data)
-#             _cspp = cspp(student_data, _cpp.forecast_competency_performance())
-
-#             predictions = _cspp.forecast_courses_performance(current_period)
-
-#             db.update_student_data(student.student_id, institution_id, predictions)
-
-#             batch_data.append(predictions)
-
-#         current_batch += 1
-        
-
-
-
-
-#     pass
-
-# @api.get("/student_forecast/{institution_id}/{student_id}")
-# def read_student_forecast(institution_id: str, student_id: str):
-#     '''
-#     This funtion is going to be called by the main api to get the forecasted data for the student.
-#     '''
-#     pass
+    from src.time_series import ModelStore
+    return ModelStore(path)
+
+
+def get_forecast_store(path: str | None = None, budget = None):
+    '''
+    Retorna el ForecastStore de la ruta recibida o de la variable de entorno
+    FORECAST_STORE_PATH, o None si no hay ninguna. Sus llaves incluyen el
+    budget de los ajustes para no reutilizar proyecciones de otros límites.
+    '''
+    path = path or os.getenv('FORECAST_STORE_PATH')
+    if not path:
+        return None
+
+    from src.forecasting.store import ForecastStore, forecast_config
+    return ForecastStore(path, config=forecast_config(budget))
+
+
+def get_cascade(path: str | None = None):
+    '''
+    Retorna la tabla de victorias de la cascada guardada en la ruta recibida
+    o en la variable de entorno CASCADE_STATS_PATH (vacía si el archivo aún
+    no existe) junto con la ruta, o (None, None) si no hay ninguna ruta.
+    '''
+    path = path or os.getenv('CASCADE_STATS_PATH')
+    if not path:
+        return None, None
+
+    from src.forecasting.cascade import CascadeStats
+    return (CascadeStats.load(path) if os.path.exists(path) else CascadeStats()), path
+
+
+def get_batch_predictions(students, workers: int | None = None, pooled: bool = False, store: str | None = None, cascade: str | None = None,
+                          fit_budget: bool = False, model_store: str | None = None):
+    from data.writer import BulkWriter
+    from src.forecasting.batch import BatchForecaster
+
+    course_model = get_course_model(students) if pooled else None
+    stats, cascade = get_cascade(cascade)
+    budget = get_fit_budget(fit_budget)
+    forecaster = BatchForecaster(workers=workers, course_model=course_model, forecast_store=get_forecast_store(store, budget), cascade=stats,
+                                 budget=budget, model_store=get_model_store(model_store))
+
+    with BulkWriter(get_db()) as writer:
+        for result in forecaster.run(students):
+            if not result.ok:
+                print(f"could not forecast student {result.student_id}: {result.error}")
+                continue
+
+            writer.add(result.student_id, result.institution_id, result.predictions)
+
+    for student_id, error in writer.report.failed.items():
+        print(f"could not write student {student_id}: {error}")
+    print(forecaster.report)
+    if stats is not None:
+        stats.save(cascade)
+
+
+def get_institution_predictions(institution_id: str = "INTEC", workers: int | None = None, pooled: bool = False, store: str | None = None,
+                                cascade: str | None = None, fit_budget: bool = False, model_store: str | None = None):
+    from src.forecasting.pipeline import ForecastPipeline
+
+    _db = get_db()
+    # el modelo de asignaturas se ajusta en una pasada previa sobre la institución
+    course_model = get_course_model(_db.iter_students(institution_id)) if pooled else None
+    stats, cascade = get_cascade(cascade)
+    budget = get_fit_budget(fit_budget)
+    pipeline = ForecastPipeline(_db, workers=workers, course_model=course_model, forecast_store=get_forecast_store(store, budget), cascade=stats,
+                                budget=budget, model_store=get_model_store(model_store))
+    report = pipeline.run(institution_id, _db.get_latest_period(institution_id).replace('-', ''))
+    if stats is not None:
+        stats.save(cascade)
+
+    for result in pipeline.failed:
+        print(f"could not forecast student {result.student_id}: {result.error}")
+    print(pipeline)
+
+    return report
+
+
+def __getattr__(name: str):
+    # `uvicorn main:api` crea la aplicación al accederla, no al importar el módulo
+    if name == 'api':
+        from src.service import create_app
+        globals()['api'] = create_app()
+        return globals()['api']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def env_workers() -> int | None:
+    try:
+        return int(str(os.getenv('FORECAST_WORKERS')))
+    except ValueError:
+        return None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description='SIPEFCA forecasting service')
+    commands = parser.add_subparsers(dest='command')
+
+    batch = commands.add_parser('batch', help='forecast the test students')
+    batch.add_argument('--workers', type=int, default=env_workers())
+    batch.add_argument('--pooled-courses', action='store_true', help='use one course grade model fitted on every student')
+    batch.add_argument('--store', default=None, help='forecast store used to skip unchanged students')
+    batch.add_argument('--cascade', default=None, help='model win-rate table used to order the cascade, updated after the run')
+    batch.add_argument('--fit-budget', action='store_true', help='limit the time and iterations of each model fit')
+    batch.add_argument('--model-store', default=None, help='fitted model store used to update the models of previous runs')
+
+    institution = commands.add_parser('institution', help='forecast every student of an institution')
+    institution.add_argument('institution_id', nargs='?', default='INTEC')
+    institution.add_argument('--workers', type=int, default=env_workers())
+    institution.add_argument('--pooled-courses', action='store_true', help='use one course grade model fitted on every student')
+    institution.add_argument('--store', default=None, help='forecast store used to skip unchanged students')
+    institution.add_argument('--cascade', default=None, help='model win-rate table used to order the cascade, updated after the run')
+    institution.add_argument('--fit-budget', action='store_true', help='limit the time and iterations of each model fit')
+    institution.add_argument('--model-store', default=None, help='fitted model store used to update the models of previous runs')
+
+    serve = commands.add_parser('serve', help='run the forecasting api')
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=8000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit('could not serve the api: uvicorn is not installed')
+        uvicorn.run('main:api', host=args.host, port=args.port)
+    elif args.command == 'institution':
+        get_institution_predictions(args.institution_id, args.workers, args.pooled_courses, args.store, args.cascade, args.fit_budget, args.model_store)
+    else:
+        get_batch_predictions(test_get_students(), getattr(args, 'workers', env_workers()), getattr(args, 'pooled_courses', False), getattr(args, 'store', None),
+                              getattr(args, 'cascade', None), getattr(args, 'fit_budget', False), getattr(args, 'model_store', None))
+
+
+if __name__ == '__main__':
+    main()
 
 
 # # first step: when the time comes, the main api is going to make a request to this service top generate the predictions opf the student data for the current period.
 # # This will always happen in the background during the maintenance of both the academic application of the institution and SIPEFCA's service.
-# # for this we will 
-
+# # for this we will
@@ -1,7 +1,12 @@
+from .batch_forecast import *
 from .competence import *
+from .decoder import *
+from .forecast_job import *
+from .forecast_result import *
 from .period import *
 from .student import *
 from .subject import *
 from .trend_prediction import *
+from .write_report import *
 
-__all__ = ['competence','period','student','subject','trend_prediction']
\ No newline at end of file
+__all__ = ['batch_forecast','competence','decoder','forecast_job','forecast_result','period','student','subject','trend_prediction','write_report']
\ No newline at end of file
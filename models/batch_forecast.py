@@ -0,0 +1,18 @@
+import numpy as np
+
+class BatchForecast:
+    def __init__(self, forecasts : np.ndarray, lower : np.ndarray, upper : np.ndarray, rmse : np.ndarray, model : np.ndarray):
+        self.forecasts = forecasts
+        self.lower = lower
+        self.upper = upper
+        self.rmse = rmse
+        self.model = model
+
+    def __len__(self):
+        return len(self.forecasts)
+
+    def __str__(self):
+        return f"Batch Forecast: {len(self)} series with forecasts: {self.forecasts}"
+
+    def __repr__(self):
+        return f'BatchForecast(series="{len(self)}", steps="{self.forecasts.shape[1] if self.forecasts.ndim == 2 else 0}")'
@@ -2,6 +2,8 @@ from pandas import DataFrame
 
 
 class Competence:
+    __slots__ = ('id', 'weight', 'performance', 'predicted_performance')
+
     def __init__(self, id : str = '', weight : int = 100, performance : float = 0.0, predicted_performance : float = 0.0, json : dict | None = None):
         assert id != '' or json is not None
         if json is not None:
@@ -13,19 +15,19 @@ class Competence:
         self.predicted_performance = predicted_performance
 
     def from_json(self, competency_data: dict):
-        try:
-            perf = competency_data['performance']
-            pred_perf = competency_data['predicted_performance']
-        except:
-            perf = 100
-            pred_perf = 90
         try:
             self.id = competency_data['comp_id']
             self.weight = competency_data['weight']
-            self.performance = perf
-            self.predicted_performance = pred_perf
         except Exception as error:
-            raise ValueError(f'could not load the competency data from the json: {error}') 
+            raise ValueError(f'could not load the competency data from the json: {error}')
+
+        # the defaults are used unless both performances are present
+        if 'performance' in competency_data and 'predicted_performance' in competency_data:
+            self.performance = competency_data['performance']
+            self.predicted_performance = competency_data['predicted_performance']
+        else:
+            self.performance = 100
+            self.predicted_performance = 90
 
     def __str__(self):
         return f"Competence: {self.id} with weight: {self.weight}"
@@ -0,0 +1,103 @@
+import gc
+import json
+from sys import intern
+
+from .competence import Competence
+from .period import Period
+from .student import Student
+from .subject import Subject, GRADE_MAP
+
+_new = object.__new__
+
+
+def _intern(value):
+    return intern(value) if type(value) is str else value
+
+
+def model_hook(obj : dict):
+    '''
+    object_hook de json que convierte cada objeto de la exportación de un
+    estudiante en su modelo mientras se lee el texto. json llama al hook
+    desde los objetos internos hacia afuera, por lo que las competencias,
+    asignaturas y periodos ya son modelos cuando se construye su padre y la
+    exportación se recorre una sola vez.
+
+    Los modelos se llenan atributo por atributo con los mismos valores por
+    defecto de sus métodos from_json, y los códigos de competencias,
+    asignaturas y periodos se internan ya que se repiten en todos los
+    estudiantes de una institución. Los objetos que no forman parte de un
+    estudiante se retornan sin cambios.
+    '''
+    try:
+        if 'comp_id' in obj:
+            competency = _new(Competence)
+            competency.id = _intern(obj['comp_id'])
+            competency.weight = obj['weight']
+            if 'performance' in obj and 'predicted_performance' in obj:
+                competency.performance = obj['performance']
+                competency.predicted_performance = obj['predicted_performance']
+            else:
+                competency.performance = 100
+                competency.predicted_performance = 90
+            return competency
+
+        if 'competences' in obj:
+            grade = obj['grade']
+            course = _new(Subject)
+            course.id = _intern(obj['course_id'])
+            course.credits = obj['credits']
+            course.grade = 0 if grade is None else GRADE_MAP[grade]
+            course.predicted_grade = obj.get('predicted_grade', 0)
+            course.competencies = obj['competences']
+            return course
+
+        if 'courses' in obj:
+            period = _new(Period)
+            period.period = _intern(obj['period'])
+            period.courses = obj['courses']
+            period.cant_courses = obj['cant_courses']
+            period.total_credits = obj['total_credits']
+            return period
+
+        if 'periods' in obj:
+            student = _new(Student)
+            student.student_id = obj['student_id']
+            student.institution_id = obj['institution_id']
+            student.periods = obj['periods']
+            return student
+    except Exception as error:
+        raise ValueError(f'could not decode the student data from the json: {error!r}')
+
+    return obj
+
+
+class StudentDecoder(json.JSONDecoder):
+    '''
+    Decoder de json que construye los modelos de la exportación de un
+    estudiante en una sola pasada (ver model_hook).
+
+    Un estudiante crea miles de objetos sin referencias cíclicas, por lo que
+    el recolector de ciclos se pausa mientras se lee un registro en vez de
+    volver a recorrer los estudiantes ya cargados cada pocos cientos de
+    objetos.
+    '''
+    def __init__(self, **kwargs):
+        kwargs.setdefault('object_hook', model_hook)
+        super().__init__(**kwargs)
+
+    def raw_decode(self, s, idx = 0):
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return super().raw_decode(s, idx)
+        finally:
+            if enabled:
+                gc.enable()
+
+
+def loads_students(text : str) -> list[Student]:
+    '''
+    Convierte un registro o un arreglo de registros de estudiantes en modelos.
+    '''
+    data = StudentDecoder().decode(text)
+    return data if isinstance(data, list) else [data]
@@ -0,0 +1,56 @@
+import time
+import uuid
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+
+
+class ForecastJob:
+    def __init__(self, institution_id : str = '', period : str | None = None, job_id : str | None = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.institution_id = institution_id
+        self.period = period
+        self.status = 'queued'
+        self.total = 0
+        self.processed = 0
+        self.failed = 0
+        self.error : str | None = None
+        self.report : dict | None = None
+        self.created_at = time.time()
+        self.started_at : float | None = None
+        self.finished_at : float | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        '''
+        Estudiantes procesados por segundo desde que inició el trabajo.
+        '''
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def progress(self) -> float:
+        if self.status == 'done':
+            return 1.0
+        return min(self.processed / self.total, 1.0) if self.total else 0.0
+
+    def to_dict(self) -> dict:
+        return {'job_id': self.job_id, 'institution_id': self.institution_id, 'period': self.period, 'status': self.status,
+                'total': self.total, 'processed': self.processed, 'failed': self.failed, 'progress': round(self.progress, 4),
+                'students_per_second': round(self.throughput, 2), 'elapsed': round(self.elapsed, 2), 'error': self.error,
+                'report': self.report}
+
+    def __str__(self):
+        return f"Forecast Job: {self.job_id} for {self.institution_id} {self.status} ({self.processed}/{self.total} students, {self.throughput:.1f} students/s)"
+
+    def __repr__(self):
+        return f'ForecastJob(job_id="{self.job_id}", institution_id="{self.institution_id}", status="{self.status}", processed="{self.processed}", total="{self.total}")'
@@ -0,0 +1,25 @@
+from pandas import DataFrame
+
+class ForecastResult:
+    def __init__(self, student_id : str = '', institution_id : str = '', predictions : DataFrame | None = None, error : str | None = None, elapsed : float = 0.0, source : str = 'recomputed', wins : list | None = None):
+        self.student_id = student_id
+        self.institution_id = institution_id
+        self.predictions = predictions
+        self.error = error
+        self.elapsed = elapsed
+        # skipped, course or recomputed, see src.forecasting.batch._forecast_stored
+        self.source = source
+        # (series profile, winning model) of each cascade, see src.forecasting.cascade
+        self.wins = wins or []
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self):
+        if self.error is not None:
+            return f"Forecast Result: {self.student_id} failed with error: {self.error}"
+        return f"Forecast Result: {self.student_id} with predictions: {self.predictions}"
+
+    def __repr__(self):
+        return f'ForecastResult(student_id="{self.student_id}", institution_id="{self.institution_id}", error="{self.error}", elapsed="{self.elapsed}", source="{self.source}")'
@@ -2,6 +2,8 @@ from pandas import DataFrame
 from .subject import Subject
 
 class Period:
+    __slots__ = ('period', 'courses', 'cant_courses', 'total_credits')
+
     def __init__(self, period : str = '', courses : list[Subject] = [], cant_courses : int = 0, total_credits : int = 0, json : dict | None = None):
         assert period != '' or json is not None
         if json is not None:
@@ -15,9 +17,7 @@ class Period:
     def from_json(self, period_data: dict):
         try:
             self.period = period_data['period']
-            self.courses = []
-            for course in period_data['courses']:
-                self.courses.append(Subject(json=course))
+            self.courses = [Subject(json=course) for course in period_data['courses']]
             self.cant_courses = period_data['cant_courses']
             self.total_credits = period_data['total_credits']
         except Exception as error:
@@ -1,9 +1,44 @@
 import random
-from pandas import DataFrame, concat
+from functools import lru_cache
+import numpy as np
+from pandas import Categorical, CategoricalDtype, DataFrame
+from pandas.api.types import union_categoricals
 from .period import Period
 
+# key columns stored as categoricals; period is ordered so its codes are the period ordinal
+CATEGORICAL_COLUMNS = ('student_id', 'period', 'course_id', 'competency')
+
+
+@lru_cache(maxsize=4096)
+def _category_dtype(categories: tuple, ordered: bool) -> CategoricalDtype:
+    return CategoricalDtype(list(categories), ordered=ordered)
+
+
+def _categorical(values: list, counts=None, ordered: bool = False) -> Categorical:
+    # categories are sorted so that category order matches the string order; the dtypes are
+    # cached since students share their competencies and most of their periods
+    try:
+        categories = tuple(sorted(set(values)))
+    except TypeError:
+        # mixed identifiers (e.g. int and str student ids) are ordered by their text
+        categories = tuple(sorted(set(values), key=str))
+    lookup = {category: code for code, category in enumerate(categories)}
+    codes = np.fromiter((lookup[value] for value in values), dtype=np.intp, count=len(values))
+    if counts is not None:
+        codes = np.repeat(codes, counts)
+    return Categorical.from_codes(codes, dtype=_category_dtype(categories, ordered), validate=False)
+
+
+def _small_ints(values: np.ndarray) -> np.ndarray:
+    # int16 only holds integers up to 32767, anything else keeps its value as float32
+    if len(values) and not (np.all(values == np.round(values)) and np.abs(values).max() <= np.iinfo(np.int16).max):
+        return values.astype(np.float32)
+    return values.astype(np.int16)
+
 
 class Student:
+    __slots__ = ('student_id', 'institution_id', 'periods')
+
     def __init__(self, student_id : str = '', institution_id : str = '', periods : list[Period] = [], json: dict | None = None): 
         assert student_id != '' or json is not None
         if json is not None:
@@ -17,10 +52,7 @@ class Student:
         try:
             self.student_id = student_data['student_id']
             self.institution_id = student_data['institution_id']
-            periods = []
-            for period in student_data['periods']:
-                periods.append(Period(json=period))
-            self.periods = periods
+            self.periods = [Period(json=period) for period in student_data['periods']]
 
         except Exception as error:
             raise ValueError(f'could not load the student data from the json: {error}')
@@ -36,22 +68,25 @@ class Student:
         return student
 
     def to_frame(self):
-        frames = []
-        for period in self.periods: 
-            for course in period.courses:
-                for competency in course.competencies:
-                    frame = {}
-                    frame['period'] = period.period.replace('-','')
-                    frame['course_id'] = course.id
-                    frame['credits'] = course.credits
-                    frame['numerical_grade'] = course.grade
-                    frame['predicted_grade'] = course.predicted_grade
-                    frame['competency'] = competency.id
-                    frame['weight'] = competency.weight
-                    frame['performance'] = (course.grade / 4.0) * 100
-                    frame['comp_performance'] = competency.predicted_performance
-                    frames.append(frame)
-        return DataFrame(frames)
+        courses = [(period.period.replace('-',''), course) for period in self.periods for course in period.courses]
+        competencies = [competency for _, course in courses for competency in course.competencies]
+        counts = np.fromiter((len(course.competencies) for _, course in courses), dtype=np.intp, count=len(courses))
+
+        # course level columns are built once per course and repeated for each of its competencies
+        numerical_grade = np.repeat(np.fromiter((course.grade for _, course in courses), dtype=np.float32, count=len(courses)), counts)
+
+        # grades are multiples of 0.5 and weights/credits are usually small integers, so the narrow dtypes are exact
+        return DataFrame({
+            'period': _categorical([period for period, _ in courses], counts, ordered=True),
+            'course_id': _categorical([course.id for _, course in courses], counts),
+            'credits': np.repeat(_small_ints(np.fromiter((course.credits for _, course in courses), dtype=np.float64, count=len(courses))), counts),
+            'numerical_grade': numerical_grade,
+            'predicted_grade': np.repeat(np.fromiter((course.predicted_grade for _, course in courses), dtype=np.float32, count=len(courses)), counts),
+            'competency': _categorical([competency.id for competency in competencies]),
+            'weight': _small_ints(np.fromiter((competency.weight for competency in competencies), dtype=np.float64, count=len(competencies))),
+            'performance': (numerical_grade / np.float32(4.0)) * np.float32(100),
+            'comp_performance': np.fromiter((competency.predicted_performance for competency in competencies), dtype=np.float64, count=len(competencies)),
+        }, copy=False)
 
         # return DataFrame(self.periods)
 
@@ -59,4 +94,21 @@ class Student:
         return f"Student: {self.student_id} with periods: {self.periods}"
     
     def __repr__(self):
-        return f'Student(student_id="{self.student_id}", institution_id="{self.institution_id}, periods:"{self.periods})"'   
\ No newline at end of file
+        return f'Student(student_id="{self.student_id}", institution_id="{self.institution_id}, periods:"{self.periods})"'
+
+
+def cohort_to_frame(students: list[Student]) -> DataFrame:
+    frames = [student.to_frame() for student in students]
+    if not frames:
+        return DataFrame()
+
+    # the per student categoricals are merged by remapping their codes, the strings are not hashed again
+    sizes = np.fromiter((len(frame) for frame in frames), dtype=np.intp, count=len(frames))
+    columns = {'student_id': _categorical([student.student_id for student in students], sizes)}
+    for column in frames[0].columns:
+        if column in CATEGORICAL_COLUMNS:
+            values = union_categoricals([frame[column].array for frame in frames], sort_categories=True, ignore_order=True)
+            columns[column] = values.as_ordered() if column == 'period' else values
+        else:
+            columns[column] = np.concatenate([frame[column].to_numpy() for frame in frames])
+    return DataFrame(columns, copy=False)
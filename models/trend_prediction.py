@@ -1,9 +1,10 @@
 from pandas import DataFrame
 
 class TrendPrediction:
-    def __init__(self, pred : DataFrame = DataFrame(), rmse : float = 1): 
+    def __init__(self, pred : DataFrame = DataFrame(), rmse : float = 1, model : str = ''): 
         self.pred = pred
         self.rmse = rmse
+        self.model = model
 
     def __str__(self):
-        return f"Trend Prediction: {self.pred} with rmse: {self.rmse}"
\ No newline at end of file
+        return f"Trend Prediction: {self.model} {self.pred} with rmse: {self.rmse}"
\ No newline at end of file
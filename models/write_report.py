@@ -0,0 +1,23 @@
+class WriteReport:
+    def __init__(self, written : list[str] | None = None, failed : dict[str, str] | None = None, rows : int = 0, requests : int = 0):
+        self.written = written if written is not None else []
+        self.failed = failed if failed is not None else {}
+        self.rows = rows
+        self.requests = requests
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def merge(self, other : 'WriteReport') -> 'WriteReport':
+        self.written.extend(other.written)
+        self.failed.update(other.failed)
+        self.rows += other.rows
+        self.requests += other.requests
+        return self
+
+    def __str__(self):
+        return f"Write Report: {len(self.written)} students written ({self.rows} rows in {self.requests} requests), {len(self.failed)} failed"
+
+    def __repr__(self):
+        return f'WriteReport(written="{len(self.written)}", failed="{len(self.failed)}", rows="{self.rows}", requests="{self.requests}")'
@@ -1,4 +1,9 @@
+from .cascade import *
 from .comp_predictor import *
 from .course_predictor import *
+from .batch import *
+from .cache import *
+from .pipeline import *
+from .store import *
 
-__all__ = ['comp_predictor','course_predictor']
\ No newline at end of file
+__all__ = ['cascade','comp_predictor','course_predictor','batch','cache','pipeline','store']
\ No newline at end of file
@@ -0,0 +1,257 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from threadpoolctl import threadpool_limits
+
+from models.student import Student
+from models.forecast_result import ForecastResult
+from ..profiling import metrics
+from ..time_series import FitBudget, ModelStore
+from .cascade import CascadeStats
+from .comp_predictor import CompPerformancePredictor
+from .course_predictor import CoursePerformancePredictor, PooledCourseModel, load_course_model
+from .store import ForecastStore, StoredForecast, regression_key
+
+BLAS_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# verdadero en los procesos del pool, que envían sus métricas con cada bloque
+_in_worker = False
+
+
+def forecast_student(student: Student, period: str | None = None, model_store: ModelStore | None = None,
+                     course_model: PooledCourseModel | str | None = None, forecast_store: ForecastStore | None = None,
+                     budget: FitBudget | None = None):
+  '''
+  Genera las proyecciones de desempeño de las asignaturas de un estudiante.
+
+  Encadena Student.to_frame, CompPerformancePredictor y
+  CoursePerformancePredictor, el mismo flujo que se ejecuta en main.py.
+
+  Parámetros:
+  student - Estudiante del cual se desean generar las proyecciones.
+
+  period - Periodo objetivo con el formato "AAAAPP". Por defecto se utiliza
+  el último periodo del estudiante.
+
+  model_store - ModelStore opcional para actualizar los modelos ajustados en
+  ejecuciones anteriores en lugar de reajustarlos.
+
+  course_model - PooledCourseModel opcional (o la ruta de uno guardado) de
+  la institución. Por defecto se ajusta una regresión con los datos del
+  estudiante.
+
+  forecast_store - ForecastStore opcional con las proyecciones de
+  ejecuciones anteriores, ver _forecast_stored. Debe utilizar la
+  configuración del mismo budget (ver forecast_config).
+
+  budget - FitBudget opcional con los límites de los ajustes del
+  estudiante, ver CompPerformancePredictor.
+
+  Este método retorna el DataFrame con las asignaturas del periodo y su
+  calificación proyectada.
+  '''
+  return _forecast_stored(student, period, model_store, course_model, forecast_store, budget=budget)[0]
+
+
+def _forecast_stored(student: Student, period: str | None = None, model_store: ModelStore | None = None,
+                     course_model = None, forecast_store: ForecastStore | None = None, cascade: CascadeStats | None = None,
+                     budget: FitBudget | None = None):
+  '''
+  forecast_student con el origen del resultado:
+
+  - "skipped": el historial y la regresión de asignaturas no cambiaron, se
+    retorna la proyección almacenada.
+  - "course": solo cambió la regresión de asignaturas, se reutilizan las
+    proyecciones de las competencias almacenadas.
+  - "recomputed": el estudiante es nuevo o su historial cambió.
+
+  y los ganadores de la cascada (ver CompPerformancePredictor.wins).
+  '''
+  if period is None:
+    period = student.periods[-1].period.replace('-','')
+
+  course_model = load_course_model(course_model)
+  regression = course_model.for_student(student.student_id) if course_model is not None else None
+  course_key = regression_key(regression)
+
+  stored = None
+  if forecast_store is not None:
+    key = forecast_store.key(student, period, cascade)
+    stored = forecast_store.get(key)
+    if stored is not None and stored.course_key == course_key:
+      return stored.predictions, 'skipped', []
+
+  student_data = student.to_frame().reset_index(drop=True)
+
+  if stored is not None:
+    competencies, models, source, wins = stored.competencies, stored.models, 'course', []
+  else:
+    cpp = CompPerformancePredictor(student_data, model_store=model_store, student_id=str(student.student_id), budget=budget, cascade=cascade)
+    competencies = cpp.forecast_competency_performance()
+    models = {competency: trend.model for competency, trend in cpp.predictions.items()}
+    source, wins = 'recomputed', cpp.wins
+
+  predictions = CoursePerformancePredictor(student_data, competencies, regression).forecast_courses_performance(period)
+
+  if forecast_store is not None:
+    forecast_store.put(key, student, period, StoredForecast(competencies, predictions, models, course_key))
+
+  return predictions, source, wins
+
+
+def _init_worker(blas_threads: int, profile: bool | None = None):
+  '''
+  Inicializador de los procesos del pool. Limita los hilos de BLAS/OpenMP
+  para que N procesos no compitan por los mismos núcleos.
+
+  profile indica si el proceso registra métricas, por defecto se mantiene
+  el estado heredado del proceso principal.
+  '''
+  global _in_worker
+
+  for var in BLAS_ENV_VARS:
+    os.environ[var] = str(blas_threads)
+
+  # las librerías ya cargadas (fork) no releen las variables de entorno
+  threadpool_limits(limits=blas_threads)
+
+  # con fork el registro llega con lo medido por el proceso principal
+  _in_worker = True
+  metrics.reset()
+  if profile is not None:
+    metrics.enable(profile)
+
+
+def _forecast_one(student: Student, period: str | None = None, model_store: ModelStore | None = None, course_model = None,
+                  forecast_store: ForecastStore | None = None, cascade: CascadeStats | None = None, budget: FitBudget | None = None) -> ForecastResult:
+  student_id = str(getattr(student, 'student_id', ''))
+  institution_id = str(getattr(student, 'institution_id', ''))
+  start = time.perf_counter()
+
+  try:
+    predictions, source, wins = _forecast_stored(student, period, model_store, course_model, forecast_store, cascade, budget)
+    return ForecastResult(student_id, institution_id, predictions, elapsed=time.perf_counter() - start, source=source, wins=wins)
+  except Exception as error:
+    return ForecastResult(student_id, institution_id, error=f'{type(error).__name__}: {error}', elapsed=time.perf_counter() - start)
+
+
+def _forecast_chunk(students: list[Student], period: str | None = None, model_store: ModelStore | None = None,
+                    course_model = None, forecast_store: ForecastStore | None = None, cascade: CascadeStats | None = None,
+                    budget: FitBudget | None = None) -> tuple[list[ForecastResult], dict | None]:
+  results = [_forecast_one(student, period, model_store, course_model, forecast_store, cascade, budget) for student in students]
+  # en el proceso principal las métricas ya quedan en su registro
+  return results, metrics.drain() if _in_worker and metrics.enabled else None
+
+
+def source_report(results: Iterable[ForecastResult]) -> dict:
+  '''
+  Cuenta los resultados por origen (ver _forecast_stored) y los fallidos.
+  '''
+  report = {'skipped': 0, 'course': 0, 'recomputed': 0, 'failed': 0}
+  for result in results:
+    report[result.source if result.ok else 'failed'] += 1
+  return report
+
+
+class BatchForecaster():
+  '''
+  Clase para la generación de las proyecciones de un conjunto de estudiantes
+  (p. ej. una institución completa) repartiendo el trabajo en un pool de
+  procesos.
+
+  Parámetros:
+
+  workers - Cantidad de procesos del pool. Por defecto os.cpu_count(). Con
+  1 las proyecciones se generan en el proceso actual.
+
+  blas_threads - Cantidad de hilos de BLAS/OpenMP permitidos por proceso.
+
+  chunksize - Cantidad de estudiantes enviados a un proceso por tarea.
+
+  model_store - ModelStore opcional compartido por los procesos. Debe
+  utilizar una ruta en disco para que las actualizaciones persistan entre
+  ejecuciones.
+
+  course_model - PooledCourseModel opcional o la ruta de uno guardado con
+  save. Con una ruta cada proceso carga el modelo una sola vez.
+
+  forecast_store - ForecastStore opcional. Los estudiantes sin cambios
+  desde la ejecución anterior no se vuelven a proyectar y self.report
+  cuenta los omitidos y recalculados (ver source_report).
+
+  cascade - CascadeStats opcional para ordenar la cascada de cada serie. Al
+  terminar run se le suman los ganadores de todos los estudiantes.
+
+  budget - FitBudget opcional con los límites de los ajustes de cada
+  estudiante (p. ej. DEFAULT_FIT_BUDGET), ver forecast_student.
+
+  Los resultados se retornan en el mismo orden de los estudiantes recibidos
+  y el error de un estudiante queda registrado en su ForecastResult sin
+  interrumpir el resto del lote.
+  '''
+  def __init__(self, workers: int | None = None, blas_threads: int = 1, chunksize: int = 4, model_store: ModelStore | None = None,
+               course_model: PooledCourseModel | str | None = None, forecast_store: ForecastStore | None = None,
+               cascade: CascadeStats | None = None, budget: FitBudget | None = None):
+    if workers is None:
+      workers = os.cpu_count() or 1
+    if workers < 1:
+      raise ValueError(f'workers must be at least 1, got {workers}')
+    if chunksize < 1:
+      raise ValueError(f'chunksize must be at least 1, got {chunksize}')
+
+    self.workers = workers
+    self.blas_threads = blas_threads
+    self.chunksize = chunksize
+    self.model_store = model_store
+    self.course_model = course_model
+    self.forecast_store = forecast_store
+    self.cascade = cascade
+    self.budget = budget
+    self.report = source_report([])
+
+  def run(self, students: Iterable[Student], period: str | None = None) -> list[ForecastResult]:
+    '''
+    Método para generar las proyecciones de todos los estudiantes.
+
+    Parámetros:
+    students - Estudiantes a proyectar.
+
+    period - Periodo objetivo opcional, ver forecast_student.
+
+    Este método retorna una lista de ForecastResult en el mismo orden de
+    los estudiantes recibidos.
+    '''
+    students = list(students)
+
+    if self.workers == 1 or len(students) <= 1:
+      with threadpool_limits(limits=self.blas_threads):
+        results = _forecast_chunk(students, period, self.model_store, self.course_model, self.forecast_store, self.cascade, self.budget)[0]
+      self.__finish(results)
+      return results
+
+    chunks = [students[i:i + self.chunksize] for i in range(0, len(students), self.chunksize)]
+    results : list[ForecastResult] = []
+
+    with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)), initializer=_init_worker, initargs=(self.blas_threads, metrics.enabled)) as executor:
+      futures = [executor.submit(_forecast_chunk, chunk, period, self.model_store, self.course_model, self.forecast_store, self.cascade, self.budget) for chunk in chunks]
+
+      # se recorren los futures en el orden de envío para que la salida sea determinista
+      for chunk, future in zip(chunks, futures):
+        try:
+          output, snapshot = future.result()
+          metrics.merge(snapshot)
+          results.extend(output)
+        except Exception as error:
+          # el proceso murió (p. ej. BrokenProcessPool); se marca el bloque completo
+          for student in chunk:
+            results.append(ForecastResult(str(getattr(student, 'student_id', '')), str(getattr(student, 'institution_id', '')), error=f'{type(error).__name__}: {error}'))
+
+    self.__finish(results)
+    return results
+
+  def __finish(self, results: list[ForecastResult]):
+    self.report = source_report(results)
+    if self.cascade is not None:
+      self.cascade.update(win for result in results for win in result.wins)
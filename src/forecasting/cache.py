@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from models.student import Student
+
+
+def history_fingerprint(student: Student, period: str | None = None) -> str:
+  '''
+  Genera un hash del historial académico de un estudiante.
+
+  Solo se consideran los campos utilizados por Student.to_frame, por lo que
+  dos historiales con la misma huella generan las mismas proyecciones.
+
+  Parámetros:
+  student - Estudiante del cual se genera la huella.
+
+  period - Periodo objetivo de la proyección.
+  '''
+  history = [(p.period, course.id, course.credits, course.grade, course.predicted_grade,
+              [(c.id, c.weight, c.predicted_performance) for c in course.competencies])
+             for p in student.periods for course in p.courses]
+  key = repr((str(student.institution_id), str(student.student_id), period, history))
+  return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+class ForecastCache:
+  '''
+  Cache LRU con expiración de las proyecciones de estudiantes individuales.
+
+  Las solicitudes simultáneas de una misma llave se agrupan: la primera
+  calcula la proyección y las demás esperan su resultado, por lo que cada
+  historial se proyecta una sola vez. Los errores no se almacenan.
+
+  Parámetros:
+
+  max_entries - Cantidad máxima de proyecciones almacenadas.
+
+  ttl - Segundos que una proyección permanece válida. None para no expirar.
+  '''
+  def __init__(self, max_entries: int = 1024, ttl: float | None = 3600.0):
+    if max_entries < 1:
+      raise ValueError(f'max_entries must be at least 1, got {max_entries}')
+
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.evictions = 0
+    self._entries : OrderedDict[str, tuple[Any, float]] = OrderedDict()
+    self._inflight : dict[str, Future] = {}
+    self._lock = threading.Lock()
+
+  def get_or_compute(self, key: str, compute: Callable[[], Any]) -> tuple[Any, str]:
+    '''
+    Método para obtener la proyección de una llave, calculándola si no está
+    almacenada.
+
+    Este método retorna la proyección y el origen del resultado: "hit",
+    "miss" (calculada por esta solicitud) o "coalesced" (calculada por otra
+    solicitud simultánea).
+    '''
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        if self.ttl is None or time.monotonic() - entry[1] < self.ttl:
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return entry[0], 'hit'
+        del self._entries[key]
+
+      future = self._inflight.get(key)
+      leader = future is None
+      if leader:
+        future = self._inflight[key] = Future()
+        self.misses += 1
+      else:
+        self.coalesced += 1
+
+    if not leader:
+      return future.result(), 'coalesced'
+
+    try:
+      value = compute()
+    except BaseException as error:
+      with self._lock:
+        del self._inflight[key]
+      future.set_exception(error)
+      raise
+
+    with self._lock:
+      self._entries[key] = (value, time.monotonic())
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+      del self._inflight[key]
+    future.set_result(value)
+
+    return value, 'miss'
+
+  def get(self, key: str) -> Any | None:
+    '''
+    Retorna la proyección almacenada de una llave (contada como "hit") o
+    None si no está almacenada o expiró, sin calcularla.
+    '''
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None or (self.ttl is not None and time.monotonic() - entry[1] >= self.ttl):
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[0]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self) -> dict:
+    return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'evictions': self.evictions}
+
+  def __str__(self):
+    return f"Forecast Cache: {len(self._entries)} entries, {self.hits} hits, {self.misses} misses, {self.coalesced} coalesced"
+
+  def __repr__(self):
+    return f'ForecastCache(max_entries="{self.max_entries}", ttl="{self.ttl}")'
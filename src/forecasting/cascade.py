@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+# límites de los grupos de largo y de coeficiente de variación de las series
+LENGTH_BINS = [6, 9, 12, 16]
+CV_BINS = [0.01, 0.05, 0.1, 0.25]
+
+
+def series_profile(y, competency: str = '') -> str:
+  '''
+  Retorna el grupo de una serie de entrenamiento: la competencia, el largo
+  y el coeficiente de variación (desviación / media), agrupados con
+  LENGTH_BINS y CV_BINS para que la escala de la serie no importe.
+  '''
+  y = np.asarray(y, dtype=np.float64)
+  mean = float(np.abs(y.mean())) if len(y) else 0.0
+  cv = float(y.std()) / mean if mean > 0 else 0.0
+  return f'{competency}|n{int(np.searchsorted(LENGTH_BINS, len(y), side="right"))}|cv{int(np.searchsorted(CV_BINS, cv, side="right"))}'
+
+
+class CascadeStats():
+  '''
+  Tabla de victorias de los modelos de la cascada por grupo de serie (ver
+  series_profile), utilizada para ordenar la cascada de cada serie.
+
+  Con al menos min_samples series en el grupo los candidatos se intentan
+  de más a menos victorias y se mantiene la regla del umbral: se retorna el
+  primero con rmse menor o igual a RMSE_THRESHOLD. Los candidatos que
+  ganaron menos de min_win_rate de las veces solo se intentan si ninguno
+  de los anteriores produjo una proyección. Una de cada explore_every
+  series usa el orden original sin omitir candidatos; la elección depende
+  solo de los valores de la serie (ver explores), por lo que no cambia
+  entre procesos ni entre ejecuciones.
+
+  La tabla cuenta el ganador de la cascada en el orden original: solo se
+  registran las series proyectadas en ese orden, ya que en una cascada
+  reordenada los modelos favorecidos ganan más y los omitidos no pueden
+  ganar.
+
+  Los procesos no modifican la tabla: CompPerformancePredictor deja los
+  ganadores en self.wins y BatchForecaster / ForecastPipeline los suman con
+  update al terminar la ejecución, por lo que el orden de la cascada no
+  cambia durante una ejecución (ver fingerprint).
+
+  Parámetros:
+
+  min_samples - Series de un grupo necesarias para reordenar su cascada.
+
+  min_win_rate - Proporción de victorias bajo la cual un candidato se omite.
+
+  explore_every - Cada cuántas series de un grupo se usa el orden original.
+  '''
+  def __init__(self, min_samples: int = 20, min_win_rate: float = 0.05, explore_every: int = 20):
+    self.min_samples = min_samples
+    self.min_win_rate = min_win_rate
+    self.explore_every = explore_every
+    self.wins : dict[str, dict[str, int]] = {}
+    self._version = 0
+    self._fingerprint : tuple | None = None
+    self._lock = threading.Lock()
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_lock'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def explores(self, y) -> bool:
+    '''
+    Indica si la serie y se proyecta con el orden original, para una de
+    cada explore_every series según el hash de sus valores.
+    '''
+    if not self.explore_every:
+      return False
+    digest = hashlib.blake2b(np.asarray(y, dtype=np.float64).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % self.explore_every == 0
+
+  def plan(self, profile: str, models: list[str], y = None) -> tuple[list[str], set[str]]:
+    '''
+    Retorna el orden en que se intentan los modelos de una serie y los que
+    se omiten si ya se obtuvo una proyección. Con la serie de entrenamiento
+    y se aplica la exploración (ver explores).
+    '''
+    if y is not None and self.explores(y):
+      return list(models), set()
+
+    with self._lock:
+      wins = dict(self.wins.get(profile, {}))
+
+    total = sum(wins.get(model, 0) for model in models)
+    if total < self.min_samples:
+      return list(models), set()
+
+    # sorted es estable: los empates mantienen el orden original
+    order = sorted(models, key=lambda model: -wins.get(model, 0))
+    rare = {model for model in order[1:] if wins.get(model, 0) / total < self.min_win_rate}
+    return order, rare
+
+  def fingerprint(self, models: list[str]) -> str:
+    '''
+    Retorna la huella de los órdenes que la tabla aplica a la cascada
+    models, o una cadena vacía si no cambia el orden de ningún grupo. Solo
+    cambia cuando cambia el orden o los candidatos omitidos de algún grupo,
+    no con cada victoria.
+    '''
+    with self._lock:
+      version, profiles = self._version, sorted(self.wins)
+      if self._fingerprint is not None and self._fingerprint[:2] == (version, tuple(models)):
+        return self._fingerprint[2]
+
+    plans = [(profile, *self.plan(profile, models)) for profile in profiles]
+    plans = [(profile, order, sorted(rare)) for profile, order, rare in plans if order != list(models) or rare]
+    fingerprint = hashlib.blake2b(repr((self.explore_every, plans)).encode(), digest_size=8).hexdigest() if plans else ''
+
+    with self._lock:
+      self._fingerprint = (version, tuple(models), fingerprint)
+    return fingerprint
+
+  def update(self, wins: Iterable[tuple[str, str]]):
+    '''
+    Método para sumar los ganadores (grupo, modelo) de una o más series.
+    '''
+    with self._lock:
+      for profile, model in wins:
+        counts = self.wins.setdefault(profile, {})
+        counts[model] = counts.get(model, 0) + 1
+      self._version += 1
+
+  def win_rates(self) -> dict[str, dict[str, float]]:
+    with self._lock:
+      return {profile: {model: round(count / sum(counts.values()), 4) for model, count in counts.items()} for profile, counts in self.wins.items()}
+
+  def save(self, path: str):
+    if os.path.dirname(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+    with self._lock:
+      data = {'length_bins': LENGTH_BINS, 'cv_bins': CV_BINS, 'wins': self.wins}
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+      json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+  @classmethod
+  def load(cls, path: str, **kwargs) -> 'CascadeStats':
+    '''
+    Carga una tabla guardada con save. Una tabla con otros límites de grupos
+    no es comparable y se descarta.
+    '''
+    stats = cls(**kwargs)
+    try:
+      with open(path, 'r') as f:
+        data = json.load(f)
+    except (OSError, ValueError) as error:
+      raise ValueError(f'could not load the cascade stats: {error}')
+
+    if data.get('length_bins') == LENGTH_BINS and data.get('cv_bins') == CV_BINS:
+      stats.wins = {profile: dict(counts) for profile, counts in data['wins'].items()}
+    return stats
+
+  def __len__(self):
+    return len(self.wins)
+
+  def __str__(self):
+    return f"Cascade Stats: {len(self.wins)} profiles, {sum(sum(counts.values()) for counts in self.wins.values())} series"
+
+  def __repr__(self):
+    return f'CascadeStats(min_samples="{self.min_samples}", min_win_rate="{self.min_win_rate}", explore_every="{self.explore_every}")'
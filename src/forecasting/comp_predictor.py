@@ -1,8 +1,71 @@
+import copy
+import threading
+import warnings
 import pandas as pd
 import numpy as np
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
 from ..time_series import * 
+from ..profiling import metrics
+from .cascade import CascadeStats, series_profile
 from models.trend_prediction import TrendPrediction 
 
+RMSE_THRESHOLD = 0.05
+
+# límites sugeridos para los ajustes de cada estudiante, ver FitBudget. No se
+# aplican por defecto: con límites de tiempo el resultado depende de la carga
+# de la máquina y no debe guardarse en ForecastStore ni en ForecastCache
+DEFAULT_FIT_BUDGET = FitBudget(fit_seconds=2.0, student_seconds=20.0, maxiter=50)
+
+# modelos en el orden en que get_prediction_rmse los intenta
+CASCADE = [('ARMA', get_ARMA), ('ARIMA', get_ARIMA), ('SARIMAX', get_SARIMAX)]
+
+# estimadores cerrados para las series que no justifican la cascada (ver classify_series)
+FAST_PATHS = {
+  'constant': ('LAST_VALUE', get_last_value),
+  'linear': ('LINEAR_TREND', get_linear_trend),
+  'short': ('DAMPED_MEAN', get_damped_mean),
+}
+
+_manager = None
+
+def _stop_event(executor: Executor):
+  '''
+  Retorna un evento compartido con los ajustes enviados a executor: un
+  threading.Event para un ThreadPoolExecutor o el de un
+  multiprocessing.Manager (creado una sola vez) para un pool de procesos.
+  '''
+  global _manager
+  if isinstance(executor, ThreadPoolExecutor):
+    return threading.Event()
+  if _manager is None:
+    import multiprocessing
+    _manager = multiprocessing.Manager()
+  return _manager.Event()
+
+def weighted_avg(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+  '''
+  Calcula el promedio de "comp_performance" pesado por credits * weight
+  de cada grupo definido por "keys", ignorando las asignaturas sin créditos.
+
+  Los productos se calculan una sola vez sobre todas las filas y la
+  agrupación solo realiza sumas, sin llamar a Python por cada grupo.
+  '''
+  df = df[df['credits'] > 0]
+
+  weights = df['credits'].to_numpy(dtype=np.float64) * df['weight'].to_numpy(dtype=np.float64)
+  # .array conserva las columnas categóricas (se agrupa por sus códigos)
+  sums = (pd.DataFrame({key: df[key].array for key in keys} | {
+            'weighted': df['comp_performance'].to_numpy(dtype=np.float64) * weights,
+            'weights': weights,
+          })
+          .groupby(keys, sort=True, observed=True)[['weighted','weights']]
+          .sum())
+
+  result = (sums['weighted'] / sums['weights']).rename('comp_performance').reset_index()
+
+  return result
+
 class CompPerformancePredictor():
   '''
   Clase para la generación de las predicciones de desempeño del estudiante
@@ -14,10 +77,53 @@ class CompPerformancePredictor():
 
   pred_data - Version formateada del set de datos para la generación de
   las proyecciones.
+
+  executor - Executor opcional (p. ej. un ProcessPoolExecutor) para ajustar
+  los modelos de la cascada de forma concurrente. Con un ThreadPoolExecutor
+  la ganancia es limitada, ya que los ajustes de statsmodels retienen el GIL.
+
+  model_store - ModelStore opcional con los parámetros ajustados en
+  ejecuciones anteriores. Cuando el estudiante solo agregó periodos nuevos
+  los modelos se actualizan en lugar de reajustarse. No se utiliza en el
+  modo concurrente (se emite un aviso).
+
+  student_id - Identificador del estudiante, parte de la llave del
+  model_store. Es obligatorio si se recibe un model_store.
+
+  budget - FitBudget opcional con los límites de tiempo e iteraciones de
+  los ajustes del estudiante (p. ej. DEFAULT_FIT_BUDGET). Por defecto no se
+  limitan, para que un mismo historial genere siempre la misma proyección.
+  Cuando se agota el tiempo del estudiante la cascada retorna el mejor
+  modelo obtenido o, si no hay ninguno, la proyección de respaldo
+  (DAMPED_MEAN). Los eventos quedan en budget.events.
+
+  cascade - CascadeStats opcional con las victorias de cada modelo por
+  grupo de serie, utilizado para ordenar la cascada. Los ganadores de las
+  series de este estudiante proyectadas en el orden original quedan en
+  wins (grupo, modelo) y no se agregan a la tabla.
+
+  routes - Cantidad de series proyectadas por cada ruta de classify_series.
+
+  predictions - Proyección seleccionada (modelo y rmse) por competencia.
   '''
-  def __init__(self, data: pd.DataFrame):
+  def __init__(self, data: pd.DataFrame, executor: Executor | None = None, model_store: ModelStore | None = None, student_id: str = '',
+               budget: FitBudget | None = None, cascade: CascadeStats | None = None):
     self.data : pd.DataFrame = data
-    self.pred_data : pd.DataFrame = self.get_weighted_avg(self.data)
+    self.executor = executor
+    if model_store is not None and not student_id:
+      raise ValueError('student_id is required to use the model store')
+    self.model_store = model_store
+    if executor is not None and model_store is not None:
+      warnings.warn('the model store is not used when the cascade runs concurrently', RuntimeWarning, stacklevel=2)
+    self.student_id = student_id
+    self.fit_budget = budget
+    self.budget = budget.start() if budget is not None else None
+    self.cascade = cascade
+    self.wins : list[tuple[str, str]] = []
+    self.routes : dict[str, int] = {}
+    self.predictions : dict[str, TrendPrediction] = {}
+    with metrics.timer('weighted_avg'):
+      self.pred_data : pd.DataFrame = self.get_weighted_avg(self.data)
 
 
   def forecast_competency_performance(self, df: pd.DataFrame | None = None):
@@ -41,26 +147,28 @@ class CompPerformancePredictor():
       comp_performance: float
     }
     """
-    if df is None:
+    # el tiempo del estudiante corre desde aquí
+    self.budget = self.fit_budget.start() if self.fit_budget is not None else None
+
+    if df is None or df is self.data:
       if self.pred_data is None:
-        df = self.data
-        df = self.get_weighted_avg(df)
-      else:
-        df = self.pred_data
+        self.pred_data = self.get_weighted_avg(self.data)
+      df = self.pred_data
     else:
-      df = self.data
       df = self.get_weighted_avg(df)
 
     results = []
 
     for competency in df['competency'].unique():
       # print('current_comp: ',competency)
-      competency_regs = df[df['competency'] == competency].reset_index(drop=True)
+      with metrics.timer('competency_split'):
+        competency_regs = df[df['competency'] == competency].reset_index(drop=True)
       # print(f'comp {competency} regs: ')
       # print(competency_regs.head())
 
       # get predicted performance for the target period
-      results.append(self.get_predicted_comp_performance(competency_regs))
+      with metrics.timer('competency_forecast'):
+        results.append(self.get_predicted_comp_performance(competency_regs))
 
     merged_df = pd.concat(results)
 
@@ -82,19 +190,80 @@ class CompPerformancePredictor():
       df = self.data
 
     try:
-      df = df[df['credits'] > 0]
+      return weighted_avg(df, ['period','competency'])
+    except Exception as error:
+      raise (error)
 
-      # print(df.groupby(['period','competency']))
-      df = (df
-            .groupby(['period','competency'])
-            .apply(lambda x: (x['comp_performance'] * (x['credits'] * x['weight'])).sum() / (x['credits'] * x['weight']).sum())
-            .reset_index())
+  @staticmethod
+  def get_cohort_weighted_avg(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Variante institucional de get_weighted_avg.
 
-      df.rename(columns={0: 'comp_performance'}, inplace=True)
+    Recibe el DataFrame de todos los estudiantes de un lote (ver
+    models.student.cohort_to_frame, debe incluir la columna "student_id") y
+    retorna en una sola agrupación el promedio "pesado" de cada competencia
+    por estudiante y periodo.
+    '''
+    return weighted_avg(df, ['student_id','period','competency'])
 
-      return df
-    except Exception as error:
-      raise (error)
+  @staticmethod
+  def forecast_cohort_competency_performance(df: pd.DataFrame, diff: int = 2, alpha: float = 0.05) -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    Variante institucional de forecast_competency_performance basada en el
+    motor vectorizado get_batch_forecast.
+
+    Todas las series (estudiante, competencia) del lote se apilan en una
+    sola matriz y se proyectan a la vez, siguiendo el mismo esquema de
+    entrenamiento y prueba de get_predicted_comp_performance: se entrena sin
+    la última observación, se proyectan "diff" periodos y el último periodo
+    de cada serie toma el valor proyectado.
+
+    Parámetros:
+    df - DataFrame de todos los estudiantes del lote, debe incluir la columna
+    "student_id" (ver models.student.cohort_to_frame).
+
+    El método retorna una tupla con:
+
+    - El DataFrame de proyecciones {student_id, period, competency,
+      comp_performance}.
+    - Un DataFrame por serie {student_id, competency, model, rmse} con el
+      modelo seleccionado y el rmse sobre los periodos de prueba.
+    '''
+    wavg = CompPerformancePredictor.get_cohort_weighted_avg(df).sort_values(['student_id','competency','period'], ignore_index=True)
+
+    groups = wavg.groupby(['student_id','competency'], sort=False, observed=True)
+    row = groups.ngroup().to_numpy()
+    size = groups['comp_performance'].transform('size').to_numpy()
+    width = int(size.max()) if len(size) else 0
+    col = width - size + groups.cumcount().to_numpy()
+
+    Y = np.zeros((row.max() + 1 if len(row) else 0, width), dtype=np.float64)
+    mask = np.zeros(Y.shape, dtype=bool)
+    Y[row, col] = wavg['comp_performance'].to_numpy(dtype=np.float64)
+    mask[row, col] = True
+
+    # las series con una sola observación no tienen datos de entrenamiento
+    valid = mask.sum(axis=1) >= 2
+    forecast = get_batch_forecast(Y[valid, :-1], mask[valid, :-1], steps=diff, alpha=alpha)
+
+    test = Y[valid, -diff:]
+    test_mask = mask[valid, -diff:]
+    with np.errstate(invalid='ignore'):
+      rmse = np.sqrt(np.where(test_mask, (test - forecast.forecasts) ** 2, 0).sum(axis=1) / test_mask.sum(axis=1))
+
+    values = Y.copy()
+    values[valid, -1] = forecast.forecasts[:, -1]
+    wavg['comp_performance'] = values[row, col]
+
+    keep = valid[row]
+    result = (wavg[keep]
+              .sort_values(by=['student_id','period','competency'])
+              .reset_index(drop=True))
+
+    keys = wavg.loc[groups.head(1).index, ['student_id','competency']].reset_index(drop=True)[valid]
+    summary = keys.assign(model=forecast.model, rmse=np.round(rmse, 2)).reset_index(drop=True)
+
+    return result, summary
 
   def get_predicted_comp_performance(self, df: pd.DataFrame, target: str = 'comp_performance', diff:int=2):
     '''
@@ -120,7 +289,10 @@ class CompPerformancePredictor():
 
     # try to get predicted performance with each method type
     try:
-      pred = self.get_prediction_rmse(train,test,target)
+      trend = self.__predict(train,test,target)
+      if 'competency' in df.columns and len(df.index) > 0:
+        self.predictions[str(df['competency'].iloc[0])] = trend
+      pred = trend.pred
 
       # print('pre test')
       # print(test.head())
@@ -144,6 +316,7 @@ class CompPerformancePredictor():
       return result 
 
     except ValueError as error:
+      metrics.inc('prediction_errors')
       print("Error predicting the performance for the target competency,", error)
       return
 
@@ -168,52 +341,125 @@ class CompPerformancePredictor():
     - rmse - El valor del rmse de las predicciones.
 
     '''
-    pred_a = TrendPrediction()
-    pred_b = TrendPrediction()
-    pred_c = TrendPrediction()
+    return self.__get_cascade_prediction(train, test, target).pred
 
+  def __get_cascade_prediction(self, train : pd.DataFrame, test: pd.DataFrame, target: str = 'comp_performance') -> TrendPrediction:
     try:
-      # sf = TrendSeriesForcaster(target)
-      # print('ARMA')
-      pred_a.pred = get_ARMA(train,test,target=target)
-      # print("a: ",pred_a.pred.head())
-      pred_a.rmse = get_rmse(test,pred_a.pred)
-      # print('ARMA rmse: ',pred_a.rmse)
+      models = [model for model, _ in CASCADE]
+      order, rare, profile = models, set(), None
+      if self.cascade is not None:
+        profile = series_profile(train[target], str(train['competency'].iloc[0]) if 'competency' in train.columns and len(train.index) else '')
+        order, rare = self.cascade.plan(profile, models, train[target].to_numpy(dtype=np.float64))
+
+      if self.executor is not None:
+        trend = self.__get_concurrent_prediction_rmse(train, test, target, order, rare)
+      else:
+        candidates = {model: partial(get_prediction, train, test, target=target, budget=self.budget, **self.__store_kwargs(model, train)) for model, get_prediction in CASCADE}
+        trend = self.__select_prediction(test, [(model, candidates[model]) for model in order], partial(self.__get_fallback_prediction, train, test, target), rare)
 
+      # una cascada reordenada favorece a los modelos que ya ganaban, solo se cuenta el orden original
+      if profile is not None and trend is not None and order == models and not rare:
+        self.wins.append((profile, trend.model))
+      return trend
+    except Exception as error:
+      raise ValueError('there was an error trying to get the predictions, ', error)
 
-      if pred_a.rmse > 0.05:
-         lowest = pred_a
+  def __predict(self, train : pd.DataFrame, test: pd.DataFrame, target: str = 'comp_performance') -> TrendPrediction:
+    '''
+    Clasifica la serie de entrenamiento y la proyecta con un estimador
+    cerrado (FAST_PATHS) o, si es lo bastante larga y variable, con la
+    cascada de get_prediction_rmse.
+    '''
+    route = classify_series(train[target].to_numpy(dtype=np.float64))
+    self.routes[route] = self.routes.get(route, 0) + 1
+    metrics.inc('series', route=route)
 
-        #  print('ARIMA')
-         pred_b.pred = get_ARIMA(train,test,target=target)
-        #  print("b: ",pred_b.pred.head())
-         pred_b.rmse = get_rmse(test,pred_b.pred)
-        #  print('ARIMA rmse: ',pred_b.rmse)
+    if route not in FAST_PATHS:
+      trend = self.__get_cascade_prediction(train,test,target)
+      metrics.inc('selected_model', model=trend.model if trend is not None else '')
+      return trend
 
+    model, get_prediction = FAST_PATHS[route]
+    try:
+      with metrics.timer('fast_path', model=model):
+        pred = get_prediction(train,test,target=target)
+      metrics.inc('selected_model', model=model)
+      return TrendPrediction(pred, get_rmse(test,pred), model)
+    except Exception as error:
+      raise ValueError('there was an error trying to get the predictions, ', error)
 
+  def __store_kwargs(self, model: str, train: pd.DataFrame) -> dict:
+    if self.model_store is None or 'competency' not in train.columns or len(train.index) == 0:
+      return {}
+    return {'store': self.model_store, 'store_key': (str(self.student_id), str(train['competency'].iloc[0]), model)}
 
-         if pred_b.rmse > 0.05:
-            if pred_b.rmse < lowest.rmse:
-              lowest = pred_b
-            
-            # print('SARIMAX')
-            pred_c.pred = get_SARIMAX(train,test,target=target)
-            # print("c",pred_c.pred.head())
-            pred_c.rmse = get_rmse(test,pred_c.pred)
-            # print('SARIMAX rmse: ',pred_c.rmse)
+  def __get_concurrent_prediction_rmse(self, train : pd.DataFrame, test: pd.DataFrame, target: str = 'comp_performance',
+                                       order: list[str] | None = None, rare: set[str] = frozenset()) -> TrendPrediction:
+    '''
+    Variante concurrente de get_prediction_rmse.
+
+    Envía los modelos de la cascada (en el orden de order) al executor al
+    mismo tiempo y evalúa sus resultados en ese orden, por lo que el modelo
+    seleccionado es el mismo que en la versión secuencial. En cuanto se
+    selecciona un modelo se cancelan los ajustes pendientes y se activa el
+    evento stop del FitBudget de los ajustes, que interrumpe los que ya
+    iniciaron en su siguiente iteración (ver fit_model).
+    '''
+    functions = dict(CASCADE)
+    stop = _stop_event(self.executor)
+    budget = copy.copy(self.budget) if self.budget is not None else FitBudget()
+    budget.stop = stop
 
+    futures = [(model, self.executor.submit(functions[model], train, test, target=target, budget=budget)) for model in order or functions]
 
+    try:
+      return self.__select_prediction(test, [(model, future.result) for model, future in futures], partial(self.__get_fallback_prediction, train, test, target), rare)
+    finally:
+      stop.set()
+      for _, future in futures:
+        future.cancel()
+
+  def __get_fallback_prediction(self, train : pd.DataFrame, test: pd.DataFrame, target: str = 'comp_performance') -> TrendPrediction:
+    model, get_prediction = FAST_PATHS['short']
+    pred = get_prediction(train, test, target=target)
+    return TrendPrediction(pred, get_rmse(test, pred), model)
+
+  def __select_prediction(self, test: pd.DataFrame, candidates: list, fallback = None, rare: set[str] = frozenset()) -> TrendPrediction:
+    '''
+    Recorre los candidatos (modelo, función que retorna sus proyecciones) en
+    orden y retorna el primero con un rmse menor o igual a RMSE_THRESHOLD o,
+    si ninguno lo cumple, el de menor rmse.
 
-            if pred_c.rmse > 0.05:
-              if pred_c.rmse < lowest.rmse:
-                lowest = pred_c
-            else:
-              return pd.DataFrame(pred_c.pred)
-         else:
-            return pd.DataFrame(pred_b.pred)
+    Si se agota el tiempo del estudiante (ver budget) no se intentan más
+    candidatos y se retorna el de menor rmse obtenido o, si no se obtuvo
+    ninguno, el resultado de fallback.
+
+    Los candidatos de rare (ver CascadeStats.plan) solo se intentan si aún
+    no se obtuvo ninguna proyección.
+    '''
+    lowest = None
+
+    for model, get_pred in candidates:
+      if self.budget is not None and self.budget.exhausted():
+        self.budget.record(model, 'student_time')
+        break
+
+      if model in rare and lowest is not None:
+        metrics.inc('cascade_skipped', model=model)
+        continue
+
+      metrics.inc('cascade_attempts', model=model)
+      pred = TrendPrediction(model=model)
+      with metrics.timer('cascade_candidate', model=model):
+        pred.pred = get_pred()
+      pred.rmse = get_rmse(test,pred.pred)
+
+      if pred.rmse > RMSE_THRESHOLD:
+        if lowest is None or pred.rmse < lowest.rmse:
+          lowest = pred
       else:
-        return pd.DataFrame(pred_a.pred)
-      return lowest.pred
-    except Exception as error:
-      raise ValueError('there was an error trying to get the predictions, ', error)
-      return {"error": error}
+        return pred
+
+    if lowest is None and fallback is not None:
+      return fallback()
+    return lowest
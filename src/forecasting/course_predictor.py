@@ -1,5 +1,193 @@
+import json
+import os
+from typing import Iterable
+
+import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
+
+from models.student import Student
+from ..profiling import metrics
+
+REGRESSION_FEATURES = ['comp_performance','weight']
+
+
+class LinearModel():
+  '''
+  Regresión lineal ya ajustada (coeficientes e intercepto), con la misma
+  interfaz de predict que LinearRegression.
+  '''
+  def __init__(self, coef: np.ndarray, intercept: float):
+    self.coef_ = np.asarray(coef, dtype=np.float64)
+    self.intercept_ = float(intercept)
+
+  def predict(self, X) -> np.ndarray:
+    return np.asarray(X, dtype=np.float64) @ self.coef_ + self.intercept_
+
+  def __repr__(self):
+    return f'LinearModel(coef="{self.coef_}", intercept="{self.intercept_}")'
+
+
+class PooledCourseModel():
+  '''
+  Regresión lineal de "numerical_grade" sobre REGRESSION_FEATURES ajustada
+  una sola vez con las filas de todos los estudiantes de una institución,
+  en lugar de una regresión por estudiante con sus pocas filas.
+
+  El ajuste se hace en una pasada acumulando las sumas de mínimos
+  cuadrados, por lo que los estudiantes pueden recorrerse por páginas sin
+  mantener sus DataFrames en memoria. Con corrección por estudiante se
+  guarda además el residuo medio de cada estudiante, encogido hacia cero
+  según su cantidad de filas:
+
+    corrección = suma de residuos / (filas + shrinkage)
+
+  for_student retorna un LinearModel con el intercepto corregido, que se
+  pasa como "regression" a CoursePerformancePredictor, por lo que la
+  proyección de las asignaturas solo evalúa el modelo.
+
+  Parámetros:
+
+  coef - Coeficientes de REGRESSION_FEATURES.
+
+  intercept - Intercepto del modelo de la institución.
+
+  corrections - Diccionario opcional student_id -> corrección del intercepto.
+
+  shrinkage - Filas "virtuales" sin residuo usadas para encoger las
+  correcciones de los estudiantes con pocas filas.
+  '''
+  def __init__(self, coef: np.ndarray, intercept: float, corrections: dict[str, float] | None = None, shrinkage: float = 10.0, rows: int = 0):
+    self.coef = np.asarray(coef, dtype=np.float64)
+    self.intercept = float(intercept)
+    self.corrections = corrections or {}
+    self.shrinkage = shrinkage
+    self.rows = rows
+
+  @classmethod
+  def fit(cls, df: pd.DataFrame, correct_students: bool = True, shrinkage: float = 10.0) -> 'PooledCourseModel':
+    '''
+    Ajusta el modelo con el DataFrame de un lote de estudiantes.
+
+    Parámetros:
+    df - DataFrame de todos los estudiantes, debe incluir la columna
+    "student_id" (ver models.student.cohort_to_frame).
+
+    correct_students - Si es verdadero se calcula la corrección de cada
+    estudiante.
+
+    shrinkage - Ver PooledCourseModel.
+    '''
+    return cls.fit_frames(((student, frame) for student, frame in df.groupby('student_id', sort=False, observed=True)), correct_students, shrinkage)
+
+  @classmethod
+  def fit_students(cls, students: Iterable[Student], correct_students: bool = True, shrinkage: float = 10.0) -> 'PooledCourseModel':
+    '''
+    Ajusta el modelo recorriendo los estudiantes una sola vez (p. ej.
+    DB_API.iter_students de una institución).
+    '''
+    return cls.fit_frames(((str(student.student_id), student.to_frame()) for student in students), correct_students, shrinkage)
+
+  @classmethod
+  def fit_frames(cls, frames: Iterable[tuple[str, pd.DataFrame]], correct_students: bool = True, shrinkage: float = 10.0) -> 'PooledCourseModel':
+    width = len(REGRESSION_FEATURES)
+    xtx = np.zeros((width, width))
+    xty = np.zeros(width)
+    x_sum = np.zeros(width)
+    y_sum = 0.0
+    rows = 0
+    # filas, suma de X y suma de y de cada estudiante, suficientes para sus residuos
+    students : dict[str, tuple[int, np.ndarray, float]] = {}
+
+    for student_id, frame in frames:
+      if frame.empty:
+        continue
+      X = frame[REGRESSION_FEATURES].to_numpy(dtype=np.float64)
+      y = frame['numerical_grade'].to_numpy(dtype=np.float64)
+
+      xtx += X.T @ X
+      xty += X.T @ y
+      x_sum += X.sum(axis=0)
+      y_sum += y.sum()
+      rows += len(y)
+      if correct_students:
+        n, sx, sy = students.get(str(student_id), (0, np.zeros(width), 0.0))
+        students[str(student_id)] = (n + len(y), sx + X.sum(axis=0), sy + y.sum())
+
+    if rows == 0:
+      raise ValueError('could not fit the pooled course model: there are no rows')
+
+    # igual que LinearRegression: datos centrados y solución de norma mínima
+    x_mean = x_sum / rows
+    y_mean = y_sum / rows
+    sxx = xtx - rows * np.outer(x_mean, x_mean)
+    sxy = xty - rows * x_mean * y_mean
+    coef = np.linalg.pinv(sxx, hermitian=True) @ sxy
+    intercept = y_mean - x_mean @ coef
+
+    corrections = {student_id: float((sy - sx @ coef - n * intercept) / (n + shrinkage)) for student_id, (n, sx, sy) in students.items()}
+
+    return cls(coef, intercept, corrections, shrinkage, rows)
+
+  def for_student(self, student_id) -> LinearModel:
+    '''
+    Retorna el modelo de un estudiante: el de la institución con el
+    intercepto corregido si el estudiante formó parte del ajuste.
+    '''
+    return LinearModel(self.coef, self.intercept + self.corrections.get(str(student_id), 0.0))
+
+  def predict(self, X, student_id = None) -> np.ndarray:
+    return self.for_student(student_id).predict(X)
+
+  def save(self, path: str):
+    '''
+    Guarda el modelo en un archivo json, escrito en un archivo temporal y
+    renombrado para que los procesos no lean un archivo incompleto.
+    '''
+    if os.path.dirname(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+      json.dump({'features': REGRESSION_FEATURES, 'coef': self.coef.tolist(), 'intercept': self.intercept,
+                 'shrinkage': self.shrinkage, 'rows': self.rows, 'corrections': self.corrections}, f)
+    os.replace(tmp, path)
+
+  @classmethod
+  def load(cls, path: str) -> 'PooledCourseModel':
+    try:
+      with open(path, 'r') as f:
+        data = json.load(f)
+    except (OSError, ValueError) as error:
+      raise ValueError(f'could not load the pooled course model: {error}')
+
+    if data.get('features') != REGRESSION_FEATURES:
+      raise ValueError(f'could not load the pooled course model: it was fitted on {data.get("features")}')
+    return cls(data['coef'], data['intercept'], data['corrections'], data['shrinkage'], data['rows'])
+
+  def __str__(self):
+    return f"Pooled Course Model: {self.rows} rows, {len(self.corrections)} student corrections"
+
+  def __repr__(self):
+    return f'PooledCourseModel(coef="{self.coef}", intercept="{self.intercept}", shrinkage="{self.shrinkage}")'
+
+
+_course_models : dict[str, tuple[float, PooledCourseModel]] = {}
+
+
+def load_course_model(course_model: 'PooledCourseModel | str | None') -> PooledCourseModel | None:
+  '''
+  Resuelve el modelo de asignaturas recibido por un proceso: una instancia
+  se retorna tal cual y una ruta se carga una sola vez por proceso (y de
+  nuevo si el archivo cambia).
+  '''
+  if course_model is None or isinstance(course_model, PooledCourseModel):
+    return course_model
+
+  mtime = os.path.getmtime(course_model)
+  cached = _course_models.get(course_model)
+  if cached is None or cached[0] != mtime:
+    cached = _course_models[course_model] = (mtime, PooledCourseModel.load(course_model))
+  return cached[1]
+
 
 class CoursePerformancePredictor():
   '''
@@ -22,9 +210,59 @@ class CoursePerformancePredictor():
 
   '''
 
-  def __init__(self, data: pd.DataFrame, predicted_comp_performance: pd.DataFrame):
+  def __init__(self, data: pd.DataFrame, predicted_comp_performance: pd.DataFrame, regression = None):
     self.data = data
     self.predicted_comp_performance = predicted_comp_performance
+    self.regression = regression
+    self.__index = None
+
+  def get_regression(self):
+    '''
+    Retorna la regresión lineal del desempeño en las asignaturas
+    ("numerical_grade") sobre "comp_performance" y "weight".
+
+    Se ajusta una sola vez sobre los datos del estudiante y se reutiliza en
+    la predicción de todas sus asignaturas. Puede recibirse ya ajustada en el
+    constructor (ver fit_cohort_regressions y PooledCourseModel.for_student).
+    '''
+    if self.regression is None:
+      with metrics.timer('course_regression'):
+        self.regression = self.__fit_regression(self.data)
+    return self.regression
+
+  @staticmethod
+  def fit_cohort_regressions(df: pd.DataFrame) -> dict:
+    '''
+    Ajusta la regresión de cada estudiante de un lote con mínimos cuadrados
+    en forma cerrada, resolviendo todos los sistemas a la vez.
+
+    Parámetros:
+    df - DataFrame de todos los estudiantes del lote, debe incluir la columna
+    "student_id" (ver models.student.cohort_to_frame).
+
+    Este método retorna un diccionario student_id -> LinearModel, que puede
+    pasarse como "regression" al constructor.
+    '''
+    codes, students = pd.factorize(df['student_id'])
+    X = df[REGRESSION_FEATURES].to_numpy(dtype=np.float64)
+    y = df['numerical_grade'].to_numpy(dtype=np.float64)
+
+    count = np.bincount(codes, minlength=len(students)).astype(np.float64)
+    x_mean = np.stack([np.bincount(codes, X[:, i], len(students)) for i in range(X.shape[1])], axis=1) / count[:, None]
+    y_mean = np.bincount(codes, y, len(students)) / count
+
+    # igual que LinearRegression: se centran los datos y se toma la solución de norma mínima
+    Xc = X - x_mean[codes]
+    yc = y - y_mean[codes]
+    sxx = np.zeros((len(students), X.shape[1], X.shape[1]))
+    np.add.at(sxx, codes, Xc[:, :, None] * Xc[:, None, :])
+    sxy = np.zeros((len(students), X.shape[1]))
+    np.add.at(sxy, codes, Xc * yc[:, None])
+
+    coef = np.einsum('nij,nj->ni', np.linalg.pinv(sxx, hermitian=True), sxy)
+    intercept = y_mean - np.einsum('ni,ni->n', x_mean, coef)
+
+    return {student: LinearModel(coef[i], intercept[i]) for i, student in enumerate(students)}
 
   def forecast_courses_performance(self,period:str,df: pd.DataFrame | None = None):
     '''
@@ -48,19 +286,7 @@ class CoursePerformancePredictor():
       df = self.data
 
     try:
-      period_df = df[df['period'] == period]
-
-      courses_performance = []
-
-      # print('periods')
-      # print(period_df['course_id'].unique())
-
-      for course in period_df['course_id'].unique():
-        courses_performance.append(self.predict_course_performance(course,df))
-
-      # print(courses_performance)
-
-      return pd.concat(courses_performance)
+      return self.__predict_courses(df[df['period'] == period]['course_id'].unique(), df)
     except Exception as e:
       raise Exception(f"Error in predict_courses_performance: {e}")
 
@@ -86,125 +312,97 @@ class CoursePerformancePredictor():
     try:
       print("Course Performance Prediction")
 
-      course_data = df[df['course_id'] == course]
-      # print("Course Data")
-      # print(course_data)
-      period = course_data['period'].unique()[0]
-      # print('period')
-      # print(period)
-
-      competences = []
-
-      for competence in course_data['competency'].unique():
-        weight = (course_data[course_data['competency'] == competence]['weight']
-                  .unique()[0])
-        # print("Weight")
-        # print(weight)
-        grade = (course_data[course_data['competency'] == competence]['numerical_grade']
-                .unique()[0])
-        # print("Grade")
-        # print(grade)
+      return self.__predict_courses([course], df)
+    except Exception as e:
+      raise Exception(f"Error en predict_course_performance: {e}")
 
-        pred_perf = self.predicted_comp_performance[self.predicted_comp_performance['competency'] == competence]
-        pred_perf['weight'] = weight
-        pred_perf['numerical_grade'] = grade
+  def __predict_courses(self, courses, df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Calcula la calificación proyectada de un conjunto de asignaturas como el
+    promedio entre:
 
-        # print("Predicted Competency Performance")
-        # print(pred_perf)
+    - el promedio de las proyecciones de sus competencias pesado por el peso
+      de cada competencia en la asignatura (escalado a 4 puntos), y
+    - la regresión lineal del estudiante evaluada en el desempeño proyectado
+      y el peso de la primera competencia de la asignatura,
 
-        competences.append(pred_perf[pred_perf['period'] == period])
+    limitado a 4.0.
 
-      # print("Competency Performance Prediction")
-      # print(competences)
+    Ambos cálculos se hacen a la vez para todas las asignaturas con las
+    tablas de __get_index, sin recorrer las competencias una por una.
 
-      comp_df = pd.concat(competences)
-      # print(comp_df)
+    Este método retorna las filas de df de las asignaturas con la columna
+    "predicted_grade" actualizada.
+    '''
+    positions, table = self.__get_index(df)
 
-      wavg_pred = self.__get_weighted_avg(comp_df) * 4
-      # print("Weighted avg prediciton: ", self.get_weighted_avg(comp_df) * 4)
-      mvlr_pred = self.__get_regressed_course_performance(comp_df, self.data)
-      # print("Grade predicition: ", self.__get_regressed_course_performance(comp_df, self.data))
+    table = table[table['course_id'].isin(courses)]
+    missing = [course for course in courses if course not in set(table['course_id'])]
+    if missing:
+      raise ValueError(f'there is no predicted competency performance for the courses {missing}')
 
-      course_data['predicted_grade'] = (wavg_pred + mvlr_pred) / 2
-      course_data['predicted_grade'] = course_data['predicted_grade'].clip(upper=4.0)
-      # course_data.clip(lower{'predicted_grade': 4.0}, inplace=True)
+    sums = (pd.DataFrame({
+              'course_id': table['course_id'].array,
+              'weighted': table['comp_performance'].to_numpy(dtype=np.float64) * table['weight'].to_numpy(dtype=np.float64),
+              'weight': table['weight'].to_numpy(dtype=np.float64),
+            })
+            .groupby('course_id', sort=False, observed=True)[['weighted','weight']]
+            .sum())
+    wavg_pred = (sums['weighted'] / sums['weight']).round(2) * 4
 
-      return course_data
-    except Exception as e:
-      raise Exception(f"Error en predict_course_performance: {e}")
+    # una sola llamada a predict para todas las asignaturas
+    first = table.drop_duplicates('course_id').set_index('course_id')
+    mvlr_pred = pd.Series(np.round(self.get_regression().predict(first[REGRESSION_FEATURES]), 2), index=first.index)
 
-  def __get_weighted_avg(self, df: pd.DataFrame):
-    '''
-    Método para el cálculo del promedio pesado de las proyecciones de estudiantes.
+    predicted_grade = ((wavg_pred + mvlr_pred.reindex(wavg_pred.index)) / 2).clip(upper=4.0)
 
-    Esta permite calcular el desempeño académico directamente en base a las
-    predicciones de desempeño en las competencias de la asignatura.
+    result = df.iloc[np.concatenate([positions[course] for course in courses])].copy()
+    # reindex en vez de map: map sobre una columna categórica retorna otra categórica
+    result['predicted_grade'] = predicted_grade.reindex(result['course_id']).to_numpy(dtype=np.float64)
 
-    Parámetros:
-    df - Es un DataFrame que contiene los datos referentes a una asignatura
-    determinada.
+    return result
 
-    Valor retornado:
-    La función retorna un valor numérico que representa el desempeño académico
-    proyectado de la asignatura en cuestión.
+  def __get_index(self, df: pd.DataFrame):
     '''
-    comp_weight = 0
-    weights = 0
-    for competency in df['competency'].unique():
-      comp_perf = df[df['competency'] == competency]['comp_performance'].unique()[0]
-      weight = df[df['competency'] == competency]['weight'].unique()[0]
-      comp_weight += comp_perf * weight
-      weights += weight
+    Construye (una vez por DataFrame) los índices usados en las predicciones:
 
-    return round(comp_weight/weights, 2)
+    - course_id -> posiciones de las filas de la asignatura en df.
+    - Una tabla por (course_id, competency) con el peso de la competencia, la
+      calificación de la asignatura, el periodo de la asignatura y el
+      desempeño proyectado de la competencia en ese periodo, obtenido con un
+      merge sobre (competency, period) de predicted_comp_performance.
 
-  def __get_regressed_course_performance(self, target: pd.DataFrame,df: pd.DataFrame | None = None):
+    Como en la versión anterior, el periodo de una asignatura es el primero
+    en el que aparece y el peso y la calificación son los de la primera fila
+    de cada competencia.
     '''
-    Esta función es para conseguir las predicciones de desempeño académico
-    en la asignatura basado en las predicciones generadas de las competencias
-    manejadas para el periodo.
+    if self.__index is not None and self.__index[0] is df:
+      return self.__index[1], self.__index[2]
 
-    Parámetros:
-    Target - Es un DataFrame que contiene los datos referentes a una asignatura
-    determinada.
+    positions = df.groupby('course_id', sort=False, observed=True).indices
+    course_period = df.drop_duplicates('course_id').set_index('course_id')['period']
 
-    df - Es un DataFrame opcional para pasar un set de datos con los datos
-    de las predicciones de desempeño de las competencias y el desempeño
-    logrado por el estudiante en los periodos anteriores.
+    competences = df.drop_duplicates(['course_id','competency'])[['course_id','competency','weight','numerical_grade']]
+    competences['period'] = course_period.reindex(competences['course_id']).array
 
-    Valor retornado:
-    La función retorna un valor numérico que representa el desempeño académico
-    proyectado de la asignatura en cuestión.
-    '''
-    if df is None:
-      df = self.data
-
-    # comp_map = {'C1':1,'C2':2,'C3':3,'C4':4,'C5':5,'C6':6}
-
-    # print('df')
-    # print(df.head())
+    predicted = (self.predicted_comp_performance[['period','competency','comp_performance']]
+                 .drop_duplicates(['competency','period']))
+    table = competences.merge(predicted, on=['competency','period'], how='inner')
 
-    # print('target')
-    # print(target.head())
+    self.__index = (df, positions, table)
+    return positions, table
 
+  @staticmethod
+  def __fit_regression(df: pd.DataFrame):
+    # comp_map = {'C1':1,'C2':2,'C3':3,'C4':4,'C5':5,'C6':6}
     # df['competency_'] = df['competency'].apply(lambda x: comp_map[x])
 
-    X = df[['comp_performance','weight']]
+    from sklearn.linear_model import LinearRegression
+
+    X = df[REGRESSION_FEATURES]
     y = df['numerical_grade']
 
     regr = LinearRegression()
     regr.fit(X,y)
 
-    target_X = []
-    for competency in target['competency'].unique():
-      t = target[target['competency'] == competency].copy()
-      # print(t.head())
-      target_weight = t['weight'].unique()[0]
-      target_comp_perf = t['comp_performance'].unique()[0]
-
-      target_X.append([target_comp_perf,target_weight])
-
-
-    df = pd.DataFrame(target_X)
-
-    return round(regr.predict(df)[0],2)
+    return regr
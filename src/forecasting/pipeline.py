@@ -0,0 +1,311 @@
+import asyncio
+import os
+import time
+from typing import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from models.forecast_result import ForecastResult
+from ..profiling import metrics
+from .batch import _init_worker, _forecast_chunk, source_report
+
+_DONE = object()
+
+
+class StageStats():
+  '''
+  Contadores de una etapa del pipeline.
+
+  items - Cantidad de estudiantes procesados por la etapa.
+
+  batches - Cantidad de páginas procesadas por la etapa.
+
+  busy - Segundos que la etapa pasó trabajando (sin contar las esperas en
+  las colas).
+
+  blocked - Segundos que la etapa pasó esperando espacio en la cola de
+  salida (backpressure de la etapa siguiente).
+  '''
+  def __init__(self, name: str):
+    self.name = name
+    self.items = 0
+    self.batches = 0
+    self.errors = 0
+    self.busy = 0.0
+    self.blocked = 0.0
+
+  @property
+  def throughput(self) -> float:
+    '''
+    Estudiantes por segundo de trabajo de la etapa.
+    '''
+    return self.items / self.busy if self.busy > 0 else 0.0
+
+  def to_dict(self) -> dict:
+    return {'items': self.items, 'batches': self.batches, 'errors': self.errors, 'busy': round(self.busy, 4),
+            'blocked': round(self.blocked, 4), 'throughput': round(self.throughput, 2)}
+
+  def __str__(self):
+    return f"Stage {self.name}: {self.items} students in {self.busy:.2f}s ({self.throughput:.1f} students/s, blocked {self.blocked:.2f}s)"
+
+  def __repr__(self):
+    return f'StageStats(name="{self.name}", items="{self.items}", busy="{self.busy}", blocked="{self.blocked}")'
+
+
+class ForecastPipeline():
+  '''
+  Pipeline asíncrono que obtiene, proyecta y guarda los estudiantes de una
+  institución solapando la red con el cómputo.
+
+  Se compone de tres etapas unidas por colas acotadas:
+
+  fetch - Descarga las páginas de estudiantes (DB_API.get_students) por
+  adelantado, hasta `prefetch` páginas en espera.
+
+  forecast - `workers` tareas que envían cada página al pool de procesos.
+
+  write - Guarda las proyecciones de cada página con
+  DB_API.update_students_data (o update_student_data si no está disponible).
+
+  Cuando una etapa es más lenta que la anterior su cola se llena y la
+  anterior se detiene (backpressure), por lo que la memoria queda acotada a
+  `prefetch + workers + write_buffer` páginas.
+
+  Parámetros:
+
+  db - Instancia de DB_API (o un objeto con get_students, get_student_count
+  y update_student_data).
+
+  workers - Cantidad de procesos para las proyecciones. Por defecto
+  os.cpu_count().
+
+  prefetch - Cantidad de páginas descargadas por adelantado.
+
+  write_buffer - Cantidad de páginas proyectadas en espera de ser guardadas.
+
+  chunksize - Cantidad de estudiantes enviados a un proceso por tarea.
+
+  io_threads - Cantidad de hilos para las llamadas bloqueantes a DB_API.
+
+  executor - Executor opcional para las proyecciones (p. ej. un pool de
+  procesos ya iniciado). Si se recibe no se cierra al terminar.
+
+  course_model - PooledCourseModel opcional de la institución o la ruta de
+  uno guardado, ver BatchForecaster.
+
+  forecast_store - ForecastStore opcional, ver BatchForecaster. El reporte
+  incluye los estudiantes omitidos y recalculados en "sources".
+
+  cascade - CascadeStats opcional, ver BatchForecaster. Se actualiza con
+  los ganadores de todas las páginas al terminar la ejecución.
+
+  budget - FitBudget opcional con los límites de los ajustes de cada
+  estudiante, ver BatchForecaster.
+
+  model_store - ModelStore opcional compartido por los procesos, ver
+  BatchForecaster.
+  '''
+  def __init__(self, db, workers: int | None = None, prefetch: int = 2, write_buffer: int = 2, chunksize: int = 4,
+               blas_threads: int = 1, io_threads: int = 4, executor: Executor | None = None, course_model = None,
+               forecast_store = None, cascade = None, budget = None, model_store = None):
+    if workers is None:
+      workers = os.cpu_count() or 1
+    for name, value in [('workers', workers), ('prefetch', prefetch), ('write_buffer', write_buffer), ('chunksize', chunksize), ('io_threads', io_threads)]:
+      if value < 1:
+        raise ValueError(f'{name} must be at least 1, got {value}')
+
+    self.db = db
+    self.workers = workers
+    self.prefetch = prefetch
+    self.write_buffer = write_buffer
+    self.chunksize = chunksize
+    self.blas_threads = blas_threads
+    self.io_threads = io_threads
+    self.executor = executor
+    self.course_model = course_model
+    self.forecast_store = forecast_store
+    self.cascade = cascade
+    self.budget = budget
+    self.model_store = model_store
+    self.stats = {name: StageStats(name) for name in ['fetch', 'forecast', 'write']}
+    self.failed : list[ForecastResult] = []
+    self.sources = source_report([])
+    self.wins : list[tuple[str, str]] = []
+
+  def run(self, institution_id: str = "INTEC", period: str | None = None, progress: Callable[[int, int], None] | None = None) -> dict:
+    '''
+    Método para ejecutar el pipeline de forma síncrona, ver arun.
+    '''
+    return asyncio.run(self.arun(institution_id, period, progress))
+
+  async def arun(self, institution_id: str = "INTEC", period: str | None = None, progress: Callable[[int, int], None] | None = None) -> dict:
+    '''
+    Método para proyectar todos los estudiantes de una institución.
+
+    Parámetros:
+    institution_id - Institución a proyectar.
+
+    period - Periodo objetivo opcional, ver forecast_student.
+
+    progress - Función opcional que recibe la cantidad de estudiantes
+    guardados y fallidos cada vez que se guarda una página.
+
+    Este método retorna un diccionario con los contadores de cada etapa, el
+    tiempo total y la cantidad de estudiantes por segundo del pipeline. Los
+    estudiantes que no se pudieron proyectar quedan en self.failed.
+    '''
+    self.stats = {name: StageStats(name) for name in ['fetch', 'forecast', 'write']}
+    self.failed = []
+    self.sources = source_report([])
+    self.wins = []
+
+    executor = self.executor
+    if executor is None:
+      executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.blas_threads, metrics.enabled))
+    io_executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='pipeline-io')
+
+    pages : asyncio.Queue = asyncio.Queue(maxsize=self.prefetch)
+    results : asyncio.Queue = asyncio.Queue(maxsize=self.write_buffer)
+    start = time.perf_counter()
+
+    try:
+      forecasters = [asyncio.create_task(self.__forecast(pages, results, executor, period)) for _ in range(self.workers)]
+      tasks = [asyncio.create_task(self.__fetch(pages, io_executor, institution_id)), *forecasters,
+               asyncio.create_task(self.__write(results, io_executor, institution_id, progress))]
+
+      async def close_results():
+        await asyncio.gather(*forecasters)
+        await results.put(_DONE)
+
+      try:
+        await asyncio.gather(*tasks, close_results())
+      except BaseException:
+        for task in tasks:
+          task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+      io_executor.shutdown(wait=True)
+      if self.executor is None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    # la tabla se actualiza al final para que todas las páginas usen el mismo orden de la cascada
+    if self.cascade is not None:
+      self.cascade.update(self.wins)
+
+    elapsed = time.perf_counter() - start
+    written = self.stats['write'].items
+
+    return {'stages': {name: stage.to_dict() for name, stage in self.stats.items()}, 'elapsed': round(elapsed, 4),
+            'students': written, 'throughput': round(written / elapsed, 2) if elapsed > 0 else 0.0,
+            'bottleneck': max(self.stats.values(), key=lambda stage: stage.busy).name, 'failed': len(self.failed),
+            'sources': dict(self.sources)}
+
+  async def __put(self, queue: asyncio.Queue, item, stage: StageStats):
+    start = time.perf_counter()
+    await queue.put(item)
+    stage.blocked += time.perf_counter() - start
+
+  async def __fetch(self, pages: asyncio.Queue, io_executor: Executor, institution_id: str):
+    loop = asyncio.get_running_loop()
+    stage = self.stats['fetch']
+
+    try:
+      start = time.perf_counter()
+      total = await loop.run_in_executor(io_executor, self.db.get_student_count, institution_id)
+      stage.busy += time.perf_counter() - start
+
+      batch_size = getattr(self.db, 'batch_size', None)
+      last_page = -(-total // batch_size) if total and batch_size else None
+
+      page = 0
+      while last_page is None or page < last_page:
+        start = time.perf_counter()
+        students = await loop.run_in_executor(io_executor, self.db.get_students, institution_id, page)
+        stage.busy += time.perf_counter() - start
+
+        # la cantidad reportada puede ser mayor que los estudiantes disponibles
+        if not students:
+          break
+
+        stage.items += len(students)
+        stage.batches += 1
+        page += 1
+        await self.__put(pages, students, stage)
+    finally:
+      for _ in range(self.workers):
+        await pages.put(_DONE)
+
+  async def __forecast(self, pages: asyncio.Queue, results: asyncio.Queue, executor: Executor, period: str | None):
+    loop = asyncio.get_running_loop()
+    stage = self.stats['forecast']
+
+    while True:
+      students = await pages.get()
+      if students is _DONE:
+        return
+
+      start = time.perf_counter()
+      chunks = [students[i:i + self.chunksize] for i in range(0, len(students), self.chunksize)]
+      outputs = await asyncio.gather(*[loop.run_in_executor(executor, _forecast_chunk, chunk, period, self.model_store, self.course_model, self.forecast_store, self.cascade, self.budget) for chunk in chunks], return_exceptions=True)
+
+      forecasts : list[ForecastResult] = []
+      for chunk, output in zip(chunks, outputs):
+        if isinstance(output, BaseException):
+          # el proceso murió (p. ej. BrokenProcessPool); se marca el bloque completo
+          output = [ForecastResult(str(getattr(student, 'student_id', '')), str(getattr(student, 'institution_id', '')), error=f'{type(output).__name__}: {output}') for student in chunk]
+        else:
+          output, snapshot = output
+          metrics.merge(snapshot)
+        forecasts.extend(output)
+      stage.busy += time.perf_counter() - start
+
+      stage.items += len(forecasts)
+      stage.batches += 1
+      stage.errors += sum(not result.ok for result in forecasts)
+      self.failed.extend(result for result in forecasts if not result.ok)
+      for source, count in source_report(forecasts).items():
+        self.sources[source] += count
+      self.wins.extend(win for result in forecasts for win in result.wins)
+      await self.__put(results, [result for result in forecasts if result.ok], stage)
+
+  async def __write(self, results: asyncio.Queue, io_executor: Executor, institution_id: str, progress: Callable[[int, int], None] | None):
+    loop = asyncio.get_running_loop()
+    stage = self.stats['write']
+
+    while True:
+      forecasts = await results.get()
+      if forecasts is _DONE:
+        return
+
+      start = time.perf_counter()
+      failed = await loop.run_in_executor(io_executor, self.__write_page, forecasts, institution_id)
+      stage.busy += time.perf_counter() - start
+
+      stage.items += len(forecasts) - len(failed)
+      stage.batches += 1
+      stage.errors += len(failed)
+      self.failed.extend(failed)
+
+      if progress is not None:
+        progress(stage.items, len(self.failed))
+
+  def __write_page(self, forecasts: list[ForecastResult], institution_id: str) -> list[ForecastResult]:
+    if hasattr(self.db, 'update_students_data'):
+      # una sola escritura por página en lugar de una por estudiante
+      report = self.db.update_students_data([(result.student_id, result.institution_id or institution_id, result.predictions) for result in forecasts])
+      return [ForecastResult(result.student_id, result.institution_id, error=f'could not write the predictions: {report.failed[result.student_id]}', elapsed=result.elapsed)
+              for result in forecasts if result.student_id in report.failed]
+
+    failed = []
+    for result in forecasts:
+      try:
+        self.db.update_student_data(result.student_id, result.institution_id or institution_id, result.predictions)
+      except Exception as error:
+        failed.append(ForecastResult(result.student_id, result.institution_id, error=f'could not write the predictions: {error}', elapsed=result.elapsed))
+    return failed
+
+  def __str__(self):
+    return "Forecast Pipeline:\n" + "\n".join(str(stage) for stage in self.stats.values())
+
+  def __repr__(self):
+    return f'ForecastPipeline(workers="{self.workers}", prefetch="{self.prefetch}", write_buffer="{self.write_buffer}", chunksize="{self.chunksize}")'
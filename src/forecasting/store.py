@@ -0,0 +1,192 @@
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.student import Student
+from .cache import history_fingerprint
+from .cascade import CascadeStats
+from ..time_series import DAMPING, LINEAR_R2, MIN_STATESPACE_OBS, FitBudget
+from .comp_predictor import CASCADE, FAST_PATHS, RMSE_THRESHOLD
+
+# se incrementa cuando cambia la forma de calcular las proyecciones
+STORE_VERSION = 2
+
+
+def _defaults(function) -> list:
+  # parámetros de los modelos (order, seasonal_order, alpha, damping, ...)
+  return [(name, parameter.default) for name, parameter in inspect.signature(function).parameters.items()
+          if parameter.default is not inspect.Parameter.empty and name not in ('target', 'store', 'store_key', 'budget')]
+
+
+def forecast_config(budget: FitBudget | None = None) -> str:
+  '''
+  Retorna la huella de la configuración de los modelos de competencias: si
+  cambia el umbral, la cascada, los parámetros de sus modelos, las rutas
+  rápidas, los límites de classify_series o los límites de los ajustes las
+  proyecciones almacenadas dejan de ser válidas.
+
+  Parámetros:
+
+  budget - FitBudget utilizado por CompPerformancePredictor, None si los
+  ajustes no se limitan.
+  '''
+  config = (STORE_VERSION, RMSE_THRESHOLD, [(model, _defaults(get_prediction)) for model, get_prediction in CASCADE],
+            sorted((route, model, _defaults(get_prediction)) for route, (model, get_prediction) in FAST_PATHS.items()),
+            MIN_STATESPACE_OBS, LINEAR_R2, DAMPING,
+            None if budget is None else (budget.fit_seconds, budget.student_seconds, budget.maxiter))
+  return hashlib.blake2b(repr(config).encode(), digest_size=8).hexdigest()
+
+
+def regression_key(regression) -> str:
+  '''
+  Retorna la huella de la regresión de asignaturas recibida por
+  CoursePerformancePredictor. Sin regresión (se ajusta con los datos del
+  estudiante) la huella es fija, ya que depende solo del historial.
+  '''
+  if regression is None:
+    return 'student'
+  data = np.asarray(regression.coef_, dtype=np.float64).tobytes() + np.float64(regression.intercept_).tobytes()
+  return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _dump_dtype(dtype) -> str | dict:
+  if isinstance(dtype, pd.CategoricalDtype):
+    return {'categories': dtype.categories.tolist(), 'ordered': bool(dtype.ordered)}
+  return str(dtype)
+
+
+def _load_dtype(dtype: str | dict):
+  if isinstance(dtype, dict):
+    return pd.CategoricalDtype(dtype['categories'], ordered=dtype['ordered'])
+  return dtype
+
+
+def _dump_frame(df: pd.DataFrame) -> str:
+  # to_dict convierte los escalares de numpy (int16, float32) a tipos de Python
+  return json.dumps({'columns': [str(column) for column in df.columns], 'dtypes': [_dump_dtype(dtype) for dtype in df.dtypes],
+                     'index': df.index.tolist(), 'data': list(df.to_dict('split', index=False)['data'])})
+
+
+def _load_frame(text: str) -> pd.DataFrame:
+  # se conservan el índice y los tipos (incluidas las categorías) para que el resultado sea igual al calculado
+  data = json.loads(text)
+  df = pd.DataFrame(data['data'], columns=data['columns'], index=data['index'])
+  return df.astype(dict(zip(data['columns'], [_load_dtype(dtype) for dtype in data['dtypes']])))
+
+
+class StoredForecast():
+  '''
+  Proyección almacenada de un estudiante.
+
+  competencies - DataFrame de CompPerformancePredictor.forecast_competency_performance.
+
+  predictions - DataFrame de las asignaturas con la calificación proyectada.
+
+  models - Diccionario competencia -> modelo ganador.
+
+  course_key - Huella de la regresión de asignaturas utilizada (ver regression_key).
+  '''
+  def __init__(self, competencies: pd.DataFrame, predictions: pd.DataFrame, models: dict[str, str], course_key: str):
+    self.competencies = competencies
+    self.predictions = predictions
+    self.models = models
+    self.course_key = course_key
+
+  def __str__(self):
+    return f"Stored Forecast: {len(self.predictions)} rows, models: {self.models}"
+
+  def __repr__(self):
+    return f'StoredForecast(models="{self.models}", course_key="{self.course_key}")'
+
+
+class ForecastStore:
+  '''
+  Almacén en disco (SQLite) de las proyecciones de los estudiantes por
+  huella del historial (ver history_fingerprint) y de la configuración de
+  los modelos (ver forecast_config).
+
+  Un estudiante cuyo historial no cambió desde la ejecución anterior no se
+  vuelve a proyectar. Si solo cambió la regresión de asignaturas (p. ej. el
+  PooledCourseModel de la institución) se reutilizan las proyecciones de
+  las competencias y solo se recalculan las asignaturas. Con un
+  CascadeStats la llave incluye además los órdenes de la cascada que
+  aplica la tabla (ver CascadeStats.fingerprint).
+
+  Parámetros:
+
+  path - Ruta de la base de datos SQLite. Por defecto se utiliza una base de
+  datos en memoria. Al usar una ruta el almacén puede compartirse entre
+  procesos y ejecuciones.
+
+  config - Huella de la configuración, por defecto forecast_config().
+  '''
+  def __init__(self, path: str | None = None, config: str | None = None):
+    self.path = path
+    self.config = config or forecast_config()
+    self._connection : sqlite3.Connection | None = None
+    self._lock = threading.Lock()
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_connection'] = None
+    state['_lock'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  @property
+  def connection(self) -> sqlite3.Connection:
+    if self._connection is None:
+      if self.path is not None and os.path.dirname(self.path):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self._connection = sqlite3.connect(self.path or ':memory:', timeout=30, check_same_thread=False)
+      self._connection.execute('PRAGMA journal_mode=WAL')
+      self._connection.execute('PRAGMA synchronous=NORMAL')
+      self._connection.execute('CREATE TABLE IF NOT EXISTS forecasts (key TEXT PRIMARY KEY, student_id TEXT NOT NULL, institution_id TEXT NOT NULL, '
+                               'period TEXT, competencies TEXT NOT NULL, predictions TEXT NOT NULL, models TEXT NOT NULL, course_key TEXT NOT NULL, updated REAL NOT NULL)')
+    return self._connection
+
+  def key(self, student: Student, period: str | None = None, cascade: CascadeStats | None = None) -> str:
+    config = self.config
+    if cascade is not None and (plans := cascade.fingerprint([model for model, _ in CASCADE])):
+      config = f'{config}-{plans}'
+    return f'{config}:{history_fingerprint(student, period)}'
+
+  def get(self, key: str) -> StoredForecast | None:
+    with self._lock:
+      row = self.connection.execute('SELECT competencies, predictions, models, course_key FROM forecasts WHERE key = ?', (key,)).fetchone()
+    if row is None:
+      return None
+    return StoredForecast(_load_frame(row[0]), _load_frame(row[1]), json.loads(row[2]), row[3])
+
+  def put(self, key: str, student: Student, period: str | None, forecast: StoredForecast):
+    with self._lock:
+      self.connection.execute('INSERT OR REPLACE INTO forecasts (key, student_id, institution_id, period, competencies, predictions, models, course_key, updated) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, str(student.student_id), str(student.institution_id), period, _dump_frame(forecast.competencies),
+                               _dump_frame(forecast.predictions), json.dumps(forecast.models), forecast.course_key, time.time()))
+      self.connection.commit()
+
+  def __len__(self):
+    with self._lock:
+      return self.connection.execute('SELECT COUNT(*) FROM forecasts').fetchone()[0]
+
+  def close(self):
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+
+  def __str__(self):
+    return f"Forecast Store: {self.path or ':memory:'} config {self.config}"
+
+  def __repr__(self):
+    return f'ForecastStore(path="{self.path}", config="{self.config}")'
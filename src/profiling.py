@@ -0,0 +1,245 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+_DISABLED = nullcontext()
+
+
+class LatencyHistogram:
+  '''
+  Histograma acumulado de latencias con cubetas fijas (en segundos), con
+  el mismo formato que los histogramas de Prometheus.
+
+  Parámetros:
+
+  buckets - Límites superiores de las cubetas, en orden ascendente.
+  '''
+  def __init__(self, buckets: list[float] = LATENCY_BUCKETS):
+    self.buckets = list(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.max = 0.0
+    self._lock = threading.Lock()
+
+  def observe(self, seconds: float):
+    with self._lock:
+      self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+      self.count += 1
+      self.sum += seconds
+      if seconds > self.max:
+        self.max = seconds
+
+  def merge(self, counts: list[int], count: int, total: float, maximum: float = 0.0):
+    '''
+    Método para sumar las observaciones de otro histograma con las mismas
+    cubetas (p. ej. el de un proceso del pool).
+    '''
+    with self._lock:
+      self.counts = [a + b for a, b in zip(self.counts, counts)]
+      self.count += count
+      self.sum += total
+      self.max = max(self.max, maximum)
+
+  def quantile(self, q: float) -> float:
+    '''
+    Método para estimar un cuantil, retorna el límite superior de la cubeta
+    que lo contiene.
+    '''
+    if self.count == 0:
+      return 0.0
+    target = q * self.count
+    total = 0
+    for bound, count in zip(self.buckets + [float('inf')], self.counts):
+      total += count
+      if total >= target:
+        return bound
+    return float('inf')
+
+  def cumulative(self) -> list[tuple[str, int]]:
+    result, total = [], 0
+    for bound, count in zip(self.buckets + [float('inf')], self.counts):
+      total += count
+      result.append(('+Inf' if bound == float('inf') else str(bound), total))
+    return result
+
+  def to_dict(self) -> dict:
+    return {'buckets': dict(self.cumulative()), 'count': self.count, 'sum': round(self.sum, 6), 'max': round(self.max, 6),
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+  def __str__(self):
+    return f"Latency Histogram: {self.count} observations, p50 <= {self.quantile(0.5)}s, p99 <= {self.quantile(0.99)}s"
+
+  def __repr__(self):
+    return f'LatencyHistogram(count="{self.count}", sum="{self.sum}")'
+
+
+class Metrics:
+  '''
+  Registro de tiempos por etapa y contadores de los predictores, de las
+  funciones de ajuste de time_series y de DB_API.
+
+  Los tiempos se guardan en un LatencyHistogram por nombre y etiquetas, y
+  los contadores como enteros. Se exportan como texto de Prometheus
+  (to_prometheus) o como un reporte json (to_dict / to_json).
+
+  Desactivado (el valor por defecto, se activa con la variable de entorno
+  SIPEFCA_METRICS=1 o con enable) cada llamada solo revisa una bandera y
+  timer retorna un contexto vacío compartido.
+
+  Los procesos de un pool tienen su propio registro: _forecast_chunk envía
+  lo registrado en cada bloque (drain) y el proceso principal lo suma con
+  merge.
+
+  Parámetros:
+
+  enabled - Si es verdadero se registran los tiempos y contadores.
+
+  prefix - Prefijo de los nombres en el texto de Prometheus.
+  '''
+  def __init__(self, enabled: bool = False, prefix: str = 'sipefca'):
+    self.enabled = enabled
+    self.prefix = prefix
+    self.timers : dict[tuple, LatencyHistogram] = {}
+    self.counters : dict[tuple, float] = {}
+    self._lock = threading.Lock()
+
+  def enable(self, enabled: bool = True):
+    self.enabled = enabled
+
+  @staticmethod
+  def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+  def inc(self, name: str, value: float = 1, **labels):
+    '''
+    Método para incrementar un contador.
+    '''
+    if not self.enabled:
+      return
+    key = self._key(name, labels)
+    with self._lock:
+      self.counters[key] = self.counters.get(key, 0) + value
+
+  def observe(self, name: str, seconds: float, **labels):
+    '''
+    Método para registrar la duración en segundos de una etapa.
+    '''
+    if not self.enabled:
+      return
+    key = self._key(name, labels)
+    histogram = self.timers.get(key)
+    if histogram is None:
+      with self._lock:
+        histogram = self.timers.setdefault(key, LatencyHistogram())
+    histogram.observe(seconds)
+
+  def timer(self, name: str, **labels):
+    '''
+    Método que retorna un contexto que registra la duración de su bloque
+    con observe.
+    '''
+    if not self.enabled:
+      return _DISABLED
+    return self._timer(name, labels)
+
+  @contextmanager
+  def _timer(self, name: str, labels: dict):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(name, time.perf_counter() - start, **labels)
+
+  def reset(self):
+    with self._lock:
+      self.timers = {}
+      self.counters = {}
+
+  def drain(self) -> dict:
+    '''
+    Método que retorna lo registrado hasta el momento en un formato que se
+    puede enviar entre procesos y reinicia el registro.
+    '''
+    with self._lock:
+      timers, counters = self.timers, self.counters
+      self.timers, self.counters = {}, {}
+    return {'counters': counters, 'timers': {key: (h.counts, h.count, h.sum, h.max) for key, h in timers.items()}}
+
+  def merge(self, snapshot: dict | None):
+    '''
+    Método para sumar lo registrado por otro proceso (ver drain).
+    '''
+    if not snapshot:
+      return
+    with self._lock:
+      for key, value in snapshot['counters'].items():
+        self.counters[key] = self.counters.get(key, 0) + value
+      for key, (counts, count, total, maximum) in snapshot['timers'].items():
+        self.timers.setdefault(key, LatencyHistogram()).merge(counts, count, total, maximum)
+
+  def snapshot(self) -> tuple[dict, dict]:
+    with self._lock:
+      return dict(self.counters), dict(self.timers)
+
+  def to_dict(self) -> dict:
+    def label(key):
+      name, labels = key
+      return name + ('{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else '')
+
+    counters, timers = self.snapshot()
+    return {
+      'counters': {label(key): value for key, value in sorted(counters.items())},
+      'timers': {label(key): histogram.to_dict() for key, histogram in sorted(timers.items())},
+    }
+
+  def to_json(self, indent: int | None = 2) -> str:
+    return json.dumps(self.to_dict(), indent=indent)
+
+  def to_prometheus(self) -> str:
+    '''
+    Método que retorna los contadores y los tiempos en el formato de texto
+    de Prometheus (contadores *_total e histogramas *_seconds).
+    '''
+    def labels(pairs, extra=()):
+      pairs = list(pairs) + list(extra)
+      if not pairs:
+        return ''
+      return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+    counters, timers = self.snapshot()
+    lines = []
+
+    for name in sorted({name for name, _ in counters}):
+      metric = f'{self.prefix}_{name}_total'
+      lines.append(f'# TYPE {metric} counter')
+      for (n, pairs), value in sorted(counters.items()):
+        if n == name:
+          lines.append(f'{metric}{labels(pairs)} {value:g}')
+
+    for name in sorted({name for name, _ in timers}):
+      metric = f'{self.prefix}_{name}_seconds'
+      lines.append(f'# TYPE {metric} histogram')
+      for (n, pairs), histogram in sorted(timers.items()):
+        if n != name:
+          continue
+        for bound, count in histogram.cumulative():
+          lines.append(f'{metric}_bucket{labels(pairs, [("le", bound)])} {count}')
+        lines.append(f'{metric}_sum{labels(pairs)} {histogram.sum:.6f}')
+        lines.append(f'{metric}_count{labels(pairs)} {histogram.count}')
+
+    return '\n'.join(lines) + '\n'
+
+  def __str__(self):
+    return f"Metrics: {len(self.counters)} counters, {len(self.timers)} timers, {'enabled' if self.enabled else 'disabled'}"
+
+  def __repr__(self):
+    return f'Metrics(enabled="{self.enabled}", prefix="{self.prefix}")'
+
+
+metrics = Metrics(enabled=os.getenv('SIPEFCA_METRICS', '') not in ('', '0', 'false'))
@@ -0,0 +1,363 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from contextlib import asynccontextmanager
+
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from data.db import DB_API
+from models.forecast_job import ForecastJob
+from .forecasting.batch import _init_worker, forecast_student
+from .forecasting.cache import ForecastCache, history_fingerprint
+from .forecasting.pipeline import ForecastPipeline
+from .profiling import LatencyHistogram, metrics
+
+
+def _warm_worker(blas_threads: int, profile: bool | None = None):
+  '''
+  Inicializador de los procesos del servicio. Además de limitar los hilos
+  de BLAS carga statsmodels y sklearn para que el primer trabajo no pague la
+  importación.
+  '''
+  _init_worker(blas_threads, profile)
+
+  from sklearn.linear_model import LinearRegression
+  from statsmodels.tsa.arima.model import ARIMA
+
+
+def _warm_up() -> int:
+  '''
+  Ajusta un modelo pequeño para forzar la creación del proceso y compilar
+  las rutas de statsmodels/sklearn antes del primer trabajo.
+  '''
+  from sklearn.linear_model import LinearRegression
+  from statsmodels.tsa.arima.model import ARIMA
+
+  y = np.linspace(0, 1, 12)
+  ARIMA(y, order=(1, 0, 0)).fit()
+  LinearRegression().fit(y.reshape(-1, 1), y)
+  return os.getpid()
+
+
+class JobQueue():
+  '''
+  Cola de trabajos de proyección de instituciones completas.
+
+  Los trabajos se ejecutan de uno en uno en un hilo de fondo con
+  ForecastPipeline, compartiendo un pool de procesos que vive mientras el
+  servicio esté activo, por lo que statsmodels y sklearn se mantienen
+  cargados entre trabajos.
+
+  Parámetros:
+
+  db - Instancia de DB_API utilizada por los trabajos.
+
+  workers - Cantidad de procesos del pool. Por defecto os.cpu_count().
+
+  executor - Executor opcional para las proyecciones. Si se recibe no se
+  cierra al detener la cola.
+
+  max_history - Cantidad de trabajos terminados que se conservan para las
+  consultas de estado.
+  '''
+  def __init__(self, db, workers: int | None = None, executor: Executor | None = None, blas_threads: int = 1, max_history: int = 100, **pipeline_kwargs):
+    self.db = db
+    self.workers = workers or os.cpu_count() or 1
+    self.blas_threads = blas_threads
+    self.max_history = max_history
+    self.pipeline_kwargs = pipeline_kwargs
+    self.executor = executor
+    self.owns_executor = executor is None
+    self.jobs : OrderedDict[str, ForecastJob] = OrderedDict()
+    self.pending : queue.Queue = queue.Queue()
+    self.lock = threading.Lock()
+    self.thread : threading.Thread | None = None
+
+  def start(self, warm: bool = True):
+    '''
+    Método para iniciar el pool de procesos y el hilo de los trabajos.
+    '''
+    if self.thread is not None:
+      return
+
+    if self.executor is None:
+      self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker, initargs=(self.blas_threads, metrics.enabled))
+    if warm:
+      wait([self.executor.submit(_warm_up) for _ in range(self.workers)])
+
+    self.thread = threading.Thread(target=self.__work, daemon=True, name='forecast-jobs')
+    self.thread.start()
+
+  def stop(self):
+    '''
+    Método para detener la cola. El trabajo en curso termina antes de
+    cerrar el pool.
+    '''
+    if self.thread is not None:
+      self.pending.put(None)
+      self.thread.join()
+      self.thread = None
+    if self.owns_executor and self.executor is not None:
+      self.executor.shutdown(wait=True, cancel_futures=True)
+      self.executor = None
+
+  def submit(self, institution_id: str, period: str | None = None) -> ForecastJob:
+    '''
+    Método para encolar la proyección de una institución.
+
+    Si la institución ya tiene un trabajo en cola o en ejecución se retorna
+    ese trabajo en lugar de crear uno nuevo.
+    '''
+    with self.lock:
+      for job in self.jobs.values():
+        if job.active and job.institution_id == institution_id and job.period == period:
+          return job
+
+      job = ForecastJob(institution_id, period)
+      self.jobs[job.job_id] = job
+      self.__trim()
+
+    self.pending.put(job)
+    return job
+
+  def get(self, job_id: str) -> ForecastJob | None:
+    return self.jobs.get(job_id)
+
+  def list(self) -> list[ForecastJob]:
+    return list(self.jobs.values())
+
+  def __trim(self):
+    finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+    for job_id in finished[:max(len(self.jobs) - self.max_history, 0)]:
+      del self.jobs[job_id]
+
+  def __work(self):
+    while True:
+      job = self.pending.get()
+      if job is None:
+        return
+      self.__run(job)
+
+  def __run(self, job: ForecastJob):
+    job.status = 'running'
+    job.started_at = time.time()
+
+    def progress(written: int, failed: int):
+      job.processed = written + failed
+      job.failed = failed
+
+    try:
+      job.total = self.db.get_student_count(job.institution_id)
+      period = job.period or self.db.get_latest_period(job.institution_id).replace('-', '')
+
+      pipeline = ForecastPipeline(self.db, workers=self.workers, executor=self.executor, **self.pipeline_kwargs)
+      job.report = pipeline.run(job.institution_id, period, progress)
+
+      # la cantidad reportada por la api puede ser mayor que los estudiantes disponibles
+      job.total = job.report['students'] + job.report['failed']
+      progress(job.report['students'], job.report['failed'])
+      job.status = 'done'
+    except Exception as error:
+      job.error = f'{type(error).__name__}: {error}'
+      job.status = 'failed'
+    finally:
+      job.finished_at = time.time()
+
+  def __str__(self):
+    return f"Job Queue: {len(self.jobs)} jobs, {self.pending.qsize()} pending, {self.workers} workers"
+
+  def __repr__(self):
+    return f'JobQueue(workers="{self.workers}", jobs="{len(self.jobs)}")'
+
+
+class StudentForecasts():
+  '''
+  Proyecciones de estudiantes individuales para las consultas interactivas
+  (p. ej. cuando un estudiante abre su panel).
+
+  Las proyecciones se almacenan en un ForecastCache con la huella del
+  historial del estudiante como llave, por lo que un historial modificado
+  se vuelve a proyectar. La latencia de cada consulta se registra en un
+  histograma por origen del resultado (hit, miss o coalesced).
+
+  Calcular la huella requiere obtener el historial del estudiante, por lo
+  que además se guarda la última huella de cada (institución, estudiante,
+  periodo). Durante revalidate segundos las consultas de ese estudiante se
+  responden con la proyección de esa huella sin consultar db; después se
+  vuelve a obtener el historial para detectar cambios.
+
+  Parámetros:
+
+  db - Instancia de DB_API utilizada para obtener los estudiantes.
+
+  max_entries - Cantidad máxima de proyecciones almacenadas.
+
+  ttl - Segundos que una proyección permanece válida.
+
+  revalidate - Segundos durante los que se confía en la última huella de un
+  estudiante. 0 o None para obtener el historial en cada consulta.
+  '''
+  def __init__(self, db, max_entries: int = 1024, ttl: float | None = 3600.0, revalidate: float | None = 60.0):
+    self.db = db
+    self.max_entries = max_entries
+    self.revalidate = revalidate
+    self.cache = ForecastCache(max_entries, ttl)
+    self.latency = {outcome: LatencyHistogram() for outcome in ['hit', 'miss', 'coalesced']}
+    self._fingerprints : OrderedDict[tuple[str, str, str | None], tuple[str, float]] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def forecast(self, student, period: str | None = None) -> tuple[list[dict], str]:
+    '''
+    Método para obtener la proyección de un estudiante ya cargado.
+
+    Este método retorna las filas de la proyección y el origen del
+    resultado, ver ForecastCache.get_or_compute.
+    '''
+    return self.__forecast(student, period)[:2]
+
+  def __forecast(self, student, period: str | None) -> tuple[list[dict], str, str]:
+    start = time.perf_counter()
+    key = history_fingerprint(student, period)
+    records, outcome = self.cache.get_or_compute(key, lambda: forecast_student(student, period).to_dict('records'))
+    self.latency[outcome].observe(time.perf_counter() - start)
+    return records, outcome, key
+
+  def get(self, institution_id: str, student_id: str, period: str | None = None) -> dict | None:
+    '''
+    Método para obtener la proyección de un estudiante a partir de su id.
+    Retorna None si el estudiante no existe.
+    '''
+    start = time.perf_counter()
+    records = self.__recent(institution_id, student_id, period)
+    if records is not None:
+      self.latency['hit'].observe(time.perf_counter() - start)
+      outcome = 'hit'
+    else:
+      student = self.db.get_student_data(student_id, institution_id)
+      if student is None:
+        return None
+      records, outcome, key = self.__forecast(student, period)
+      self.__remember(institution_id, student_id, period, key)
+
+    return {'student_id': str(student_id), 'institution_id': institution_id, 'period': period, 'cache': outcome, 'predictions': records}
+
+  def __recent(self, institution_id: str, student_id: str, period: str | None) -> list[dict] | None:
+    # proyección de la última huella del estudiante, si aún no hay que revalidarla
+    if not self.revalidate:
+      return None
+    with self._lock:
+      entry = self._fingerprints.get((str(institution_id), str(student_id), period))
+    if entry is None or time.monotonic() - entry[1] >= self.revalidate:
+      return None
+    return self.cache.get(entry[0])
+
+  def __remember(self, institution_id: str, student_id: str, period: str | None, key: str):
+    ident = (str(institution_id), str(student_id), period)
+    with self._lock:
+      self._fingerprints[ident] = (key, time.monotonic())
+      self._fingerprints.move_to_end(ident)
+      while len(self._fingerprints) > self.max_entries:
+        self._fingerprints.popitem(last=False)
+
+  def metrics(self) -> dict:
+    return {'cache': self.cache.stats(), 'latency': {outcome: histogram.to_dict() for outcome, histogram in self.latency.items()}}
+
+  def __str__(self):
+    return f"Student Forecasts: {self.cache}"
+
+  def __repr__(self):
+    return f'StudentForecasts(cache="{self.cache!r}")'
+
+
+def create_app(db=None, workers: int | None = None, executor: Executor | None = None, warm: bool = True,
+               cache_entries: int = 1024, cache_ttl: float | None = 3600.0, cache_revalidate: float | None = 60.0, **pipeline_kwargs) -> FastAPI:
+  '''
+  Crea la aplicación de FastAPI del servicio de proyecciones.
+
+  Parámetros:
+  db - Instancia de DB_API. Por defecto se crea al iniciar el servicio con
+  la configuración del archivo .env y el tamaño de página de la variable de
+  entorno BATCH_SIZE.
+
+  workers - Cantidad de procesos para las proyecciones.
+
+  executor - Executor opcional para las proyecciones, ver JobQueue.
+
+  warm - Si es verdadero los procesos cargan statsmodels y sklearn al
+  iniciar el servicio.
+
+  cache_entries, cache_ttl, cache_revalidate - Tamaño, expiración y
+  revalidación del cache de las proyecciones individuales, ver
+  StudentForecasts.
+  '''
+  @asynccontextmanager
+  async def lifespan(app: FastAPI):
+    _db = db if db is not None else DB_API(batch_size=int(os.getenv('BATCH_SIZE') or 100))
+    jobs = JobQueue(_db, workers, executor, **pipeline_kwargs)
+    jobs.start(warm)
+    app.state.jobs = jobs
+    app.state.forecasts = StudentForecasts(_db, cache_entries, cache_ttl, cache_revalidate)
+    try:
+      yield
+    finally:
+      jobs.stop()
+
+  api = FastAPI(lifespan=lifespan)
+
+  @api.get("/ai/health")
+  def health():
+    return {"status": "ok"}
+
+  # GET es la ruta original de la api; POST describe mejor que se crea un trabajo
+  @api.api_route("/ai/student_forecasts/{institution_id}", methods=["GET", "POST"], status_code=202)
+  def create_student_forecasts(institution_id: str, period: str | None = None):
+    '''
+    Encola la proyección de todos los estudiantes de la institución y
+    retorna el trabajo de inmediato. Acepta GET (ruta original) y POST.
+    '''
+    return api.state.jobs.submit(institution_id, period).to_dict()
+
+  # /student_forecast es la ruta original, se mantiene junto a la de /ai
+  @api.get("/student_forecast/{institution_id}/{student_id}")
+  @api.get("/ai/student_forecast/{institution_id}/{student_id}")
+  def read_student_forecast(institution_id: str, student_id: str, period: str | None = None):
+    '''
+    Retorna la proyección de un estudiante, desde el cache si su historial
+    no ha cambiado.
+    '''
+    forecast = api.state.forecasts.get(institution_id, student_id, period)
+    if forecast is None:
+      raise HTTPException(status_code=404, detail=f'student {student_id} not found')
+    return forecast
+
+  @api.get("/ai/metrics", response_class=PlainTextResponse)
+  def read_metrics(format: str = 'prometheus'):
+    '''
+    Retorna los tiempos por etapa y los contadores registrados (ver
+    src.profiling) en formato de Prometheus, o en json con format=json.
+    '''
+    if format == 'json':
+      return PlainTextResponse(metrics.to_json(), media_type='application/json')
+    return metrics.to_prometheus()
+
+  @api.get("/ai/metrics/student_forecast")
+  def read_student_forecast_metrics():
+    return api.state.forecasts.metrics()
+
+  @api.get("/ai/jobs")
+  def read_jobs():
+    return [job.to_dict() for job in api.state.jobs.list()]
+
+  @api.get("/ai/jobs/{job_id}")
+  def read_job(job_id: str):
+    job = api.state.jobs.get(job_id)
+    if job is None:
+      raise HTTPException(status_code=404, detail=f'job {job_id} not found')
+    return job.to_dict()
+
+  return api
@@ -1,15 +1,400 @@
 import pandas as pd
 pd.options.mode.chained_assignment = None  # default='warn'
 
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
 import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from sklearn.metrics import mean_squared_error
+
+from models.batch_forecast import BatchForecast
+from .profiling import metrics
+
+# statsmodels, sklearn y scipy se importan dentro de las funciones que los
+# utilizan: cuestan más de un segundo de importación y los procesos que solo
+# usan los caminos rápidos (o el servicio al iniciar) no los necesitan
 
 
 param_names = ['period','competency','weight','comp_performance']
 
-def get_ARIMA(train : pd.DataFrame, test : pd.DataFrame, order = (2,3,2), alpha = 0.05, target='comp_performance') -> pd.DataFrame:
+
+class FitCache:
+  '''
+  Cache LRU de las proyecciones generadas por get_ARMA, get_ARIMA y
+  get_SARIMAX.
+
+  La llave es un hash del contenido de la serie de entrenamiento (valores e
+  índice) junto con el modelo, order, seasonal_order, alpha, las iteraciones
+  máximas del optimizador (ver FitBudget) y la cantidad de pasos
+  proyectados, por lo que dos estudiantes con el mismo historial de una
+  competencia comparten el mismo ajuste.
+
+  Parámetros:
+
+  max_entries - Cantidad máxima de proyecciones almacenadas.
+
+  max_bytes - Tamaño máximo aproximado en bytes de las proyecciones
+  almacenadas.
+
+  Al superar cualquiera de los dos límites se descartan las entradas usadas
+  hace más tiempo.
+  '''
+  def __init__(self, max_entries : int = 4096, max_bytes : int = 64 * 1024 * 1024, enabled : bool = True):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.enabled = enabled
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.bytes = 0
+    self._entries : OrderedDict[str, tuple[pd.DataFrame, int]] = OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(model : str, y : pd.Series, steps : int, **params) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((model, y.name, steps, sorted(params.items()))).encode())
+    h.update(pd.util.hash_pandas_object(y.astype(np.float64), index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+  def get(self, key : str) -> pd.DataFrame | None:
+    if not self.enabled:
+      return None
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        metrics.inc('fit_cache', result='miss')
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      metrics.inc('fit_cache', result='hit')
+      return entry[0].copy()
+
+  def put(self, key : str, value : pd.DataFrame):
+    if not self.enabled:
+      return
+    size = int(value.memory_usage(deep=True).sum())
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      if key in self._entries:
+        self.bytes -= self._entries.pop(key)[1]
+      self._entries[key] = (value.copy(), size)
+      self.bytes += size
+      while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+        _, (_, evicted) = self._entries.popitem(last=False)
+        self.bytes -= evicted
+        self.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.bytes = 0
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'entries': len(self._entries),
+      'bytes': self.bytes,
+      'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+    }
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __str__(self):
+    return f"Fit Cache: {self.stats()}"
+
+
+fit_cache = FitCache()
+
+
+class ModelStore:
+  '''
+  Almacén de los parámetros ajustados de los modelos de espacio de estados
+  por llave (estudiante, competencia, modelo).
+
+  Cuando la serie recibida es la misma serie almacenada con nuevas
+  observaciones al final (un periodo académico nuevo), el modelo se filtra
+  con los parámetros ya estimados, igual que results.append(refit=False),
+  en lugar de volver a optimizarlos. El ajuste completo solo se repite si:
+
+  - el historial almacenado cambió (no es un prefijo de la serie nueva),
+  - se acumularon max_updates actualizaciones desde el último ajuste, o
+  - el error estandarizado de alguna observación nueva supera
+    drift_threshold (el modelo dejó de describir la serie). Las
+    observaciones del periodo de inicialización difusa
+    (loglikelihood_burn) no se evalúan, sus errores no son informativos.
+
+  Parámetros:
+
+  path - Ruta de la base de datos SQLite donde se guardan los parámetros.
+  Por defecto se utiliza una base de datos en memoria. Al usar una ruta el
+  almacén puede compartirse entre procesos.
+
+  max_updates - Cantidad de actualizaciones permitidas antes de reajustar.
+
+  drift_threshold - Valor absoluto máximo del error estandarizado de una
+  observación nueva.
+  '''
+  def __init__(self, path : str | None = None, max_updates : int = 4, drift_threshold : float = 3.0):
+    self.path = path
+    self.max_updates = max_updates
+    self.drift_threshold = drift_threshold
+    self.updates = 0
+    self.refits = 0
+    self.stale = 0
+    self.drifts = 0
+    self._connection : sqlite3.Connection | None = None
+    self._lock = threading.Lock()
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_connection'] = None
+    state['_lock'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  @property
+  def connection(self) -> sqlite3.Connection:
+    if self._connection is None:
+      if self.path is not None and os.path.dirname(self.path):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      self._connection = sqlite3.connect(self.path or ':memory:', timeout=30, check_same_thread=False)
+      self._connection.execute('PRAGMA journal_mode=WAL')
+      self._connection.execute('PRAGMA synchronous=NORMAL')
+      self._connection.execute('CREATE TABLE IF NOT EXISTS model_states (key TEXT PRIMARY KEY, params BLOB NOT NULL, endog BLOB NOT NULL, updates INTEGER NOT NULL)')
+    return self._connection
+
+  def get(self, key : tuple) -> tuple[np.ndarray, np.ndarray, int] | None:
+    with self._lock:
+      row = self.connection.execute('SELECT params, endog, updates FROM model_states WHERE key = ?', (repr(key),)).fetchone()
+    if row is None:
+      return None
+    return np.frombuffer(row[0], dtype=np.float64), np.frombuffer(row[1], dtype=np.float64), row[2]
+
+  def put(self, key : tuple, params : np.ndarray, endog : np.ndarray, updates : int):
+    with self._lock:
+      self.connection.execute('INSERT OR REPLACE INTO model_states (key, params, endog, updates) VALUES (?, ?, ?, ?)',
+                              (repr(key), np.asarray(params, dtype=np.float64).tobytes(), np.asarray(endog, dtype=np.float64).tobytes(), updates))
+      self.connection.commit()
+
+  def fit(self, key : tuple, y : pd.Series, make_model, **fit_kwargs):
+    '''
+    Retorna los resultados del modelo construido por make_model(y),
+    actualizando los parámetros almacenados cuando la política lo permite y
+    ajustándolo desde cero en caso contrario.
+    '''
+    endog = y.to_numpy(dtype=np.float64)
+    model = make_model(y)
+    state = self.get(key)
+
+    if state is not None:
+      params, stored, updates = state
+      new = len(endog) - len(stored)
+
+      if new < 0 or not np.array_equal(endog[:len(stored)], stored):
+        pass
+      elif updates + new > self.max_updates:
+        self.stale += 1
+      else:
+        results = model.filter(params)
+        # en series cortas con diferencias (p. ej. SARIMAX) todas las observaciones pueden estar en la inicialización difusa
+        errors = np.asarray(results.standardized_forecasts_error)[0, max(len(stored), results.loglikelihood_burn):]
+
+        if not np.any(np.abs(errors[np.isfinite(errors)]) > self.drift_threshold):
+          if new > 0:
+            self.put(key, params, endog, updates + new)
+          self.updates += 1
+          metrics.inc('model_store', result='update')
+          return results
+        self.drifts += 1
+        metrics.inc('model_store', result='drift')
+
+    results = model.fit(**fit_kwargs)
+    self.put(key, np.asarray(results.params), endog, 0)
+    self.refits += 1
+    metrics.inc('model_store', result='refit')
+    return results
+
+  def stats(self) -> dict:
+    return {
+      'updates': self.updates,
+      'refits': self.refits,
+      'stale': self.stale,
+      'drifts': self.drifts,
+    }
+
+  def close(self):
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+
+  def __str__(self):
+    return f"Model Store: {self.path or ':memory:'} {self.stats()}"
+
+
+class FitBudgetExceeded(Exception):
+  pass
+
+
+class FitBudget:
+  '''
+  Límites de tiempo e iteraciones de los ajustes de los modelos de espacio
+  de estados.
+
+  Un ajuste que supera fit_seconds se interrumpe en la siguiente iteración
+  del optimizador y se utilizan los últimos parámetros alcanzados (ver
+  fit_model). Cuando un estudiante supera student_seconds la cascada deja
+  de intentar modelos y retorna el mejor obtenido o la proyección de
+  respaldo (ver CompPerformancePredictor). Cada evento queda en events y
+  en la métrica fit_budget_exceeded.
+
+  Parámetros:
+
+  fit_seconds - Segundos máximos de un ajuste. None para no limitarlo.
+
+  student_seconds - Segundos máximos de los ajustes de un estudiante. None
+  para no limitarlo.
+
+  maxiter - Iteraciones máximas del optimizador. None para utilizar el valor
+  por defecto de statsmodels.
+
+  stop - Evento opcional (threading.Event o el Event de un
+  multiprocessing.Manager) que interrumpe los ajustes en curso en su
+  siguiente iteración, p. ej. cuando otro modelo de la cascada concurrente
+  ya cumplió con el umbral.
+  '''
+  def __init__(self, fit_seconds : float | None = None, student_seconds : float | None = None, maxiter : int | None = None, stop = None):
+    self.fit_seconds = fit_seconds
+    self.student_seconds = student_seconds
+    self.maxiter = maxiter
+    self.stop = stop
+    self.deadline : float | None = None
+    self.events : list[tuple[str, str]] = []
+
+  def start(self) -> 'FitBudget':
+    '''
+    Retorna una copia de los límites con el tiempo del estudiante iniciado.
+    '''
+    budget = FitBudget(self.fit_seconds, self.student_seconds, self.maxiter, self.stop)
+    if self.student_seconds is not None:
+      budget.deadline = time.monotonic() + self.student_seconds
+    return budget
+
+  def exhausted(self) -> bool:
+    return self.deadline is not None and time.monotonic() >= self.deadline
+
+  def fit_deadline(self) -> float | None:
+    deadlines = [deadline for deadline in [self.deadline, None if self.fit_seconds is None else time.monotonic() + self.fit_seconds] if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+  def record(self, model : str, reason : str):
+    self.events.append((model, reason))
+    metrics.inc('fit_budget_exceeded', model=model, reason=reason)
+
+  def apply(self, fit_kwargs : dict, callback) -> dict:
+    '''
+    Agrega el callback y maxiter a los argumentos de fit, dentro de
+    method_kwargs en el caso de ARIMA.
+    '''
+    kwargs = dict(fit_kwargs)
+    if 'method_kwargs' in kwargs:
+      target = kwargs['method_kwargs'] = dict(kwargs['method_kwargs'])
+    else:
+      target = kwargs
+    target['callback'] = callback
+    if self.maxiter is not None:
+      target['maxiter'] = self.maxiter
+    return kwargs
+
+  def __str__(self):
+    return f"Fit Budget: {self.fit_seconds}s per fit, {self.student_seconds}s per student, {self.maxiter} iterations, {len(self.events)} events"
+
+  def __repr__(self):
+    return f'FitBudget(fit_seconds="{self.fit_seconds}", student_seconds="{self.student_seconds}", maxiter="{self.maxiter}")'
+
+
+def fit_model(make_model, y : pd.Series, store : ModelStore | None = None, store_key : tuple | None = None, name : str = '',
+              budget : FitBudget | None = None, **fit_kwargs):
+  '''
+  Ajusta el modelo make_model(y) o, si se recibe un ModelStore y una llave,
+  actualiza el modelo almacenado para esa llave (ver ModelStore.fit).
+
+  Con un FitBudget el optimizador se limita a budget.maxiter iteraciones y
+  se interrumpe al superar el tiempo del ajuste o del estudiante. En ese
+  caso se retorna el modelo filtrado con los últimos parámetros alcanzados,
+  marcado con budget_exceeded para que no se almacene en fit_cache. Un
+  ajuste interrumpido por budget.stop no tiene resultado.
+
+  Con las métricas activas (ver profiling.metrics) registra el tiempo del
+  ajuste, los ajustes fallidos y los que no convergieron, con el nombre del
+  modelo como etiqueta.
+  '''
+  best = {}
+  make = make_model
+
+  if budget is not None:
+    deadline = budget.fit_deadline()
+    stop = budget.stop
+
+    def callback(params, *args):
+      best['params'] = np.array(params, dtype=np.float64, copy=True)
+      if stop is not None and stop.is_set():
+        raise FitBudgetExceeded('cancelled')
+      if deadline is not None and time.monotonic() > deadline:
+        raise FitBudgetExceeded('fit_time')
+
+    def make(y):
+      best['model'] = make_model(y)
+      return best['model']
+
+    fit_kwargs = budget.apply(fit_kwargs, callback)
+
+  try:
+    with metrics.timer('model_fit', model=name):
+      if store is None or store_key is None:
+        results = make(y).fit(**fit_kwargs)
+      else:
+        results = store.fit(store_key, y, make, **fit_kwargs)
+  except FitBudgetExceeded as error:
+    budget.record(name, error.args[0])
+    if error.args[0] == 'cancelled':
+      raise ValueError(f'could not fit {name}: the fit was cancelled')
+    if 'params' not in best:
+      raise ValueError(f'could not fit {name}: the fit budget was exceeded before the first iteration')
+    # los parámetros del optimizador no están restringidos
+    model = best['model']
+    results = model.filter(model.transform_params(best['params']))
+    results.budget_exceeded = True
+    return results
+  except Exception:
+    metrics.inc('model_fit_errors', model=name)
+    raise
+
+  if metrics.enabled:
+    metrics.inc('model_fits', model=name)
+    retvals = getattr(results, 'mle_retvals', None)
+    if isinstance(retvals, dict) and not retvals.get('converged', True):
+      metrics.inc('convergence_failures', model=name)
+
+  return results
+
+def get_ARIMA(train : pd.DataFrame, test : pd.DataFrame, order = (2,3,2), alpha = 0.05, target='comp_performance', store : ModelStore | None = None, store_key : tuple | None = None,
+              budget : FitBudget | None = None) -> pd.DataFrame:
     '''
     Función para el calculo de las proyecciones de series de tiempo ARIMA
 
@@ -21,6 +406,11 @@ def get_ARIMA(train : pd.DataFrame, test : pd.DataFrame, order = (2,3,2), alpha
 
     target - Es el nombre de la columna analizada para la generación de las predicciones.
 
+    store, store_key - ModelStore opcional y llave con la que se actualiza el
+    modelo ya ajustado en lugar de reajustarlo (ver ModelStore).
+
+    budget - FitBudget opcional con los límites del ajuste.
+
     El método retorna:
 
     Un DataFrame con las proyecciones de series de tiempo ARIMA.
@@ -29,16 +419,23 @@ def get_ARIMA(train : pd.DataFrame, test : pd.DataFrame, order = (2,3,2), alpha
       # acá separamos nuestra data a analizar
       y = train[target]#self.target
 
-      # y la utilizamos para ingresarla en el modelo
-      ARIMAmodel = ARIMA(y, order = order)
+      key = fit_cache.key('ARIMA', y, len(test.index), order=order, alpha=alpha, maxiter=getattr(budget, 'maxiter', None))
+      y_pred_df_b = fit_cache.get(key) if store is None else None
 
-      ARIMAmodel = ARIMAmodel.fit(method_kwargs={'disp':0,'warn_convergence':False},)
+      if y_pred_df_b is None:
+        from statsmodels.tsa.arima.model import ARIMA
+
+        # y la utilizamos para ingresarla en el modelo
+        ARIMAmodel = fit_model(lambda y: ARIMA(y, order = order), y, store, store_key, 'ARIMA', budget, method_kwargs={'disp':0,'warn_convergence':False},)
+
+        # Acá generamos otro set de datos que contenga las predicciones realizadas con
+        # el modelo ARIMA
+        y_pred_b = ARIMAmodel.get_forecast(len(test.index))
+        y_pred_df_b = y_pred_b.conf_int(alpha = alpha)
+        y_pred_df_b["Predictions"] = ARIMAmodel.predict(start = y_pred_df_b.index[0], end = y_pred_df_b.index[-1])
+        if store is None and not getattr(ARIMAmodel, 'budget_exceeded', False):
+          fit_cache.put(key, y_pred_df_b)
 
-      # Acá generamos otro set de datos que contenga las predicciones realizadas con
-      # el modelo ARIMA
-      y_pred_b = ARIMAmodel.get_forecast(len(test.index))
-      y_pred_df_b = y_pred_b.conf_int(alpha = alpha)
-      y_pred_df_b["Predictions"] = ARIMAmodel.predict(start = y_pred_df_b.index[0], end = y_pred_df_b.index[-1])
       y_pred_df_b["period"] = test['period'].values
       y_pred_df_b['index'] = test.index
       # y_pred_out_b = y_pred_df_b["Predictions"]
@@ -49,7 +446,8 @@ def get_ARIMA(train : pd.DataFrame, test : pd.DataFrame, order = (2,3,2), alpha
     except Exception as error:
       raise ValueError(f'could not get ARIMA prediction for {target}:', error)
 
-def get_ARMA(train : pd.DataFrame, test : pd.DataFrame, order = (1,0,1), alpha = 0.05, target='comp_performance') -> pd.DataFrame:
+def get_ARMA(train : pd.DataFrame, test : pd.DataFrame, order = (1,0,1), alpha = 0.05, target='comp_performance', store : ModelStore | None = None, store_key : tuple | None = None,
+             budget : FitBudget | None = None) -> pd.DataFrame:
   '''
   Función para el calculo de las proyecciones de series de tiempo ARMA
 
@@ -61,6 +459,11 @@ def get_ARMA(train : pd.DataFrame, test : pd.DataFrame, order = (1,0,1), alpha =
 
   target - Es el nombre de la columna analizada para la generación de las predicciones.
 
+  store, store_key - ModelStore opcional y llave con la que se actualiza el
+  modelo ya ajustado en lugar de reajustarlo (ver ModelStore).
+
+  budget - FitBudget opcional con los límites del ajuste.
+
   El método retorna:
 
   Un DataFrame con las proyecciones de series de tiempo ARMA.
@@ -72,32 +475,23 @@ def get_ARMA(train : pd.DataFrame, test : pd.DataFrame, order = (1,0,1), alpha =
     # print('y: ')
     # print(y.head())
 
-    # print('Fitting mod')
-    # y la utilizamos para ingresarla en el modelo
-    mod = SARIMAX(y, order = order)
-    fit = mod.fit(disp=0)
-
-    # print('Forecasting')
-    # print('len(test.index)')
-    # print(len(test.index))
-    # print(test)
-    # Acá generamos otro set de datos que contenga las predicciones realizadas con
-    # el modelo ARMA
-    y_pred = fit.get_forecast(len(test.index)) # type: ignore
-    # print('y_pred:')
-    # print(type(y_pred))
-    # print(y_pred)
-
-    # print('Confidence interval dataframe')
-    y_pred_df = y_pred.conf_int(alpha = alpha)
-    # print('y_pred_df')
-    # print(y_pred_df)
+    key = fit_cache.key('ARMA', y, len(test.index), order=order, alpha=alpha, maxiter=getattr(budget, 'maxiter', None))
+    y_pred_df = fit_cache.get(key) if store is None else None
+
+    if y_pred_df is None:
+      from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+      # y la utilizamos para ingresarla en el modelo
+      fit = fit_model(lambda y: SARIMAX(y, order = order), y, store, store_key, 'ARMA', budget, disp=0)
+
+      # Acá generamos otro set de datos que contenga las predicciones realizadas con
+      # el modelo ARMA
+      y_pred = fit.get_forecast(len(test.index)) # type: ignore
+      y_pred_df = y_pred.conf_int(alpha = alpha)
+      y_pred_df["Predictions"] = fit.predict(start = y_pred_df.index[0], end = y_pred_df.index[-1]) # type: ignore
+      if store is None and not getattr(fit, 'budget_exceeded', False):
+        fit_cache.put(key, y_pred_df)
 
-    # print('Predictions')
-    y_pred_df["Predictions"] = fit.predict(start = y_pred_df.index[0], end = y_pred_df.index[-1]) # type: ignore
-    # print(y_pred_df['Predictions'])
-    # print('period values')
-    # print(test['period'].values)
     y_pred_df["period"] = test['period'].values
     # print(y_pred_df['period'])
     y_pred_df.index = test.index # type: ignore 
@@ -119,7 +513,8 @@ def get_ARMA(train : pd.DataFrame, test : pd.DataFrame, order = (1,0,1), alpha =
     raise ValueError(f'could not get ARMA prediction for {target}:', error)
 
 
-def get_SARIMAX(train : pd.DataFrame, test : pd.DataFrame, order = (5,4,2), alpha = 0.05, seasonal_order=(3,1,1,12),target='comp_performance') -> pd.DataFrame:
+def get_SARIMAX(train : pd.DataFrame, test : pd.DataFrame, order = (5,4,2), alpha = 0.05, seasonal_order=(3,1,1,12),target='comp_performance', store : ModelStore | None = None, store_key : tuple | None = None,
+                budget : FitBudget | None = None) -> pd.DataFrame:
   '''
   Función para el calculo de las proyecciones de series de tiempo SARIMAX
 
@@ -131,6 +526,11 @@ def get_SARIMAX(train : pd.DataFrame, test : pd.DataFrame, order = (5,4,2), alph
 
   target - Es el nombre de la columna analizada para la generación de las predicciones.
 
+  store, store_key - ModelStore opcional y llave con la que se actualiza el
+  modelo ya ajustado en lugar de reajustarlo (ver ModelStore).
+
+  budget - FitBudget opcional con los límites del ajuste.
+
   El método retorna:
 
   Un DataFrame con las proyecciones de series de tiempo SARIMAX.
@@ -140,15 +540,23 @@ def get_SARIMAX(train : pd.DataFrame, test : pd.DataFrame, order = (5,4,2), alph
     y = train[target]#self.target]
 
 
-    mod = SARIMAX(y, order = order, seasonal_order=seasonal_order, trend='ct')
-    mod = mod.fit(disp=0)
+    key = fit_cache.key('SARIMAX', y, len(test.index), order=order, seasonal_order=seasonal_order, alpha=alpha, maxiter=getattr(budget, 'maxiter', None))
+    y_pred_df_c = fit_cache.get(key) if store is None else None
+
+    if y_pred_df_c is None:
+      from statsmodels.tsa.statespace.sarimax import SARIMAX
 
-    # Acá generamos otro set de datos que contenga las predicciones realizadas con
-    # el modelo SARIMAX
-    y_pred_c : PredictionResults = mod.get_forecast(len(test.index)) # type: ignore
-    y_pred_df_c = pd.DataFrame(y_pred_c.conf_int(alpha = alpha))
+      mod = fit_model(lambda y: SARIMAX(y, order = order, seasonal_order=seasonal_order, trend='ct'), y, store, store_key, 'SARIMAX', budget, disp=0)
+
+      # Acá generamos otro set de datos que contenga las predicciones realizadas con
+      # el modelo SARIMAX
+      y_pred_c : PredictionResults = mod.get_forecast(len(test.index)) # type: ignore
+      y_pred_df_c = pd.DataFrame(y_pred_c.conf_int(alpha = alpha))
+
+      y_pred_df_c["Predictions"] = mod.predict(start = y_pred_df_c.index[0], end = y_pred_df_c.index[-1]) # type: ignore
+      if store is None and not getattr(mod, 'budget_exceeded', False):
+        fit_cache.put(key, y_pred_df_c)
 
-    y_pred_df_c["Predictions"] = mod.predict(start = y_pred_df_c.index[0], end = y_pred_df_c.index[-1]) # type: ignore
     y_pred_df_c["period"] = test['period'].values
     y_pred_df_c.index = test.index
     # y_pred_out_c = y_pred_df_c["Predictions"]
@@ -161,9 +569,270 @@ def get_SARIMAX(train : pd.DataFrame, test : pd.DataFrame, order = (5,4,2), alph
     raise ValueError(f'could not get SARIMAX prediction for {target}:', error)
 
 
+# series más cortas que esto no justifican un modelo de espacio de estados
+MIN_STATESPACE_OBS = 6
+# coeficiente de determinación a partir del cual una serie se considera lineal
+LINEAR_R2 = 0.995
+# factor de amortiguamiento de get_damped_mean
+DAMPING = 0.5
+
+
+def classify_series(y, min_obs : int = MIN_STATESPACE_OBS, linear_r2 : float = LINEAR_R2) -> str:
+  '''
+  Clasifica una serie de entrenamiento para decidir cómo proyectarla.
+
+  El método retorna:
+
+  - "constant" si todos los valores son iguales.
+  - "linear" si una recta explica la serie (R² >= linear_r2).
+  - "short" si tiene menos de min_obs observaciones.
+  - "statespace" en cualquier otro caso (cascada ARMA → ARIMA → SARIMAX).
+  '''
+  y = np.asarray(y, dtype=np.float64)
+
+  if len(y) > 0 and np.ptp(y) <= 1e-9 * max(1.0, float(np.abs(y).max())):
+    return 'constant'
+
+  if len(y) >= 3:
+    x = np.arange(len(y), dtype=np.float64)
+    slope, intercept = np.polyfit(x, y, 1)
+    ss_res = float(np.sum((y - (slope * x + intercept)) ** 2))
+    ss_tot = float(np.sum((y - y.mean()) ** 2))
+    if 1 - ss_res / ss_tot >= linear_r2:
+      return 'linear'
+
+  if len(y) < min_obs:
+    return 'short'
+
+  return 'statespace'
+
+
+def _closed_form_prediction(test : pd.DataFrame, mean : np.ndarray, se : np.ndarray, alpha : float, target : str) -> pd.DataFrame:
+  from scipy import stats
+
+  # mismo formato que el DataFrame retornado por get_ARMA / get_SARIMAX
+  z = float(stats.norm.ppf(1 - alpha / 2))
+  return pd.DataFrame({
+    f'lower {target}': mean - z * se,
+    f'upper {target}': mean + z * se,
+    'Predictions': mean,
+    'period': test['period'].values,
+  }, index=test.index)
+
+
+def _train_values(train : pd.DataFrame, target : str, model : str) -> np.ndarray:
+  y = train[target].to_numpy(dtype=np.float64)
+  if len(y) == 0:
+    raise ValueError(f'could not get {model} prediction for {target}: empty training data')
+  return y
+
+
+def get_last_value(train : pd.DataFrame, test : pd.DataFrame, alpha = 0.05, target='comp_performance') -> pd.DataFrame:
+  '''
+  Proyección "naive": repite el último valor observado. El intervalo de
+  confianza crece como el de una caminata aleatoria.
+  '''
+  y = _train_values(train, target, 'last value')
+  steps = np.arange(1, len(test.index) + 1)
+  sigma = float(np.std(np.diff(y), ddof=1)) if len(y) > 2 else 0.0
+
+  return _closed_form_prediction(test, np.full(len(steps), y[-1]), sigma * np.sqrt(steps), alpha, target)
+
+
+def get_linear_trend(train : pd.DataFrame, test : pd.DataFrame, alpha = 0.05, target='comp_performance') -> pd.DataFrame:
+  '''
+  Proyección por regresión lineal de la serie sobre el tiempo, con el
+  intervalo de predicción de mínimos cuadrados ordinarios.
+  '''
+  y = _train_values(train, target, 'linear trend')
+  if len(y) < 2:
+    return get_last_value(train, test, alpha, target)
+
+  x = np.arange(len(y), dtype=np.float64)
+  slope, intercept = np.polyfit(x, y, 1)
+  future = len(y) - 1 + np.arange(1, len(test.index) + 1, dtype=np.float64)
+
+  dof = len(y) - 2
+  sigma = float(np.sqrt(np.sum((y - (slope * x + intercept)) ** 2) / dof)) if dof > 0 else 0.0
+  se = sigma * np.sqrt(1 + 1 / len(y) + (future - x.mean()) ** 2 / np.sum((x - x.mean()) ** 2))
+
+  return _closed_form_prediction(test, intercept + slope * future, se, alpha, target)
+
+
+def get_damped_mean(train : pd.DataFrame, test : pd.DataFrame, alpha = 0.05, target='comp_performance', damping = DAMPING) -> pd.DataFrame:
+  '''
+  Proyección que parte del último valor observado y se acerca a la media de
+  la serie a razón de "damping" por periodo. Pensada para series muy cortas.
+  '''
+  y = _train_values(train, target, 'damped mean')
+  steps = np.arange(1, len(test.index) + 1)
+  mean = y.mean()
+  sigma = float(np.std(y, ddof=1)) if len(y) > 1 else 0.0
+
+  return _closed_form_prediction(test, mean + damping ** steps * (y[-1] - mean), np.full(len(steps), sigma), alpha, target)
+
+
+# modelos del motor vectorizado, en orden de preferencia ante empates
+BATCH_MODELS = ['MEAN', 'AR1', 'HOLT']
+# parámetros (alpha, beta) evaluados para el suavizamiento de Holt
+HOLT_GRID = [(a, b) for a in (0.2, 0.5, 0.8) for b in (0.1, 0.3)]
+
+
+def stack_series(series : list) -> tuple[np.ndarray, np.ndarray]:
+  '''
+  Apila series de distinta longitud en una matriz alineada a la derecha (la
+  última observación de cada serie queda en la última columna) y retorna la
+  matriz junto con la máscara de posiciones observadas.
+  '''
+  width = max((len(values) for values in series), default=0)
+  Y = np.zeros((len(series), width), dtype=np.float64)
+  mask = np.zeros((len(series), width), dtype=bool)
+
+  for row, values in enumerate(series):
+    if len(values):
+      Y[row, width - len(values):] = values
+      mask[row, width - len(values):] = True
+
+  return Y, mask
+
+
+def _batch_mean(Y : np.ndarray, mask : np.ndarray, steps : np.ndarray):
+  n = mask.sum(axis=1)
+  mean = np.where(mask, Y, 0).sum(axis=1) / np.maximum(n, 1)
+  sse = (np.where(mask, Y - mean[:, None], 0) ** 2).sum(axis=1)
+  sigma2 = sse / np.maximum(n - 1, 1)
+  forecasts = np.repeat(mean[:, None], len(steps), axis=1)
+  variance = np.repeat((sigma2 * (1 + 1 / np.maximum(n, 1)))[:, None], len(steps), axis=1)
+  return forecasts, variance, sse, n, 2
+
+
+def _batch_ar1(Y : np.ndarray, mask : np.ndarray, steps : np.ndarray):
+  # pares (y[t-1], y[t]) observados
+  pairs = mask[:, 1:] & mask[:, :-1]
+  x = np.where(pairs, Y[:, :-1], 0)
+  y = np.where(pairs, Y[:, 1:], 0)
+  n = pairs.sum(axis=1)
+
+  sx, sy = x.sum(axis=1), y.sum(axis=1)
+  den = n * (x * x).sum(axis=1) - sx * sx
+  with np.errstate(divide='ignore', invalid='ignore'):
+    phi = np.where(np.abs(den) > 1e-12, (n * (x * y).sum(axis=1) - sx * sy) / den, 0.0)
+  phi = np.clip(phi, -0.99, 0.99)
+  c = (sy - phi * sx) / np.maximum(n, 1)
+
+  sse = (np.where(pairs, y - (c[:, None] + phi[:, None] * x), 0) ** 2).sum(axis=1)
+  sse = np.where(n >= 2, sse, np.inf)
+  sigma2 = np.where(n >= 2, sse / np.maximum(n - 1, 1), np.inf)
+
+  forecasts = np.empty((len(Y), len(steps)))
+  variance = np.empty((len(Y), len(steps)))
+  last, acc = Y[:, -1], np.zeros(len(Y))
+  for h in range(len(steps)):
+    last = c + phi * last
+    acc = acc + phi ** (2 * h)
+    forecasts[:, h] = last
+    variance[:, h] = sigma2 * acc
+  return forecasts, variance, sse, n, 3
+
+
+def _batch_holt(Y : np.ndarray, mask : np.ndarray, steps : np.ndarray):
+  best = None
+
+  for a, b in HOLT_GRID:
+    level = np.zeros(len(Y))
+    trend = np.zeros(len(Y))
+    seen = np.zeros(len(Y), dtype=np.int64)
+    sse = np.zeros(len(Y))
+
+    for t in range(Y.shape[1]):
+      obs, y = mask[:, t], Y[:, t]
+      first, second, rest = obs & (seen == 0), obs & (seen == 1), obs & (seen >= 2)
+
+      error = y - (level + trend)
+      sse += np.where(rest, error ** 2, 0)
+      new_level = a * y + (1 - a) * (level + trend)
+      new_trend = b * (new_level - level) + (1 - b) * trend
+
+      trend = np.where(second, y - level, np.where(rest, new_trend, trend))
+      level = np.where(first | second, y, np.where(rest, new_level, level))
+      seen += obs
+
+    n = np.maximum(seen - 2, 0)
+    sse = np.where(n >= 1, sse, np.inf)
+    if best is None:
+      best = (sse, level, trend, np.full(len(Y), a), np.full(len(Y), b), n)
+    else:
+      better = sse < best[0]
+      best = tuple(np.where(better, new, old) for new, old in zip((sse, level, trend, np.full(len(Y), a), np.full(len(Y), b), n), best))
+
+  sse, level, trend, a, b, n = best
+  sigma2 = np.where(n >= 1, sse / np.maximum(n, 1), np.inf)
+  forecasts = level[:, None] + trend[:, None] * steps[None, :]
+  j = np.arange(len(steps), dtype=np.float64)
+  increments = np.where(j[None, :] > 0, (a[:, None] * (1 + j[None, :] * b[:, None])) ** 2, 0)
+  variance = sigma2[:, None] * (1 + np.cumsum(increments, axis=1))
+  return forecasts, variance, sse, n, 4
+
+
+def get_batch_forecast(Y : np.ndarray, mask : np.ndarray | None = None, steps : int = 2, alpha = 0.05) -> BatchForecast:
+  '''
+  Motor vectorizado para proyectar muchas series a la vez.
+
+  Ajusta a todas las filas de Y una familia simple de modelos (media, AR(1)
+  y suavizamiento exponencial de Holt) con operaciones de NumPy sobre la
+  matriz completa, y selecciona para cada fila el modelo con menor AIC.
+
+  Parámetros:
+
+  Y - Matriz (series x periodos) alineada a la derecha, ver stack_series.
+
+  mask - Máscara de posiciones observadas. Por defecto todas.
+
+  steps - Cantidad de periodos a proyectar.
+
+  alpha - Nivel de significancia de las bandas de confianza.
+
+  El método retorna un BatchForecast con las proyecciones, las bandas de
+  confianza, el rmse dentro de la muestra y el modelo seleccionado por fila.
+  '''
+  Y = np.asarray(Y, dtype=np.float64)
+  mask = np.ones(Y.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+  if Y.ndim != 2 or Y.shape != mask.shape:
+    raise ValueError(f'could not get the batch forecast: Y {Y.shape} and mask {mask.shape} must be equal 2D shapes')
+  if np.any(mask.sum(axis=1) == 0):
+    raise ValueError('could not get the batch forecast: every series needs at least one observation')
+
+  horizon = np.arange(1, steps + 1, dtype=np.float64)
+  fits = [_batch_mean(Y, mask, horizon), _batch_ar1(Y, mask, horizon), _batch_holt(Y, mask, horizon)]
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    aic = np.stack([np.where(np.isfinite(sse), n * np.log(sse / np.maximum(n, 1) + 1e-12) + 2 * k, np.inf) for _, _, sse, n, k in fits])
+  choice = np.argmin(aic, axis=0)
+  rows = np.arange(len(Y))
+
+  forecasts = np.stack([f[0] for f in fits])[choice, rows]
+  variance = np.stack([f[1] for f in fits])[choice, rows]
+  sse = np.stack([f[2] for f in fits])[choice, rows]
+  n = np.stack([f[3] for f in fits])[choice, rows]
+
+  from scipy import stats
+
+  se = np.sqrt(np.maximum(variance, 0))
+  z = float(stats.norm.ppf(1 - alpha / 2))
+
+  return BatchForecast(
+    forecasts,
+    forecasts - z * se,
+    forecasts + z * se,
+    np.sqrt(sse / np.maximum(n, 1)),
+    np.array(BATCH_MODELS, dtype=object)[choice],
+  )
+
+
 def get_rmse(test : pd.DataFrame | None, predictions : pd.DataFrame | None, target : str = 'comp_performance' , pred_target : str = "Predictions") -> float:
   if predictions is None or test is None:
     raise ValueError('could not get the rmse for the current test data')
+  from sklearn.metrics import mean_squared_error
   try:
     return round(float(np.sqrt(mean_squared_error(test[target], predictions[pred_target]))),2)
   except Exception as error:
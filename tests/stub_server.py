@@ -0,0 +1,105 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    '''
+    Local stand-in for the SIPEFCA api used by the DB_API tests.
+
+    POST /login returns a new token on every call, GET /students requires the
+    current token, GET /flaky answers 503 the first `failures` times and any
+    other route echoes the request. PUT /predictions/bulk upserts the rows in
+    self.rows, answering 207 for the students in `rejected` and ignoring a
+    repeated Idempotency-Key. Every request and every new connection is
+    counted so pooling and retries can be measured offline.
+    '''
+    def __init__(self, failures: int = 0, rejected: set[str] | None = None):
+        self.failures = failures
+        self.rejected = rejected or set()
+        self.rows = {}
+        self.idempotency_keys = set()
+        self.logins = 0
+        self.requests = 0
+        self.connections = 0
+        self.token = None
+        self.received = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.__handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+
+                with stub.lock:
+                    stub.requests += 1
+                    if self.path == '/login':
+                        stub.logins += 1
+                        stub.token = f'token-{stub.logins}'
+                        return self.reply(200, {'token': stub.token})
+                    if self.path.startswith('/flaky') and stub.failures > 0:
+                        stub.failures -= 1
+                        return self.reply(503, {'error': 'unavailable'})
+                    if self.path.startswith('/students') and self.headers.get('Authorization') != f'Bearer {stub.token}':
+                        return self.reply(401, {'error': 'unauthorized'})
+                    stub.received.append((self.command, self.path, body))
+                    if self.path == '/predictions/bulk':
+                        return self.upsert(body)
+
+                self.reply(200, {'method': self.command, 'path': self.path, 'body': body})
+
+            def upsert(self, body):
+                failed = {row['student_id'] for row in body['rows'] if row['student_id'] in stub.rejected}
+                key = self.headers.get('Idempotency-Key')
+                if key not in stub.idempotency_keys:
+                    stub.idempotency_keys.add(key)
+                    for row in body['rows']:
+                        if row['student_id'] not in failed:
+                            stub.rows[tuple(row[column] for column in body['key'])] = row
+
+                if failed:
+                    return self.reply(207, {'failed': [{'student_id': student, 'error': 'rejected'} for student in sorted(failed)]})
+                self.reply(200, {'written': len(body['rows'])})
+
+            do_GET = handle_request
+            do_POST = handle_request
+            do_PUT = handle_request
+
+        return Handler
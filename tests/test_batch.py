@@ -0,0 +1,68 @@
+from data import *
+from models.student import Student
+from src.forecasting.batch import BatchForecaster
+
+_db = db.DB_API(test = True)
+
+def test_batch_keeps_order_and_isolates_failures():
+    student = _db.get_students()[0]
+    broken = Student("broken", "INTEC")
+
+    results = BatchForecaster(workers=2, chunksize=1).run([student, broken, student])
+
+    assert [r.student_id for r in results] == [str(student.student_id), "broken", str(student.student_id)]
+    assert results[0].ok and results[2].ok
+    assert not results[1].ok
+    assert results[0].predictions.equals(results[2].predictions)
+
+def test_forecast_store_skips_unchanged_students(tmp_path):
+    from src.forecasting.course_predictor import PooledCourseModel
+    from src.forecasting.store import ForecastStore
+    from tests.test_comp_predictor import _student
+
+    students = [_db.get_students()[0], _student(1)]
+    path = str(tmp_path / 'forecasts.db')
+
+    first = BatchForecaster(workers = 2, chunksize = 1, forecast_store = ForecastStore(path))
+    computed = first.run(students)
+    assert first.report == {'skipped': 0, 'course': 0, 'recomputed': 2, 'failed': 0}
+
+    # a rerun with the same histories is served from the store, in any process
+    second = BatchForecaster(workers = 1, forecast_store = ForecastStore(path))
+    stored = second.run(students)
+    assert second.report['skipped'] == 2
+    for before, after in zip(computed, stored):
+        assert after.predictions.equals(before.predictions)
+
+    # a modified history is recomputed, a new course model only reruns the course step
+    students[1].periods = students[1].periods[:-1]
+    model = PooledCourseModel.fit_students(students)
+    third = BatchForecaster(workers = 1, forecast_store = ForecastStore(path), course_model = model)
+    third.run(students)
+    assert third.report == {'skipped': 0, 'course': 1, 'recomputed': 1, 'failed': 0}
+
+def test_fit_budget_reaches_the_predictor_and_the_store_key(tmp_path):
+    from src.forecasting.store import ForecastStore, forecast_config
+    from src.time_series import FitBudget
+
+    student = _db.get_students()[0]
+    budget = FitBudget(student_seconds = 0.0)
+    forecast_store = ForecastStore(str(tmp_path / 'forecasts.db'), config = forecast_config(budget))
+
+    # with no time left for the student every series falls back to the damped mean
+    assert BatchForecaster(workers = 1, forecast_store = forecast_store, budget = budget).run([student])[0].ok
+    period = student.periods[-1].period.replace('-', '')
+    stored = forecast_store.get(forecast_store.key(student, period))
+    assert set(stored.models.values()) <= {'DAMPED_MEAN', 'LAST_VALUE', 'LINEAR_TREND'}
+    # a store without the budget does not reuse the bounded forecasts
+    unbounded = ForecastStore(str(tmp_path / 'forecasts.db'))
+    assert unbounded.get(unbounded.key(student, period)) is None
+
+def test_forecast_config_covers_the_predictor_settings(monkeypatch):
+    from src.forecasting import store
+    from src.forecasting.comp_predictor import DEFAULT_FIT_BUDGET
+
+    config = store.forecast_config()
+    assert store.forecast_config(DEFAULT_FIT_BUDGET) != config
+    monkeypatch.setattr(store, 'LINEAR_R2', 0.99)
+    assert store.forecast_config() != config
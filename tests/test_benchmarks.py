@@ -0,0 +1,21 @@
+from benchmarks.bench_pipeline import STAGES, run_config
+from benchmarks.synthetic import CohortShape, generate_cohort
+from models.student import Student
+
+
+def test_synthetic_cohort_follows_the_export_shape():
+    shape = CohortShape.from_export()
+    records = generate_cohort(3, periods = 5, competencies = 4, seed = 1, shape = shape)
+    students = [Student(json=record) for record in records]
+
+    assert [p.period for p in students[0].periods] == shape.period_labels(5)
+    assert {c.id for s in students for p in s.periods for course in p.courses for c in course.competencies} <= {'C1', 'C2', 'C3', 'C4'}
+    assert all(course.grade == 0 for course in students[0].periods[-1].courses)
+    assert generate_cohort(3, periods = 5, competencies = 4, seed = 1, shape = shape) == records
+
+
+def test_pipeline_benchmark_reports_every_stage():
+    result = run_config(2, periods = 4, competencies = 3, seed = 0, shape = CohortShape.from_export(), url = None)
+
+    assert list(result['stages']) == STAGES
+    assert result['rows'] > 0 and result['students_per_s'] > 0
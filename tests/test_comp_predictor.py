@@ -0,0 +1,130 @@
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from models.student import Student
+from src.forecasting.comp_predictor import CompPerformancePredictor
+from src.time_series import fit_cache
+
+def _student(seed: int = 1) -> Student:
+    with open(os.path.join(os.path.dirname(__file__), '..', 'docs', 'test_data.json'), 'r') as f:
+        data = json.loads(f.read())
+
+    rng = random.Random(seed)
+    for period in data['periods']:
+        for course in period['courses']:
+            for competency in course['competences']:
+                competency['performance'] = 0
+                competency['predicted_performance'] = rng.uniform(50, 100)
+    return Student(json=data)
+
+def test_concurrent_cascade_matches_sequential():
+    data = _student().to_frame()
+
+    fit_cache.clear()
+    sequential = CompPerformancePredictor(data).forecast_competency_performance()
+
+    fit_cache.clear()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        concurrent = CompPerformancePredictor(data, executor=executor).forecast_competency_performance()
+
+    assert_frame_equal(sequential, concurrent)
+
+def test_cohort_forecast_keeps_history_and_forecasts_last_period():
+    from models.student import cohort_to_frame
+
+    student = _student()
+    student.student_id = 'a'
+    single = CompPerformancePredictor(student.to_frame())
+
+    forecast, summary = CompPerformancePredictor.forecast_cohort_competency_performance(cohort_to_frame([student]))
+
+    assert forecast[['period','competency']].equals(single.pred_data[['period','competency']])
+    last = forecast.index.isin(forecast.groupby('competency', observed=True)['period'].idxmax())
+    history = forecast.loc[~last, 'comp_performance'] - single.pred_data.loc[~last, 'comp_performance']
+    assert history.abs().max() < 1e-9
+    assert set(summary['model']) <= {'MEAN', 'AR1', 'HOLT'}
+    assert len(summary) == single.pred_data['competency'].nunique()
+
+def test_fit_budget_bounds_the_cascade():
+    from src.time_series import FitBudget
+
+    data = _student().to_frame()
+
+    # every fit is cut after its first iteration and the latest parameters are used
+    fit_cache.clear()
+    cpp = CompPerformancePredictor(data, budget = FitBudget(fit_seconds = 0.0))
+    forecast = cpp.forecast_competency_performance()
+    assert forecast['comp_performance'].notna().all()
+    assert cpp.budget.events and {reason for _, reason in cpp.budget.events} == {'fit_time'}
+    # only the fits that finished within the budget are cached
+    assert len(fit_cache) == 3 * cpp.routes['statespace'] - len(cpp.budget.events)
+
+    # with no time left for the student the cascade falls back to the damped mean
+    cpp = CompPerformancePredictor(data, budget = FitBudget(student_seconds = 0.0))
+    forecast = cpp.forecast_competency_performance()
+    assert forecast['comp_performance'].notna().all()
+    assert {trend.model for trend in cpp.predictions.values()} <= {'DAMPED_MEAN', 'LAST_VALUE', 'LINEAR_TREND'}
+    assert ('ARMA', 'student_time') in cpp.budget.events
+
+def test_model_store_requires_a_student_id():
+    from src.time_series import ModelStore
+
+    with pytest.raises(ValueError, match='student_id'):
+        CompPerformancePredictor(_student().to_frame(), model_store = ModelStore())
+
+def test_cascade_stats_order_the_cascade_and_round_trip(tmp_path):
+    from src.forecasting.cascade import CascadeStats, series_profile
+
+    stats = CascadeStats(min_samples = 10, explore_every = 0)
+    assert stats.plan('C1|n2|cv1', ['ARMA', 'ARIMA', 'SARIMAX']) == (['ARMA', 'ARIMA', 'SARIMAX'], set())
+
+    stats.update([('C1|n2|cv1', 'SARIMAX')] * 9 + [('C1|n2|cv1', 'ARIMA')] * 3)
+    assert stats.plan('C1|n2|cv1', ['ARMA', 'ARIMA', 'SARIMAX']) == (['SARIMAX', 'ARIMA', 'ARMA'], {'ARMA'})
+
+    path = str(tmp_path / 'cascade.json')
+    stats.save(path)
+    assert CascadeStats.load(path).wins == stats.wins
+
+    # the predictor reports the winner of every cascade and leaves the table untouched
+    data = _student().to_frame()
+    fit_cache.clear()
+    cpp = CompPerformancePredictor(data, cascade = stats)
+    cpp.forecast_competency_performance()
+    assert len(cpp.wins) == cpp.routes['statespace']
+    assert all(profile.split('|')[0] in cpp.predictions and model in ('ARMA', 'ARIMA', 'SARIMAX') for profile, model in cpp.wins)
+    assert stats.wins == CascadeStats.load(path).wins
+    assert series_profile([1.0] * 12, 'C1') == 'C1|n3|cv0'
+
+def test_cascade_stats_count_original_order_only_and_explore_by_series():
+    import pickle
+    from src.forecasting.cascade import CascadeStats
+    from src.forecasting.store import ForecastStore
+
+    student = _student()
+    data = student.to_frame()
+    stats = CascadeStats(min_samples = 1, explore_every = 0)
+    store = ForecastStore()
+    assert store.key(student, None, stats) == store.key(student)
+
+    cpp = CompPerformancePredictor(data, cascade = stats)
+    cpp.forecast_competency_performance()
+    assert len(cpp.wins) == cpp.routes['statespace']
+
+    # once the table reorders every group, the reordered cascades are not counted
+    stats.update([(profile, 'SARIMAX') for profile, _ in cpp.wins] * 50)
+    cpp = CompPerformancePredictor(data, cascade = stats)
+    cpp.forecast_competency_performance()
+    assert cpp.wins == []
+    assert store.key(student, None, stats) != store.key(student)
+
+    # the exploration depends on the series only, so every pickled copy makes the same choice
+    stats = CascadeStats(explore_every = 4)
+    series = [[float(i), float(i + 1), float(2 * i)] for i in range(200)]
+    copy = pickle.loads(pickle.dumps(stats))
+    assert [stats.explores(y) for y in series] == [copy.explores(y) for y in series]
+    assert 20 < sum(stats.explores(y) for y in series) < 80
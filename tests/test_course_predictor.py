@@ -0,0 +1,83 @@
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+from models.student import cohort_to_frame
+from src.forecasting.course_predictor import CoursePerformancePredictor, PooledCourseModel
+
+from tests.test_comp_predictor import _student
+
+def test_cohort_regressions_match_sklearn():
+    students = []
+    for seed in range(3):
+        student = _student(seed)
+        student.student_id = f's{seed}'
+        student.periods = student.periods[:5 + seed * 3]
+        students.append(student)
+
+    models = CoursePerformancePredictor.fit_cohort_regressions(cohort_to_frame(students))
+
+    for student in students:
+        data = student.to_frame()
+        regr = LinearRegression().fit(data[['comp_performance','weight']], data['numerical_grade'])
+        assert np.allclose(models[student.student_id].coef_, regr.coef_)
+        assert np.isclose(models[student.student_id].intercept_, regr.intercept_)
+
+def test_pooled_course_model_matches_sklearn_and_round_trips(tmp_path):
+    from src.forecasting.batch import BatchForecaster
+
+    students = []
+    for seed in range(3):
+        student = _student(seed)
+        student.student_id = f's{seed}'
+        students.append(student)
+
+    data = cohort_to_frame(students)
+    model = PooledCourseModel.fit_students(students, shrinkage = 5.0)
+    regr = LinearRegression().fit(data[['comp_performance','weight']], data['numerical_grade'])
+
+    assert np.allclose(model.coef, regr.coef_) and np.isclose(model.intercept, regr.intercept_)
+    assert np.allclose(PooledCourseModel.fit(data, shrinkage = 5.0).coef, model.coef)
+
+    # the correction is the student's residual sum shrunk by the virtual rows
+    rows = data[data['student_id'] == 's1']
+    residuals = rows['numerical_grade'] - regr.predict(rows[['comp_performance','weight']])
+    assert np.isclose(model.corrections['s1'], residuals.sum() / (len(rows) + 5.0))
+    assert model.for_student('unknown').intercept_ == model.intercept
+
+    path = str(tmp_path / 'course_model.json')
+    model.save(path)
+    loaded = PooledCourseModel.load(path)
+    assert np.allclose(loaded.coef, model.coef) and loaded.corrections == model.corrections
+
+    # every worker loads the saved model and gets the same result as the in-process forecast
+    results = BatchForecaster(workers = 2, chunksize = 1, course_model = path).run(students[:2])
+    expected = BatchForecaster(workers = 1, course_model = model).run(students[:2])
+    for result, local in zip(results, expected):
+        assert result.ok and result.predictions.equals(local.predictions)
+
+def test_forecast_courses_performance_uses_weighted_competences():
+    import pandas as pd
+
+    data = pd.DataFrame({
+        'period': ['202401', '202401', '202402', '202402', '202402'],
+        'course_id': ['A', 'A', 'B', 'B', 'C'],
+        'credits': [3, 3, 4, 4, 2],
+        'numerical_grade': [3.0, 3.0, 2.0, 2.0, 4.0],
+        'predicted_grade': [0.0] * 5,
+        'competency': ['C1', 'C2', 'C1', 'C2', 'C2'],
+        'weight': [60, 40, 50, 50, 100],
+        'performance': [75.0, 75.0, 50.0, 50.0, 100.0],
+        'comp_performance': [0.7, 0.8, 0.5, 0.6, 0.9],
+    })
+    predicted = pd.DataFrame({'period': ['202402', '202402'], 'competency': ['C1', 'C2'], 'comp_performance': [0.6, 0.8]})
+    regression = LinearRegressionStub()
+
+    result = CoursePerformancePredictor(data, predicted, regression).forecast_courses_performance('202402')
+
+    assert result['course_id'].tolist() == ['B', 'B', 'C']
+    # B: (round(0.6*0.5 + 0.8*0.5, 2) * 4 + 1.0) / 2, C: (0.8 * 4 + 1.0) / 2
+    assert result['predicted_grade'].round(6).tolist() == [1.9, 1.9, 2.1]
+
+class LinearRegressionStub:
+    def predict(self, X):
+        return np.ones(len(X))
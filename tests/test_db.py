@@ -0,0 +1,138 @@
+import io
+import json
+import os
+
+from data import *
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'docs', 'test_data.json'), 'r') as f:
+    _student = json.loads(f.read())
+
+def _export(path, count, ndjson):
+    records = []
+    for i in range(count):
+        record = dict(_student)
+        record['student_id'] = i
+        records.append(record)
+    with open(path, 'w') as f:
+        if ndjson:
+            f.write('\n'.join(json.dumps(record) for record in records) + '\n')
+        else:
+            json.dump(records, f, indent=2)
+
+def test_iter_json_records_with_small_chunks():
+    text = json.dumps([{'a': 1}, {'b': [1, 2, {'c': '}]'}]}, {'d': None}])
+    assert list(stream.iter_json_records(io.StringIO(text), chunk_size=4)) == [{'a': 1}, {'b': [1, 2, {'c': '}]'}]}, {'d': None}]
+
+def test_students_are_paginated_from_ndjson_and_arrays(tmp_path):
+    for ndjson in [True, False]:
+        path = str(tmp_path / f'students_{ndjson}.json')
+        _export(path, 7, ndjson)
+        _db = db.DB_API(test = True, batch_size = 3, data_path = path)
+
+        pages = [[s.student_id for s in _db.get_students(pagination = page)] for page in range(4)]
+        assert pages == [[0, 1, 2], [3, 4, 5], [6], []]
+        assert [len(frame['student_id'].unique()) for frame in _db.iter_student_frames(chunksize = 4)] == [4, 3]
+
+        # una página fuera de orden vuelve a abrir el archivo
+        assert [s.student_id for s in _db.get_students(pagination = 1)] == [3, 4, 5]
+
+def test_skipped_records_are_not_decoded():
+    class CountingDecoder(json.JSONDecoder):
+        def __init__(self):
+            self.calls = 0
+            super().__init__()
+
+        def raw_decode(self, s, idx = 0):
+            self.calls += 1
+            return super().raw_decode(s, idx)
+
+    decoder = CountingDecoder()
+    text = '\n'.join(json.dumps({'id': i}) for i in range(10))
+    assert list(stream.iter_json_records(io.StringIO(text), decoder = decoder, skip = 7)) == [{'id': 7}, {'id': 8}, {'id': 9}]
+    assert decoder.calls == 3
+
+def test_session_reuses_connections_and_refreshes_token():
+    from tests.stub_server import StubServer
+
+    with StubServer() as server, db.DB_API(url = server.url, username = 'user', key = 'key', pool_size = 2) as api:
+        for _ in range(100):
+            assert api.request('GET', 'students').status_code == 200
+
+        # all requests travel over the keep-alive connection opened by the login
+        assert server.connections == 1
+        assert server.requests == 101
+
+        server.token = 'expired'
+        assert api.request('GET', 'students').status_code == 200
+        assert server.logins == 2
+
+def test_session_retries_transient_errors():
+    from tests.stub_server import StubServer
+
+    with StubServer(failures = 2) as server, db.DB_API(url = server.url, retries = 3, backoff_factor = 0) as api:
+        assert api.request('GET', 'flaky').status_code == 200
+        assert server.requests == 1 + 3
+
+def test_bulk_writer_batches_upserts_and_reports_failures():
+    from pandas import DataFrame
+    from tests.stub_server import StubServer
+
+    def predictions(student):
+        return DataFrame({'period': ['202404'] * 3, 'course_id': ['IDS334'] * 3, 'competency': ['C1', 'C2', 'C3'],
+                          'predicted_grade': [3.5, 3.5, 3.5], 'comp_performance': [90.0, 80.0, 70.0], 'student': [student] * 3})
+
+    with StubServer(rejected = {'s7'}) as server, db.DB_API(url = server.url) as api:
+        with writer.BulkWriter(api, max_rows = 300, max_delay = None) as bulk:
+            for i in range(1000):
+                bulk.add(f's{i}', 'INTEC', predictions(f's{i}'))
+                if i == 5:
+                    # a student added again before the flush replaces its previous predictions
+                    bulk.add('s5', 'INTEC', predictions('s5').assign(predicted_grade = 4.0))
+
+        report = bulk.report
+        assert report.requests == 10 and server.requests == 1 + 10
+        assert report.failed == {'s7': 'rejected'}
+        assert len(report.written) == 999
+        assert len(server.rows) == 999 * 3
+        assert server.rows[('INTEC', 's5', '202404', 'IDS334', 'C1')]['predicted_grade'] == 4.0
+        assert 'student' not in server.rows[('INTEC', 's0', '202404', 'IDS334', 'C1')]
+
+        # replaying the same payload is a no-op for the api
+        api.update_students_data([('s1', 'INTEC', predictions('s1').assign(predicted_grade = 1.0))])
+        api.update_students_data([('s1', 'INTEC', predictions('s1').assign(predicted_grade = 1.0))])
+        assert len(server.idempotency_keys) == 11
+
+def test_bulk_writer_keeps_rows_when_a_write_fails():
+    import time
+    from pandas import DataFrame
+    from models.write_report import WriteReport
+
+    class FlakyDB:
+        def __init__(self, failures):
+            self.failures = failures
+            self.written = []
+
+        def update_students_data(self, batch, max_rows):
+            if self.failures:
+                self.failures -= 1
+                raise ValueError('connection reset')
+            self.written.extend(student_id for student_id, _, _ in batch)
+            return WriteReport(written=[student_id for student_id, _, _ in batch])
+
+    frame = DataFrame({'period': ['202404'], 'predicted_grade': [3.5]})
+
+    # the timer survives the failed flush and writes the rows on its next attempt
+    flaky = FlakyDB(failures = 1)
+    bulk = writer.BulkWriter(flaky, max_delay = 0.05)
+    bulk.add('s1', 'INTEC', frame)
+    deadline = time.monotonic() + 5
+    while not flaky.written and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert flaky.written == ['s1'] and bulk.timer.is_alive()
+    bulk.close()
+
+    # rows that can never be written are reported as failed on close
+    bulk = writer.BulkWriter(FlakyDB(failures = 10), max_delay = None)
+    bulk.add('s2', 'INTEC', frame)
+    report = bulk.close()
+    assert list(report.failed) == ['s2'] and 'connection reset' in report.failed['s2']
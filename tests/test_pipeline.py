@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from data import *
+from src.forecasting.pipeline import ForecastPipeline
+
+_student = db.DB_API(test = True).get_students()[0]
+
+
+class SlowDB:
+    '''
+    DB_API falso con latencia de red fija por llamada.
+    '''
+    def __init__(self, pages: int, batch_size: int = 4, latency: float = 0.05):
+        self.batch_size = batch_size
+        self.pages = pages
+        self.latency = latency
+        self.written = []
+
+    def get_student_count(self, institution_id: str = "INTEC"):
+        return self.pages * self.batch_size
+
+    def get_latest_period(self, institution_id: str = "INTEC"):
+        return '2024-04'
+
+    def get_students(self, institution_id: str = "INTEC", pagination: int = 0):
+        time.sleep(self.latency)
+        return [_student] * self.batch_size if pagination < self.pages else []
+
+    def update_student_data(self, student_id, institution_id, data):
+        time.sleep(self.latency / self.batch_size)
+        self.written.append(student_id)
+
+
+def test_pipeline_overlaps_stages():
+    fake = SlowDB(pages = 6)
+
+    with ThreadPoolExecutor(max_workers = 2) as executor:
+        pipeline = ForecastPipeline(fake, workers = 2, prefetch = 2, executor = executor)
+        report = pipeline.run()
+
+    assert len(fake.written) == 24
+    assert report['students'] == 24 and report['failed'] == 0
+    assert report['stages']['fetch']['batches'] == 6
+    assert report['stages']['forecast']['throughput'] > 0
+
+    # la red y el cómputo se solapan: el total es menor que la suma de las etapas
+    busy = sum(stage['busy'] for stage in report['stages'].values())
+    assert report['elapsed'] < busy
+
+def test_pipeline_uses_the_model_store(tmp_path):
+    from src.time_series import ModelStore
+    from tests.test_comp_predictor import _student as noisy_student
+
+    fake = SlowDB(pages = 1, batch_size = 1, latency = 0)
+    fake.get_students = lambda institution_id = "INTEC", pagination = 0: [noisy_student()] if pagination < fake.pages else []
+    store = ModelStore(str(tmp_path / 'models.db'))
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        report = ForecastPipeline(fake, workers = 1, executor = executor, model_store = store).run()
+
+    assert report['failed'] == 0
+    assert store.refits > 0
@@ -0,0 +1,41 @@
+from data import *
+from src.forecasting.batch import BatchForecaster
+from src.profiling import Metrics, metrics
+
+_db = db.DB_API(test = True)
+
+def test_metrics_record_stages_and_merge_pool_workers():
+    student = _db.get_students()[0]
+
+    metrics.enable()
+    metrics.reset()
+    try:
+        BatchForecaster(workers = 1).run([student])
+        local = metrics.to_dict()
+
+        metrics.reset()
+        BatchForecaster(workers = 2, chunksize = 1).run([student, student])
+        pooled = metrics.to_dict()
+        text = metrics.to_prometheus()
+    finally:
+        metrics.enable(False)
+        metrics.reset()
+
+    for report in (local, pooled):
+        assert report['timers']['weighted_avg']['count'] >= 1
+        assert any(name.startswith('competency_forecast') for name in report['timers'])
+        assert any(name.startswith('selected_model') for name in report['counters'])
+
+    # the workers send their measurements back with each chunk
+    assert pooled['timers']['weighted_avg']['count'] == 2 * local['timers']['weighted_avg']['count']
+    assert '# TYPE sipefca_weighted_avg_seconds histogram' in text
+    assert 'sipefca_weighted_avg_seconds_bucket{le="+Inf"} ' in text
+
+def test_disabled_metrics_record_nothing():
+    registry = Metrics()
+    registry.inc('series', route='cascade')
+    with registry.timer('weighted_avg'):
+        pass
+
+    assert registry.to_dict() == {'counters': {}, 'timers': {}}
+    assert registry.timer('a') is registry.timer('b')
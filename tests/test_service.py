@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from src.service import create_app
+from tests.test_pipeline import SlowDB
+
+
+def test_institution_forecast_runs_as_background_job():
+    fake = SlowDB(pages = 3)
+
+    with ThreadPoolExecutor(max_workers = 2) as executor, TestClient(create_app(fake, workers = 2, executor = executor)) as client:
+        assert client.get('/ai/health').json() == {'status': 'ok'}
+
+        response = client.post('/ai/student_forecasts/INTEC')
+        assert response.status_code == 202
+        job = response.json()
+        assert job['status'] in ('queued', 'running')
+
+        # a second trigger while the job is active returns the same job, also with the original GET route
+        assert client.post('/ai/student_forecasts/INTEC').json()['job_id'] == job['job_id']
+        assert client.get('/ai/student_forecasts/INTEC').json()['job_id'] == job['job_id']
+
+        deadline = time.monotonic() + 60
+        while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+            time.sleep(0.1)
+            job = client.get(f"/ai/jobs/{job['job_id']}").json()
+
+        assert job['status'] == 'done', job['error']
+        assert job['processed'] == job['total'] == 12 and job['progress'] == 1.0
+        assert job['students_per_second'] > 0
+        assert len(fake.written) == 12
+        assert client.get('/ai/jobs/unknown').status_code == 404
+
+def test_forecast_cache_coalesces_concurrent_misses():
+    from src.forecasting.cache import ForecastCache
+
+    cache = ForecastCache(max_entries = 2)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'forecast'
+
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        outcomes = [outcome for _, outcome in executor.map(lambda _: cache.get_or_compute('a', compute), range(8))]
+
+    assert len(calls) == 1
+    assert sorted(outcomes) == ['coalesced'] * 7 + ['miss']
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        assert cache.get_or_compute('a', compute) == ('forecast', 'hit')
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+    cache.get_or_compute('b', lambda: 'b')
+    cache.get_or_compute('c', lambda: 'c')
+    assert cache.stats()['evictions'] == 1 and len(calls) == 1
+
+
+def test_student_forecast_endpoint_serves_from_cache():
+    from data.db import DB_API
+
+    _db = DB_API(test = True)
+    student = _db.get_students()[0]
+    fetches = []
+    fetch = _db.get_student_data
+    _db.get_student_data = lambda *args: fetches.append(args) or fetch(*args)
+
+    with ThreadPoolExecutor(max_workers = 1) as executor, TestClient(create_app(_db, workers = 1, executor = executor, warm = False)) as client:
+        url = f'/ai/student_forecast/INTEC/{student.student_id}'
+        first, second = client.get(url).json(), client.get(url).json()
+
+        assert first['cache'] == 'miss' and second['cache'] == 'hit'
+        assert first['predictions'] == second['predictions'] and len(first['predictions']) > 0
+        # a recent hit is served from the last fingerprint without reading the history again
+        assert len(fetches) == 1
+        assert client.get('/ai/student_forecast/INTEC/unknown').status_code == 404
+
+        metrics = client.get('/ai/metrics/student_forecast').json()
+        assert metrics['cache']['hits'] == 1 and metrics['cache']['misses'] == 1
+        assert metrics['latency']['hit']['count'] == 1 and metrics['latency']['miss']['count'] == 1
+
+        # the original route without the /ai prefix is kept
+        assert client.get(f'/student_forecast/INTEC/{student.student_id}').json()['predictions'] == first['predictions']
+
+def test_student_forecasts_revalidate_the_history():
+    from data.db import DB_API
+    from src.service import StudentForecasts
+
+    _db = DB_API(test = True)
+    student = _db.get_students()[0]
+    fetches = []
+    fetch = _db.get_student_data
+    _db.get_student_data = lambda *args: fetches.append(args) or fetch(*args)
+
+    forecasts = StudentForecasts(_db, revalidate = 0)
+    outcomes = [forecasts.get('INTEC', student.student_id)['cache'] for _ in range(2)]
+    assert outcomes == ['miss', 'hit'] and len(fetches) == 2
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# presupuesto de importación en segundos, medido en ~0.75s (pandas es la mayor parte)
+IMPORT_BUDGET = 1.5
+HEAVY_MODULES = ['statsmodels', 'sklearn', 'scipy', 'fastapi']
+
+_probe = '''
+import json, sys, time
+start = time.perf_counter()
+import main, models, data, src.time_series, src.forecasting
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'loaded': [m for m in %r if m in sys.modules], 'api': 'api' in vars(main)}))
+''' % HEAVY_MODULES
+
+
+def test_imports_are_lazy_and_within_budget():
+    # un proceso nuevo para que las importaciones de otras pruebas no cuenten
+    out = subprocess.run([sys.executable, '-c', _probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    assert result['loaded'] == []
+    assert not result['api']
+    assert result['elapsed'] < IMPORT_BUDGET, result
+
+
+def test_main_serves_the_api_on_access():
+    import main
+    from fastapi import FastAPI
+
+    assert isinstance(main.api, FastAPI)
+    assert main.api is main.api
@@ -0,0 +1,61 @@
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from data import *
+from benchmarks.bench_to_frame import legacy_to_frame
+
+_db = db.DB_API(test = True)
+
+def test_to_frame_matches_row_builder():
+    student = _db.get_students()[0]
+    legacy = legacy_to_frame(student)
+    # the narrow dtypes hold the same values as the row builder
+    assert_frame_equal(student.to_frame().astype(legacy.dtypes.to_dict()), legacy)
+
+
+def test_frame_key_columns_are_categorical():
+    from models.student import cohort_to_frame
+
+    student = _db.get_students()[0]
+    frame = cohort_to_frame([student, student])
+    for column in ('student_id', 'period', 'course_id', 'competency'):
+        assert frame[column].dtype == 'category'
+    assert frame['period'].cat.ordered
+    assert list(frame['period'].cat.categories) == sorted(frame['period'].unique())
+    assert frame['weight'].dtype == 'int16' and frame['numerical_grade'].dtype == 'float32'
+
+    # weights that are not small integers are not truncated
+    student.periods[0].courses[0].competencies[0].weight = 33.3
+    student.periods[0].courses[1].credits = 40000
+    frame = student.to_frame()
+    assert frame['weight'].dtype == 'float32' and frame['weight'].iloc[0] == np.float32(33.3)
+    assert frame['credits'].dtype == 'float32' and frame['credits'].max() == 40000
+
+
+def test_cohort_weighted_avg_matches_per_student():
+    from models.student import Student, cohort_to_frame
+    from src.forecasting.comp_predictor import CompPerformancePredictor
+
+    student = _db.get_students()[0]
+    other = Student(json={'student_id': 'other', 'institution_id': 'INTEC', 'periods': []})
+    other.periods = student.periods[:3]
+
+    cohort = CompPerformancePredictor.get_cohort_weighted_avg(cohort_to_frame([student, other]))
+    single = CompPerformancePredictor(student.to_frame()).pred_data
+
+    by_student = cohort[cohort['student_id'] == student.student_id].drop(columns='student_id').reset_index(drop=True)
+    assert_frame_equal(by_student, single)
+    assert set(cohort['student_id']) == {student.student_id, 'other'}
+
+
+def test_decoder_matches_from_json():
+    import json
+    from models.decoder import loads_students
+    from models.student import Student
+
+    with open(_db.data_path) as f:
+        text = f.read()
+
+    decoded = loads_students(text)[0]
+    assert not hasattr(decoded, '__dict__')
+    assert_frame_equal(decoded.to_frame(), Student(json=json.loads(text)).to_frame())
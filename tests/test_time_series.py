@@ -0,0 +1,113 @@
+import pandas as pd
+
+from src.time_series import FitBudget, FitCache, ModelStore, classify_series, fit_cache, get_ARMA, get_SARIMAX, get_batch_forecast, get_linear_trend, stack_series
+
+def _series(values):
+    return pd.DataFrame({'period': [f'2021{i:02d}' for i in range(len(values))], 'comp_performance': values})
+
+def test_fit_cache_reuses_identical_series():
+    fit_cache.clear()
+    df = _series([70.0, 72.5, 71.0, 74.0, 75.5, 73.0, 76.0, 77.5])
+    train, test = df[df.index <= 6], df[df.index >= 6]
+
+    first = get_ARMA(train, test)
+    second = get_ARMA(train.copy(), test.copy())
+
+    assert fit_cache.hits == 1 and fit_cache.misses == 1
+    pd.testing.assert_frame_equal(first, second)
+
+def test_fit_cache_separates_iteration_limited_fits():
+    fit_cache.clear()
+    df = _series([70.0, 72.5, 71.0, 74.0, 75.5, 73.0, 76.0, 77.5])
+    train, test = df[df.index <= 6], df[df.index >= 6]
+
+    get_ARMA(train, test, budget=FitBudget(maxiter=1))
+    get_ARMA(train, test)
+
+    # the fit cut short by maxiter is not served to the unbudgeted call
+    assert fit_cache.hits == 0 and fit_cache.misses == 2
+    assert len(fit_cache) == 2
+
+def test_stop_event_interrupts_running_fits():
+    import threading
+
+    import pytest
+
+    fit_cache.clear()
+    df = _series([70.0, 72.5, 71.0, 74.0, 75.5, 73.0, 76.0, 77.5])
+    train, test = df[df.index <= 6], df[df.index >= 6]
+    stop = threading.Event()
+    stop.set()
+    budget = FitBudget(stop=stop)
+
+    # the fit stops at its first optimizer iteration and leaves nothing in the cache
+    with pytest.raises(ValueError, match='cancelled'):
+        get_ARMA(train, test, budget=budget)
+    assert budget.events == [('ARMA', 'cancelled')]
+    assert len(fit_cache) == 0
+
+def test_fit_cache_evicts_least_recently_used():
+    cache = FitCache(max_entries=2)
+    frame = pd.DataFrame({'Predictions': [1.0, 2.0]})
+    for key in ['a', 'b', 'a', 'c']:
+        if cache.get(key) is None:
+            cache.put(key, frame)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_model_store_updates_appended_series_and_refits_changed_history():
+    store = ModelStore(max_updates=2)
+    values = [70.0, 72.5, 71.0, 74.0, 75.5, 73.0, 76.0, 77.5, 76.5, 78.0, 77.0, 79.0]
+    df = _series(values)
+    key = ('student', 'C1', 'ARMA')
+
+    for end in [9, 10, 11]:
+        train, test = df[df.index <= end - 1], df[df.index >= end - 1]
+        get_ARMA(train, test, store=store, store_key=key)
+
+    assert store.stats()['refits'] == 1
+    assert store.stats()['updates'] == 2
+
+    changed = _series([60.0] + values[1:])
+    get_ARMA(changed[changed.index <= 10], changed[changed.index >= 10], store=store, store_key=key)
+    assert store.stats()['refits'] == 2
+
+def test_model_store_updates_short_sarimax_series_within_the_burn_in():
+    # every observation of a short series is in the diffuse initialization of the default SARIMAX
+    store = ModelStore(max_updates=20, drift_threshold=0.01)
+    df = _series([70.0 + 0.5 * i + (1.5 if i % 2 else -1.5) + (8.0 if i > 16 else 0.0) for i in range(23)])
+    key = ('student', 'C1', 'SARIMAX')
+
+    for end in [9, 10, 11]:
+        train, test = df[df.index <= end - 1], df[df.index >= end - 1]
+        assert get_SARIMAX(train, test, store=store, store_key=key)['Predictions'].notna().all()
+
+    assert store.stats() == {'updates': 2, 'refits': 1, 'stale': 0, 'drifts': 0}
+
+    # the observations after the burn-in are still checked
+    get_SARIMAX(df[df.index <= 21], df[df.index >= 21], store=store, store_key=key)
+    assert store.stats()['drifts'] == 1
+
+def test_classify_series_routes():
+    assert classify_series([90.0, 90.0, 90.0]) == 'constant'
+    assert classify_series([60.0, 62.0, 64.0, 66.0, 68.0, 70.0, 72.0]) == 'linear'
+    assert classify_series([70.0, 65.0, 80.0]) == 'short'
+    assert classify_series([70.0, 72.5, 71.0, 74.0, 75.5, 73.0, 76.0]) == 'statespace'
+
+def test_linear_trend_extrapolates():
+    df = _series([60.0, 62.0, 64.0, 66.0, 68.0])
+    pred = get_linear_trend(df[df.index <= 3], df[df.index >= 3])
+
+    assert list(pred.index) == [3, 4]
+    assert pred['Predictions'].round(6).tolist() == [68.0, 70.0]
+
+def test_batch_forecast_handles_ragged_series():
+    Y, mask = stack_series([[90.0, 90.0, 90.0], [60.0, 62.0, 64.0, 66.0, 68.0, 70.0], [50.0]])
+    forecast = get_batch_forecast(Y, mask, steps=2)
+
+    assert forecast.forecasts.shape == (3, 2)
+    assert forecast.forecasts[0].tolist() == [90.0, 90.0]
+    assert forecast.forecasts[1].round(6).tolist() == [72.0, 74.0]
+    assert (forecast.lower <= forecast.forecasts).all() and (forecast.forecasts <= forecast.upper).all()